@@ -4,9 +4,8 @@ import json
 import shutil
 from datetime import datetime
 from pathlib import Path
-from multiprocessing import Pool
+from multiprocessing import Pool, Manager
 from functools import partial
-from more_itertools import chunked
 from tqdm import tqdm
 import csv
 
@@ -14,66 +13,121 @@ from src.paths import *
 from src.utils import *
 from src.worker import ImageWorker
 from src.config import *
-from logs.logger import CSVLogger
+from src.scheduler import read_image_sizes, order_largest_first, fill_work_queue
+from src import tracing
+from src.profiling import SamplingProfiler, merge_profiles, format_profile_report, profile_path
+from src.core_budget import plan_threads, intra_op_candidates, pool_slots, init_pool_process, current_plan
+from logs.logger import LogAggregator, QueueLogger
 from model.SR_Script.super_resolution import SA_SuperResolution
 
 
-def process_batch(images, threads, super_resolution_dir, downscaling_dir, model_path, use_gpu):
+# Il PPI non influisce sui tempi: il benchmark usa sempre lo stesso
+BENCHMARK_PPI = 400
+
+LOG_FIELDS = ["timestamp", "device", "processes", "threads", "intra_op_threads", "total_time", "avg_time"]
+
+
+def read_benchmark_log() -> list[dict]:
+    """
+    Rows of the benchmark log; a log written before the intra-op column is rewritten with it.
+    """
+    if not CSV_BENCHMARK_LOG_PATH.exists():
+        with CSV_BENCHMARK_LOG_PATH.open("w", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerow(LOG_FIELDS)
+        return []
+
+    with CSV_BENCHMARK_LOG_PATH.open("r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+        fields = reader.fieldnames or []
+    if "intra_op_threads" not in fields:
+        with CSV_BENCHMARK_LOG_PATH.open("w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=LOG_FIELDS)
+            writer.writeheader()
+            writer.writerows({**row, "intra_op_threads": ""} for row in rows)
+    return rows
+
+
+def process_batch(work_queue, threads, super_resolution_dir, downscaling_dir, model_path, use_gpu, log_queue,
+                  trace_dir=None, trace_tiles=False, profile_dir=None):
+    profiler = None
+    if profile_dir is not None:
+        profiler = SamplingProfiler()
+        profiler.start()
+
+    if trace_dir is not None:
+        tracing.enable(trace_dir, process_name=f"benchmark {os.getpid()}")
+
     gpu_id = 0 if use_gpu else -1
-    model = SA_SuperResolution(
-        models_dir=model_path,
-        model_scale=SUPER_RESOLUTION_PAR,
-        tile_size=128,
-        gpu_id=gpu_id,
-        verbosity=False,
-    )
-    logger = CSVLogger(CSV_LOG_PATH)
-    worker = ImageWorker(logger, super_resolution_dir, downscaling_dir, model)
-
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    plan = current_plan()
+    with tracing.span("load_model", gpu=use_gpu):
+        model = SA_SuperResolution(
+            models_dir=model_path,
+            model_scale=SUPER_RESOLUTION_PAR,
+            tile_size=SR_TILE_SIZE,
+            tile_overlap=SR_TILE_OVERLAP,
+            blank_tile_variance=SR_BLANK_TILE_VARIANCE,
+            tile_memo=SR_TILE_MEMO,
+            model_variant=SR_MODEL_VARIANT,
+            intra_op_threads=plan.intra_op_threads if plan is not None else None,
+            gpu_id=gpu_id,
+            verbosity=False,
+        )
+    if trace_dir is not None:
+        model.span_hook = tracing.span
+        model.trace_tiles = trace_tiles
+    logger = QueueLogger(log_queue)
+    worker = ImageWorker(logger, super_resolution_dir, downscaling_dir, model, BENCHMARK_PPI)
+
+    from concurrent.futures import ThreadPoolExecutor
     with ThreadPoolExecutor(max_workers=threads) as executor:
-        futures = {executor.submit(worker.run, img): img for img in images}
-        for future in tqdm(as_completed(futures), total=len(futures), desc="Elaborazione immagini"):
-            try:
-                future.result()
-            except Exception:
-                pass
+        for _ in range(threads):
+            executor.submit(worker.run_from_queue, work_queue)
     logger.stop()
+    tracing.flush()
+
+    if profiler is not None:
+        profiler.stop()
+        profiler.dump(profile_path(profile_dir, "benchmark"))
 
 
-def benchmark():
+def benchmark(trace=False, trace_tiles=False, profile=False):
     print("🔍 Avvio benchmark per identificare la configurazione ottimale di device, processi e thread...")
 
+    run_id = datetime.now().strftime("benchmark_%Y%m%d_%H%M%S")
+    trace_dir = TRACE_DIR / run_id if trace else None
+    profile_dir = PROFILE_DIR / run_id if profile else None
+    if trace_dir is not None:
+        tracing.enable(trace_dir, process_name="benchmark")
+
     devices = ["CPU", "GPU"]
     cpu_exceeded = False
     completed = set()
 
-    if CSV_BENCHMARK_LOG_PATH.exists():
-        with CSV_BENCHMARK_LOG_PATH.open("r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                device = row["device"]
-                processes = int(row["processes"])
-                threads = int(row["threads"])
-                completed.add((device, processes, threads))
-
-                if device == "CPU":
-                    try:
-                        avg_time = float(row["avg_time"])
-                        if avg_time > 60:
-                            cpu_exceeded = True
-                    except ValueError:
-                        pass  # ignore malformed entries
-    else:
-        with CSV_BENCHMARK_LOG_PATH.open("w", encoding="utf-8", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["timestamp", "device", "processes", "threads", "total_time", "avg_time"])
+    for row in read_benchmark_log():
+        device = row["device"]
+        processes = int(row["processes"])
+        threads = int(row["threads"])
+        # Righe senza thread intra-op: default di ORT, non confrontabili con il piano dei core
+        intra_op_threads = int(row["intra_op_threads"]) if row.get("intra_op_threads") else None
+        completed.add((device, processes, threads, intra_op_threads))
+
+        if device == "CPU":
+            try:
+                avg_time = float(row["avg_time"])
+                if avg_time > 60:
+                    cpu_exceeded = True
+            except ValueError:
+                pass  # ignore malformed entries
 
 
     images = sorted(count_all_images(INPUT_IMAGES_DIR), key=lambda p: p.stat().st_size, reverse=True)[:5]
     if not images:
         print("⚠️ Nessuna immagine trovata per benchmark.")
         return
+    images = order_largest_first(images, read_image_sizes(images))
+    manager = Manager()
+    log_aggregator = LogAggregator(CSV_LOG_BENCHMARK_PATH, log_queue=manager.Queue())
 
     best_config = None
     best_avg_time = float("inf")
@@ -87,61 +141,98 @@ def benchmark():
 
         for processes in [1, 2, 4, 8]:
             for threads in [1, 2, 4, 8]:
-                if (device, processes, threads) in completed:
-                    print(f"⏭️  Combinazione già testata: {device}, {processes} processi, {threads} thread\n")
-                    continue
-
+                # Thread ORT intra-op per processo: tutta la quota di core o metà (su GPU solo la quota)
+                candidates = intra_op_candidates(processes)
+                if use_gpu:
+                    candidates = candidates[:1]
+                for intra_op_threads in candidates:
+                    if (device, processes, threads, intra_op_threads) in completed:
+                        print(f"⏭️  Combinazione già testata: {device}, {processes} processi, {threads} thread, "
+                              f"{intra_op_threads} thread ORT\n")
+                        continue
+
+                    if device == "CPU" and cpu_exceeded:
+                        print(f"🚫 CPU già troppo lenta, skip test con  {processes} processi, {threads} thread su CPU.\n")
+                        continue
+
+                    print(f"⚙️  Testando: {device}, {processes} processi, {threads} thread, "
+                          f"{intra_op_threads} thread ORT\n")
+                    thread_plans = plan_threads(processes, threads, intra_op_threads=intra_op_threads)
+                    for plan in thread_plans:
+                        print(f"   🧵 {plan.describe()}")
+
+                    config_name = f"{device}_p{processes}_t{threads}_i{intra_op_threads}"
+                    super_resolution_dir = BENCHMARK_IMAGES_DIR / f"SR_{config_name}"
+                    downscaling_dir = BENCHMARK_IMAGES_DIR / f"DS_{config_name}"
+                    super_resolution_dir.mkdir(parents=True, exist_ok=True)
+                    downscaling_dir.mkdir(parents=True, exist_ok=True)
+
+                    work_queue = manager.Queue()
+                    fill_work_queue(work_queue, images, consumers=processes * threads)
+
+                    target = partial(
+                        process_batch,
+                        threads=threads,
+                        super_resolution_dir=super_resolution_dir,
+                        downscaling_dir=downscaling_dir,
+                        model_path=SR_SCRIPT_MODEL_DIR,
+                        use_gpu=use_gpu,
+                        log_queue=log_aggregator.queue,
+                        trace_dir=trace_dir,
+                        trace_tiles=trace_tiles,
+                        profile_dir=profile_dir,
+                    )
+
+                    start_time = time.time()
+                    with tracing.span("config", device=device, processes=processes, threads=threads,
+                                      intra_op_threads=intra_op_threads), \
+                            Pool(processes, initializer=init_pool_process,
+                                 initargs=(thread_plans, pool_slots(manager, processes))) as pool:
+                        for _ in tqdm(pool.imap(target, [work_queue] * processes), total=processes, desc=f"Processi {device} ({processes})"):
+                            pass
+                    total_time = time.time() - start_time
+                    avg_time = total_time / len(images)
+
+                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    with CSV_BENCHMARK_LOG_PATH.open("a", encoding="utf-8", newline="") as f:
+                        writer = csv.writer(f)
+                        writer.writerow([timestamp, device, processes, threads, intra_op_threads,
+                                         f"{total_time:.2f}", f"{avg_time:.4f}"])
+
+                    print(f"⏱️  Tempo totale: {total_time:.2f}s | Tempo medio per immagine: {avg_time:.4f}s")
+
+                    # Stop further CPU tests if too slow
+                    if device == "CPU" and avg_time > 60:
+                        cpu_exceeded = True
+                        print("⚠️  Tempo medio per immagine con CPU superiore a 60s. Interrompo test CPU.\n")
+                        break
+
+                    if avg_time < best_avg_time:
+                        best_avg_time = avg_time
+                        best_config = {"device": device, "processes": processes, "threads": threads,
+                                       "intra_op_threads": intra_op_threads}
                 if device == "CPU" and cpu_exceeded:
-                    print("🚫 CPU già troppo lenta, skip test con  {processes} processi, {threads} thread su CPU.\n")
-                    continue
-
-                print(f"⚙️  Testando: {device}, {processes} processi, {threads} thread\n")
-
-                super_resolution_dir = BENCHMARK_IMAGES_DIR / f"SR_{device}_p{processes}_t{threads}"
-                downscaling_dir = BENCHMARK_IMAGES_DIR / f"DS_{device}_p{processes}_t{threads}"
-                super_resolution_dir.mkdir(parents=True, exist_ok=True)
-                downscaling_dir.mkdir(parents=True, exist_ok=True)
-
-                chunks = list(chunked(images, max(1, len(images) // processes)))
-
-                target = partial(
-                    process_batch,
-                    threads=threads,
-                    super_resolution_dir=super_resolution_dir,
-                    downscaling_dir=downscaling_dir,
-                    model_path=SR_SCRIPT_MODEL_DIR,
-                    use_gpu=use_gpu,
-                )
-
-                start_time = time.time()
-                with Pool(processes) as pool:
-                    for _ in tqdm(pool.imap(target, chunks), total=len(chunks), desc=f"Processi {device} ({processes})"):
-                        pass
-                total_time = time.time() - start_time
-                avg_time = total_time / len(images)
-
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                with CSV_BENCHMARK_LOG_PATH.open("a", encoding="utf-8", newline="") as f:
-                    writer = csv.writer(f)
-                    writer.writerow([timestamp, device, processes, threads, f"{total_time:.2f}", f"{avg_time:.4f}"])
-
-                print(f"⏱️  Tempo totale: {total_time:.2f}s | Tempo medio per immagine: {avg_time:.4f}s")
-
-                # Stop further CPU tests if too slow
-                if device == "CPU" and avg_time > 60:
-                    cpu_exceeded = True
-                    print("⚠️  Tempo medio per immagine con CPU superiore a 60s. Interrompo test CPU.\n")
                     break
 
-                if avg_time < best_avg_time:
-                    best_avg_time = avg_time
-                    best_config = {"device": device, "processes": processes, "threads": threads}
-
     if best_config:
         with JSON_BENCHMARK_BEST_CONFIG_PATH.open("w", encoding="utf-8") as f:
             json.dump(best_config, f, indent=4)
         print(f"🏁 Configurazione migliore: {best_config['device']} | "
-              f"{best_config['processes']} processi, {best_config['threads']} thread")
+              f"{best_config['processes']} processi, {best_config['threads']} thread, "
+              f"{best_config['intra_op_threads']} thread ORT intra-op")
+
+    log_aggregator.stop()
+
+    if trace_dir is not None:
+        tracing.flush()
+        trace_path = tracing.merge_traces(trace_dir, TRACE_DIR / f"{run_id}.json")
+        print(f"🧭 Trace del benchmark salvata in {trace_path}")
+
+    if profile_dir is not None and profile_dir.exists():
+        report = format_profile_report(merge_profiles(profile_dir))
+        report_path = PROFILE_DIR / f"{run_id}_report.txt"
+        report_path.write_text(report, encoding="utf-8")
+        print(f"🔬 Report profilo del benchmark salvato in {report_path}\n{report}")
 
     if BENCHMARK_IMAGES_DIR.exists():
         shutil.rmtree(BENCHMARK_IMAGES_DIR)
@@ -149,4 +240,11 @@ def benchmark():
 
 
 if __name__ == "__main__":
-    benchmark()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark multiprocesso e multithread.")
+    parser.add_argument("--trace", action="store_true", help="Registra una trace Chrome/Perfetto di tutti gli stage")
+    parser.add_argument("--trace-tiles", action="store_true", help="Con --trace, registra anche ogni tile")
+    parser.add_argument("--profile", action="store_true", help="Profila ogni worker a campionamento")
+    args = parser.parse_args()
+    benchmark(trace=args.trace, trace_tiles=args.trace_tiles, profile=args.profile)
\ No newline at end of file
@@ -0,0 +1,109 @@
+import sys
+import json
+import argparse
+import subprocess
+
+from src.paths import *
+from src.config import *
+
+# Moduli che non devono essere caricati all'avvio della CLI
+HEAVY_MODULES = [
+    "torch",
+    "onnxruntime",
+    "cv2",
+    "cryptography",
+    "benchmark.benchmark",
+    "benchmark.memory_benchmark",
+]
+
+_CHILD = """
+import sys, json, time, importlib
+t0 = time.perf_counter()
+importlib.import_module({module!r})
+seconds = time.perf_counter() - t0
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _run_child(module: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    args = [sys.executable]
+    if importtime:
+        args += ["-X", "importtime"]
+    args += ["-c", _CHILD.format(module=module, heavy=HEAVY_MODULES)]
+    result = subprocess.run(args, cwd=BASE_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Import di {module} fallito:\n{result.stderr.strip()[-2000:]}")
+    return result
+
+
+def parse_importtime(stderr: str, top: int = 10) -> list[tuple[str, float]]:
+    """
+    Top-level packages by cumulative import time, from the output of `python -X importtime`.
+
+    Returns:
+        list[tuple[str, float]]: (package, seconds), slowest first.
+    """
+    packages: dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        # Solo i moduli importati direttamente (nessuna indentazione dopo lo spazio iniziale)
+        if not cumulative.strip().isdigit() or name.startswith("  "):
+            continue
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(cumulative) / 1e6
+    return sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[:top]
+
+
+def measure_import(module: str = "src.main", runs: int = 5) -> dict:
+    """
+    Measure the import time of `module` in fresh interpreters.
+
+    Args:
+        module (str): Module to import.
+        runs (int): Number of timed imports; the fastest is reported, to filter out cold caches.
+
+    Returns:
+        dict: "seconds" (best of `runs`), "heavy_loaded" (heavy modules pulled in)
+        and "slowest" (top-level packages by cumulative import time).
+    """
+    timings = []
+    loaded = []
+    for _ in range(runs):
+        data = json.loads(_run_child(module).stdout.strip().splitlines()[-1])
+        timings.append(data["seconds"])
+        loaded = data["loaded"]
+
+    breakdown = parse_importtime(_run_child(module, importtime=True).stderr)
+    return {"module": module, "seconds": min(timings), "heavy_loaded": loaded, "slowest": breakdown}
+
+
+def check_import_budget(module: str = "src.main", budget_s: float = IMPORT_TIME_BUDGET_S, runs: int = 5) -> bool:
+    """
+    Print the import-time report and return False if the budget is exceeded or a heavy module is loaded.
+    """
+    report = measure_import(module, runs)
+    print(f"⏱️  import {module}: {report['seconds'] * 1000:.0f} ms (budget {budget_s * 1000:.0f} ms)")
+    for package, seconds in report["slowest"]:
+        print(f"   {package:<32}{seconds * 1000:>8.0f} ms")
+
+    ok = True
+    if report["heavy_loaded"]:
+        print(f"❌ Moduli pesanti caricati all'avvio: {', '.join(report['heavy_loaded'])}")
+        ok = False
+    if report["seconds"] > budget_s:
+        print("❌ Tempo di import oltre il budget")
+        ok = False
+    if ok:
+        print("✅ Avvio entro il budget")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica il tempo di avvio della CLI.")
+    parser.add_argument("--module", default="src.main", help="Modulo da importare")
+    parser.add_argument("--budget", type=float, default=IMPORT_TIME_BUDGET_S, help="Budget in secondi")
+    parser.add_argument("--runs", type=int, default=5, help="Numero di misure")
+    args = parser.parse_args()
+    sys.exit(0 if check_import_budget(args.module, args.budget, args.runs) else 1)
@@ -0,0 +1,229 @@
+import json
+import time
+import argparse
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from multiprocessing import Pool, set_start_method
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from src.paths import *
+from src.config import *
+from src.metrics import STAGES, ImageMetrics, current_rss_mb
+
+SYNTHETIC_DIR = BENCHMARK_DIR / "synthetic"
+DEFAULT_SIZES_MP = [10, 25, 50, 100, 200, 300]
+# Proporzioni A4 (lato lungo / lato corto)
+A4_RATIO = A4_HEIGHT_MM / A4_WIDTH_MM
+
+# Le immagini sintetiche devono poter superare il limite anti decompression-bomb di PIL
+Image.MAX_IMAGE_PIXELS = None
+
+
+def generate_synthetic_tiff(megapixels: int, seed: int = 0, output_dir: Path = SYNTHETIC_DIR) -> Path:
+    """
+    Create (or reuse) a synthetic scan of about `megapixels` MP with A4 proportions.
+
+    The content imitates a document on a uniform scanner bed: light noisy
+    background, a paper rectangle and dark "text" blocks.
+
+    Args:
+        megapixels (int): Target image area in megapixels.
+        seed (int): Random seed, so that the same size always yields the same image.
+        output_dir (Path): Where the scans are kept between runs.
+
+    Returns:
+        Path: Path of the uncompressed RGB TIFF.
+    """
+    path = Path(output_dir) / f"synthetic_{megapixels}mp.tif"
+    if path.exists():
+        return path
+
+    width = int((megapixels * 1e6 / A4_RATIO) ** 0.5)
+    height = int(width * A4_RATIO)
+    rng = np.random.default_rng(seed)
+
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    # Riempimento a strisce per non allocare buffer temporanei a piena risoluzione
+    strip = 1024
+    for y in range(0, height, strip):
+        rows = min(strip, height - y)
+        img[y:y + rows] = rng.integers(200, 215, size=(rows, width, 1), dtype=np.uint8)
+
+    margin_y, margin_x = height // 12, width // 12
+    img[margin_y:-margin_y, margin_x:-margin_x] = 245
+    for _ in range(max(10, megapixels * 4)):
+        h = int(rng.integers(8, 40))
+        w = int(rng.integers(50, width // 3))
+        y = int(rng.integers(margin_y, height - margin_y - h))
+        x = int(rng.integers(margin_x, width - margin_x - w))
+        img[y:y + h, x:x + w] = rng.integers(0, 80, size=3, dtype=np.uint8)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(img).save(path)
+    return path
+
+
+class _RSSSampler:
+    """
+    Polls the current RSS in a background thread and keeps the maximum.
+    """
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = current_rss_mb() or 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb() or 0.0)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb() or 0.0)
+        return False
+
+
+class MemoryMetrics(ImageMetrics):
+    """
+    ImageMetrics that also records peak RSS and the tracemalloc high-water mark per stage.
+
+    RSS covers every allocator (NumPy, PyTorch, ONNX Runtime, PIL); tracemalloc
+    only sees Python and NumPy allocations but is exact and not sampled.
+    """
+
+    def __init__(self, image_path: Path):
+        super().__init__(image_path)
+        self.memory: dict[str, dict] = {}
+
+    def add_timings(self, timings: dict):
+        # I tempi di tiling/inferenza/blending arrivano già dagli stage del modello
+        for key, value in timings.items():
+            if key not in STAGES:
+                self.values[key] = value
+
+    @contextmanager
+    def stage(self, name: str):
+        baseline_rss = current_rss_mb() or 0.0
+        tracemalloc.reset_peak()
+        traced_before, _ = tracemalloc.get_traced_memory()
+        t0 = time.perf_counter()
+        try:
+            with _RSSSampler() as sampler:
+                yield
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+            _, traced_peak = tracemalloc.get_traced_memory()
+            self.memory[name] = {
+                "rss_before_mb": baseline_rss,
+                "rss_peak_mb": sampler.peak,
+                "rss_delta_mb": sampler.peak - baseline_rss,
+                "tracemalloc_peak_mb": (traced_peak - traced_before) / (1024 * 1024),
+            }
+
+
+def measure_image(image_path: Path, use_gpu: bool = False, ppi: int = 400) -> dict:
+    """
+    Run super-resolution and downscaling on one image, recording memory per stage.
+
+    Meant to run in a fresh process, so that the RSS baseline is not inflated by earlier images.
+    """
+    from src.image_processing import apply_super_resolution_single, apply_personalized_downscaling_single
+    from model.SR_Script.super_resolution import SA_SuperResolution
+
+    model = SA_SuperResolution(
+        models_dir=SR_SCRIPT_MODEL_DIR,
+        model_scale=SUPER_RESOLUTION_PAR,
+        tile_size=SR_TILE_SIZE,
+        tile_overlap=SR_TILE_OVERLAP,
+        blank_tile_variance=SR_BLANK_TILE_VARIANCE,
+        tile_memo=SR_TILE_MEMO,
+        model_variant=SR_MODEL_VARIANT,
+        gpu_id=0 if use_gpu else -1,
+        verbosity=False,
+    )
+
+    tracemalloc.start()
+    metrics = MemoryMetrics(image_path)
+    model.span_hook = lambda name, **_: metrics.stage(name)
+
+    out_dir = SYNTHETIC_DIR / "output"
+    sr_path = apply_super_resolution_single(image_path, out_dir / "sr", model, metrics=metrics)
+    final_path = apply_personalized_downscaling_single(sr_path, out_dir / "downscaled", ppi=ppi, metrics=metrics)
+    tracemalloc.stop()
+
+    sr_path.unlink()
+    final_path.unlink()
+
+    with Image.open(image_path) as img:
+        pixels = img.width * img.height
+    return summarize_memory(image_path.name, pixels, metrics)
+
+
+def summarize_memory(image_name: str, pixels: int, metrics: MemoryMetrics) -> dict:
+    """
+    Peak memory of an image over all its stages, in MB and in bytes per input pixel.
+    """
+    # Picco rispetto alla memoria occupata prima del primo stage (modello già caricato)
+    baseline_rss = min(m["rss_before_mb"] for m in metrics.memory.values())
+    peak_rss_delta = max(m["rss_peak_mb"] for m in metrics.memory.values()) - baseline_rss
+    peak_traced = max(m["tracemalloc_peak_mb"] for m in metrics.memory.values())
+    return {
+        "image": image_name,
+        "megapixels": pixels / 1e6,
+        "stages_s": metrics.stages,
+        "memory": metrics.memory,
+        "peak_rss_delta_mb": peak_rss_delta,
+        "peak_tracemalloc_mb": peak_traced,
+        "rss_bytes_per_pixel": peak_rss_delta * 1024 * 1024 / pixels,
+        "tracemalloc_bytes_per_pixel": peak_traced * 1024 * 1024 / pixels,
+    }
+
+
+def memory_benchmark(sizes_mp: list[int] = DEFAULT_SIZES_MP, use_gpu: bool = False) -> list[dict]:
+    """
+    Generate synthetic scans of the given sizes and measure the memory of the SR + downscale path.
+
+    Results are printed and saved to `benchmark/memory_benchmark_<timestamp>.json`.
+    """
+    print(f"🧠 Benchmark memoria su immagini sintetiche: {', '.join(f'{s} MP' for s in sizes_mp)}")
+    set_start_method("spawn", force=True)
+
+    results = []
+    for size in sizes_mp:
+        image_path = generate_synthetic_tiff(size)
+        print(f"\n⚙️  {image_path.name}")
+        # Un processo nuovo per immagine: il picco RSS non dipende dalle misure precedenti
+        with Pool(1) as pool:
+            result = pool.apply(measure_image, (image_path, use_gpu))
+        results.append(result)
+
+        for name, mem in result["memory"].items():
+            print(f"   {name:<12} Δ RSS {mem['rss_delta_mb']:>9.0f} MB | "
+                  f"tracemalloc {mem['tracemalloc_peak_mb']:>9.0f} MB | {result['stages_s'][name]:>8.2f}s")
+        print(f"   📏 {result['rss_bytes_per_pixel']:.1f} byte RSS per pixel di input "
+              f"({result['tracemalloc_bytes_per_pixel']:.1f} tracemalloc)")
+
+    output_path = BENCHMARK_DIR / f"memory_benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with output_path.open("w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4)
+    print(f"\n💾 Risultati salvati in {output_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del picco di memoria su scansioni sintetiche.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES_MP, help="Dimensioni in megapixel")
+    parser.add_argument("--gpu", action="store_true", help="Usa la GPU per l'inferenza")
+    args = parser.parse_args()
+    memory_benchmark(args.sizes, use_gpu=args.gpu)
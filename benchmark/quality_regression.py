@@ -0,0 +1,282 @@
+import json
+import time
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from src.paths import *
+from src.config import *
+from src.utils import count_all_images, is_valid_image_file
+from src.metrics import ImageMetrics
+from src.image_processing import apply_super_resolution_single, apply_personalized_downscaling_single
+from model.SR_Script.super_resolution import SA_SuperResolution
+from model.SR_Script.tiling_image_loader import legacy_tile_plan, plan_tiles
+from model.SR_Script.quality_metrics import max_abs_error, psnr, ssim
+
+QUALITY_DIR = BENCHMARK_DIR / "quality"
+QUALITY_PPI = 400
+
+# Configurazione di riferimento: tiling storico, tutte le ottimizzazioni disattivate
+REFERENCE_CONFIG = {
+    "tile_size": 128,
+    "tile_overlap": None,
+    "blank_tile_variance": None,
+    "tile_memo": False,
+    "model_variant": None,
+    "roi": False,
+    "strip_height": None,
+}
+MODEL_KEYS = ["tile_size", "tile_overlap", "blank_tile_variance", "tile_memo", "model_variant"]
+# Righe per banda nel calcolo di SSIM, per non allocare mappe float64 a piena risoluzione
+SSIM_BAND_ROWS = 1024
+SSIM_WINDOW = 11
+# Semiampiezza in pixel di output della fascia considerata "giunzione" tra tile
+SEAM_HALF_WIDTH = 2
+
+
+def parse_config(pairs: list[str], base: dict = REFERENCE_CONFIG) -> dict:
+    """
+    Build a configuration from `key=value` pairs over `base`; values are parsed as JSON when possible.
+    """
+    config = dict(base)
+    for pair in pairs:
+        key, _, value = pair.partition("=")
+        if key not in REFERENCE_CONFIG:
+            raise ValueError(f"Chiave di configurazione sconosciuta: {key}")
+        try:
+            config[key] = json.loads(value)
+        except json.JSONDecodeError:
+            config[key] = value
+    return config
+
+
+def run_configuration(name: str, config: dict, images: list[Path], use_gpu: bool = False,
+                      ppi: int = QUALITY_PPI) -> dict:
+    """
+    Run super-resolution and downscaling of `images` with one configuration.
+
+    Outputs are kept in `benchmark/quality/<name>/` for the comparison.
+
+    Returns:
+        dict: Output paths per image, per-stage times and throughput in MP/s.
+    """
+    model = SA_SuperResolution(
+        models_dir=SR_SCRIPT_MODEL_DIR,
+        model_scale=SUPER_RESOLUTION_PAR,
+        gpu_id=0 if use_gpu else -1,
+        verbosity=False,
+        **{key: config[key] for key in MODEL_KEYS},
+    )
+
+    out_dir = QUALITY_DIR / name
+    outputs = {}
+    stages: dict[str, float] = {}
+    total_mp = 0.0
+    total_s = 0.0
+    for image_path in images:
+        metrics = ImageMetrics(image_path)
+        t0 = time.perf_counter()
+        sr_path = apply_super_resolution_single(image_path, out_dir / "sr", model, metrics=metrics,
+                                                strip_height=config["strip_height"], roi=config["roi"])
+        final_path = apply_personalized_downscaling_single(sr_path, out_dir / "final", ppi=ppi, metrics=metrics)
+        total_s += time.perf_counter() - t0
+        total_mp += metrics.values.get("megapixels", 0.0)
+        for stage, seconds in metrics.stages.items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+        outputs[image_path.name] = {"sr": sr_path, "final": final_path}
+        print(f"   {name}: {image_path.name} in {time.perf_counter() - t0:.2f}s")
+
+    return {
+        "config": config,
+        "outputs": outputs,
+        "stages_s": stages,
+        "seconds": total_s,
+        "megapixels": total_mp,
+        "mp_per_s": total_mp / total_s if total_s else 0.0,
+    }
+
+
+def banded_ssim(reference: np.ndarray, test: np.ndarray) -> float:
+    """
+    SSIM of large images computed in horizontal bands.
+
+    Bands overlap by the window size minus one, so every valid window is counted
+    exactly once and the result equals the SSIM of the whole image.
+    """
+    height = reference.shape[0]
+    if height <= SSIM_BAND_ROWS:
+        return ssim(reference, test)
+
+    step = SSIM_BAND_ROWS - (SSIM_WINDOW - 1)
+    total = weight = 0.0
+    for y in range(0, height - (SSIM_WINDOW - 1), step):
+        band_ref = reference[y:y + SSIM_BAND_ROWS]
+        rows = band_ref.shape[0] - (SSIM_WINDOW - 1)
+        total += ssim(band_ref, test[y:y + SSIM_BAND_ROWS]) * rows
+        weight += rows
+    return total / weight
+
+
+def seam_lines(config: dict, height: int, width: int, scale: int) -> tuple[list[int], list[int]]:
+    """
+    Output rows and columns where tiles of `config` start or end, inside the image.
+
+    Strip and ROI modes shift the tiles; there the lines follow the whole-image plan and are approximate.
+    """
+    tile = config["tile_size"]
+    padded = (max(height, tile), max(width, tile))
+    if config["tile_overlap"] is None:
+        plan = legacy_tile_plan(*padded, tile)
+    else:
+        plan = plan_tiles(*padded, tile, config["tile_overlap"])
+
+    def lines(starts: list[int], length: int) -> list[int]:
+        edges = {s for s in starts} | {s + tile for s in starts}
+        return sorted(e * scale for e in edges if 0 < e < length)
+
+    return lines(plan.starts_h, height), lines(plan.starts_w, width)
+
+
+def seam_metrics(reference: np.ndarray, test: np.ndarray, rows: list[int], cols: list[int]) -> dict:
+    """
+    Error and discontinuity of `test` along tile boundaries.
+
+    Returns:
+        dict: "seam_error_ratio" (mean abs error against the reference near the seams over
+        the mean abs error elsewhere) and "seam_gradient_ratio" (mean jump across the
+        seams over the mean jump between any two adjacent pixels; about 1 without visible seams).
+    """
+    test = test.astype(np.int16)
+    error = np.abs(test - reference.astype(np.int16)).mean(axis=-1)
+
+    mask = np.zeros(error.shape, dtype=bool)
+    for r in rows:
+        mask[max(0, r - SEAM_HALF_WIDTH):r + SEAM_HALF_WIDTH] = True
+    for c in cols:
+        mask[:, max(0, c - SEAM_HALF_WIDTH):c + SEAM_HALF_WIDTH] = True
+
+    seam_error = error[mask].mean() if mask.any() else 0.0
+    other_error = error[~mask].mean() if (~mask).any() else 0.0
+
+    jump_rows = np.abs(np.diff(test, axis=0)).mean(axis=-1)
+    jump_cols = np.abs(np.diff(test, axis=1)).mean(axis=-1)
+    seam_jumps = [jump_rows[r - 1].mean() for r in rows] + [jump_cols[:, c - 1].mean() for c in cols]
+    mean_jump = (jump_rows.mean() + jump_cols.mean()) / 2
+
+    return {
+        "seam_error_ratio": float(seam_error / other_error) if other_error else None,
+        "seam_gradient_ratio": float(np.mean(seam_jumps) / mean_jump) if seam_jumps and mean_jump else None,
+    }
+
+
+def _load(path: Path) -> np.ndarray:
+    with Image.open(path) as img:
+        return np.asarray(img.convert("RGB"))
+
+
+def compare_outputs(reference_run: dict, candidate_run: dict) -> list[dict]:
+    """
+    Compare the candidate outputs with the reference ones, image by image, after SR and after downscaling.
+    """
+    rows = []
+    for name, ref_paths in reference_run["outputs"].items():
+        cand_paths = candidate_run["outputs"][name]
+        row = {"image": name}
+        for step in ("sr", "final"):
+            ref_img, cand_img = _load(ref_paths[step]), _load(cand_paths[step])
+            if ref_img.shape != cand_img.shape:
+                row[step] = {"error": f"dimensioni diverse: {ref_img.shape} vs {cand_img.shape}"}
+                continue
+            row[step] = {
+                "psnr": psnr(ref_img, cand_img),
+                "ssim": banded_ssim(ref_img, cand_img),
+                "max_abs_error": max_abs_error(ref_img, cand_img),
+            }
+            if step == "sr":
+                height = ref_img.shape[0] // SUPER_RESOLUTION_PAR
+                width = ref_img.shape[1] // SUPER_RESOLUTION_PAR
+                seam_rows, seam_cols = seam_lines(candidate_run["config"], height, width, SUPER_RESOLUTION_PAR)
+                row[step].update(seam_metrics(ref_img, cand_img, seam_rows, seam_cols))
+        rows.append(row)
+    return rows
+
+
+def print_regression_report(report: dict):
+    ref, cand = report["reference"], report["candidate"]
+    print(f"\n📊 Riferimento: {ref['mp_per_s']:.3f} MP/s | candidato: {cand['mp_per_s']:.3f} MP/s "
+          f"(x{cand['mp_per_s'] / ref['mp_per_s'] if ref['mp_per_s'] else 0:.2f})")
+    print(f"   {'immagine':<28}{'step':<7}{'PSNR':>9}{'SSIM':>9}{'max err':>9}{'seam err':>10}{'seam grad':>10}")
+    for row in report["images"]:
+        for step in ("sr", "final"):
+            m = row[step]
+            if "error" in m:
+                print(f"   {row['image']:<28}{step:<7}  ❌ {m['error']}")
+                continue
+            seam_err = f"{m['seam_error_ratio']:.2f}" if m.get("seam_error_ratio") is not None else "-"
+            seam_grad = f"{m['seam_gradient_ratio']:.2f}" if m.get("seam_gradient_ratio") is not None else "-"
+            print(f"   {row['image']:<28}{step:<7}{m['psnr']:>9.2f}{m['ssim']:>9.4f}{m['max_abs_error']:>9.0f}"
+                  f"{seam_err:>10}{seam_grad:>10}")
+
+
+def quality_regression(candidate: dict, reference: dict = REFERENCE_CONFIG, corpus_dir: Path = BENCHMARK_IMAGES_DIR,
+                       limit: int | None = None, use_gpu: bool = False, ppi: int = QUALITY_PPI) -> dict:
+    """
+    Run the reference and candidate configurations on a fixed corpus and compare their outputs.
+
+    Args:
+        candidate (dict): Configuration under test (keys of `REFERENCE_CONFIG`).
+        reference (dict): Baseline configuration.
+        corpus_dir (Path): Folder with the test images, processed in name order.
+        limit (int, optional): Use only the first `limit` images.
+        use_gpu (bool): Run inference on GPU.
+        ppi (int): Target PPI of the downscaling.
+
+    Returns:
+        dict: Throughput of both runs and per-image quality metrics; also saved to
+        `benchmark/quality_regression_<timestamp>.json`.
+    """
+    images = sorted(p for p in count_all_images(corpus_dir) if is_valid_image_file(p)[0])[:limit]
+    if not images:
+        raise FileNotFoundError(f"Nessuna immagine in {corpus_dir}")
+    print(f"🔬 Confronto qualità su {len(images)} immagini di {corpus_dir}")
+
+    reference_run = run_configuration("reference", reference, images, use_gpu, ppi)
+    candidate_run = run_configuration("candidate", candidate, images, use_gpu, ppi)
+
+    report = {
+        "corpus": str(corpus_dir),
+        "ppi": ppi,
+        "reference": {k: v for k, v in reference_run.items() if k != "outputs"},
+        "candidate": {k: v for k, v in candidate_run.items() if k != "outputs"},
+        "images": compare_outputs(reference_run, candidate_run),
+    }
+    print_regression_report(report)
+
+    output_path = BENCHMARK_DIR / f"quality_regression_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with output_path.open("w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4, default=str)
+    print(f"\n💾 Report salvato in {output_path}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronto di qualità e velocità tra due configurazioni della SR.")
+    parser.add_argument("--candidate", nargs="+", default=[], metavar="CHIAVE=VALORE",
+                        help=f"Configurazione da valutare, chiavi: {', '.join(REFERENCE_CONFIG)}")
+    parser.add_argument("--reference", nargs="+", default=[], metavar="CHIAVE=VALORE",
+                        help="Modifiche alla configurazione di riferimento")
+    parser.add_argument("--corpus", type=Path, default=BENCHMARK_IMAGES_DIR, help="Cartella delle immagini di test")
+    parser.add_argument("--limit", type=int, help="Numero massimo di immagini")
+    parser.add_argument("--ppi", type=int, default=QUALITY_PPI, help="PPI del ridimensionamento finale")
+    parser.add_argument("--gpu", action="store_true", help="Usa la GPU per l'inferenza")
+    args = parser.parse_args()
+
+    quality_regression(parse_config(args.candidate), parse_config(args.reference), args.corpus,
+                       args.limit, args.gpu, args.ppi)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import json
+import time
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from src.paths import *
+from src.config import *
+from src.utils import count_all_images
+from model.SR_Script.super_resolution import SA_SuperResolution
+from model.SR_Script.tiling_image_loader import legacy_tile_plan, plan_tiles
+
+# Tiling di riferimento: quello storico della pipeline
+REFERENCE_TILE_SIZE = 128
+
+
+def tiling_report(model: SA_SuperResolution, img_np: np.ndarray, full_size: tuple[int, int],
+                  tile_sizes: list[int], overlaps: list[int]) -> list[dict]:
+    """
+    Compare candidate tilings against the reference tiling on the same image.
+
+    For each (tile size, overlap) it records the number of tiles and the redundant-pixel
+    ratio on the full image, then runs the model on `img_np` and measures the time and
+    the deviation of the output from the reference output.
+
+    Args:
+        model (SA_SuperResolution): Loaded model; its tiling is changed in place.
+        img_np (np.ndarray): RGB image (or crop) actually super-resolved.
+        full_size (tuple[int, int]): (height, width) of the full image, for the waste figures.
+        tile_sizes (list[int]): Candidate tile sizes.
+        overlaps (list[int]): Candidate minimum overlaps in pixels.
+
+    Returns:
+        list[dict]: One row per configuration, the reference first.
+    """
+    model.set_tiling(REFERENCE_TILE_SIZE, None)
+    t0 = time.perf_counter()
+    reference = model.run(img_np)
+    reference_time = time.perf_counter() - t0
+    reference_plan = legacy_tile_plan(*full_size, REFERENCE_TILE_SIZE)
+
+    rows = [{
+        "tile_size": REFERENCE_TILE_SIZE,
+        "overlap": "25% (riferimento)",
+        "tiles_full_image": reference_plan.num_tiles,
+        "redundant_pixel_ratio": reference_plan.redundant_pixel_ratio,
+        "time_s": reference_time,
+        "speedup": 1.0,
+        "max_abs_dev": 0,
+        "mean_abs_dev": 0.0,
+    }]
+
+    for tile_size in tile_sizes:
+        for overlap in overlaps:
+            if overlap >= tile_size:
+                continue
+            plan = plan_tiles(*full_size, tile_size, overlap)
+            model.set_tiling(tile_size, overlap)
+            try:
+                t0 = time.perf_counter()
+                output = model.run(img_np)
+                elapsed = time.perf_counter() - t0
+            except Exception as e:
+                print(f"⚠️ Tile {tile_size}px, overlap {overlap}px non supportato dal modello: {e}")
+                continue
+
+            diff = np.abs(output.astype(np.int16) - reference.astype(np.int16))
+            rows.append({
+                "tile_size": tile_size,
+                "overlap": overlap,
+                "tiles_full_image": plan.num_tiles,
+                "redundant_pixel_ratio": plan.redundant_pixel_ratio,
+                "time_s": elapsed,
+                "speedup": reference_time / elapsed,
+                "max_abs_dev": int(diff.max()),
+                "mean_abs_dev": float(diff.mean()),
+            })
+    return rows
+
+
+def print_tiling_report(rows: list[dict]):
+    print(f"\n{'tile':>6} {'overlap':>18} {'tile img':>9} {'ridondanza':>11} {'tempo':>8} {'speedup':>8} {'max dev':>8} {'mean dev':>9}")
+    for r in rows:
+        print(f"{r['tile_size']:>6} {str(r['overlap']):>18} {r['tiles_full_image']:>9} "
+              f"{r['redundant_pixel_ratio']:>10.1%} {r['time_s']:>7.2f}s {r['speedup']:>7.2f}x "
+              f"{r['max_abs_dev']:>8} {r['mean_abs_dev']:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronto tra pianificazioni dei tile: ridondanza, tempo e qualità.")
+    parser.add_argument("--image", type=Path, help="Immagine di prova (default: la più pesante in input)")
+    parser.add_argument("--crop", type=int, default=1024, help="Lato del ritaglio centrale super-risolto (0 = immagine intera)")
+    parser.add_argument("--tile-sizes", type=int, nargs="+", default=[128, 192, 256, 384, 512])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--gpu", action="store_true", help="Usa la GPU per l'inferenza")
+    args = parser.parse_args()
+
+    image_path = args.image
+    if image_path is None:
+        image_path = max(count_all_images(INPUT_IMAGES_DIR), key=lambda p: p.stat().st_size)
+
+    with Image.open(image_path) as img:
+        img_np = np.array(img.convert("RGB"))
+    full_size = img_np.shape[:2]
+
+    if args.crop:
+        h, w = full_size
+        top, left = max(0, (h - args.crop) // 2), max(0, (w - args.crop) // 2)
+        img_np = img_np[top:top + args.crop, left:left + args.crop]
+
+    model = SA_SuperResolution(
+        models_dir=SR_SCRIPT_MODEL_DIR,
+        model_scale=SUPER_RESOLUTION_PAR,
+        tile_size=REFERENCE_TILE_SIZE,
+        gpu_id=0 if args.gpu else -1,
+        verbosity=True,
+    )
+
+    print(f"🧩 {image_path.name}: {full_size[1]}x{full_size[0]} px, test su {img_np.shape[1]}x{img_np.shape[0]} px")
+    rows = tiling_report(model, img_np, full_size, args.tile_sizes, args.overlaps)
+    print_tiling_report(rows)
+
+    output_path = BENCHMARK_DIR / f"tile_planning_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with output_path.open("w", encoding="utf-8") as f:
+        json.dump({"image": str(image_path), "rows": rows}, f, indent=4)
+    print(f"\n💾 Risultati salvati in {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,15 @@
 import csv
+import json
+import time
+import queue
+import sqlite3
 import threading
 import multiprocessing
 from pathlib import Path
 from datetime import datetime
 
+FIELDNAMES = ["timestamp", "filename", "step", "status", "error", "full_path"]
+
 class CSVLogger:
     def __init__(self, csv_path: str):
         self.csv_path = Path(csv_path)
@@ -94,3 +100,156 @@ class CSVLogger:
                 writer = csv.DictWriter(f, fieldnames=self.fieldnames)
                 writer.writeheader()
                 writer.writerows(rows_sorted)
+
+
+
+def _make_entry(filename, step: str, error: str, full_path="") -> dict:
+    return {
+        "timestamp": datetime.now().isoformat(sep=" ", timespec="seconds"),
+        "filename": str(filename),
+        "step": step,
+        "status": "false",
+        "error": error,
+        "full_path": str(full_path) if full_path else "",
+    }
+
+
+class QueueLogger:
+    """
+    Worker-side logger with the same interface as CSVLogger.
+
+    Entries are only put on a shared queue; the single `LogAggregator` in the
+    main process writes them. No file is opened by the workers.
+    """
+
+    def __init__(self, log_queue):
+        self.queue = log_queue
+
+    def log_failure(self, filename: str, step: str, error: str, full_path: str = ""):
+        self.queue.put(_make_entry(filename, step, error, full_path))
+
+    def log_crash(self, error: str, full_path: Path = None):
+        self.queue.put(_make_entry("CRASH", "CRASH", error, full_path))
+
+    def log(self, filename: str, step: str, success: bool, error: str = "", full_path: str = ""):
+        if not success:
+            self.log_failure(filename, step, error, full_path)
+
+    def stop(self):
+        # Nulla da chiudere: la scrittura è compito dell'aggregatore
+        pass
+
+
+class _CSVBackend:
+    def __init__(self, path: Path):
+        new_file = not path.exists() or path.stat().st_size == 0
+        self.file = open(path, "a", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=FIELDNAMES)
+        if new_file:
+            self.writer.writeheader()
+
+    def write_rows(self, rows: list[dict]):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class _JSONLBackend:
+    def __init__(self, path: Path):
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write_rows(self, rows: list[dict]):
+        self.file.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class _SQLiteBackend:
+    def __init__(self, path: Path):
+        # check_same_thread=False: la connessione è creata nel main thread ma usata dal thread di scrittura
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        columns = ", ".join(f"{name} TEXT" for name in FIELDNAMES)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS log ({columns})")
+        self.conn.commit()
+
+    def write_rows(self, rows: list[dict]):
+        placeholders = ", ".join("?" for _ in FIELDNAMES)
+        self.conn.executemany(
+            f"INSERT INTO log VALUES ({placeholders})",
+            [tuple(row.get(name, "") for name in FIELDNAMES) for row in rows],
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+LOG_BACKENDS = {"csv": _CSVBackend, "jsonl": _JSONLBackend, "sqlite": _SQLiteBackend}
+
+
+def log_path_for_backend(csv_path: Path, backend: str) -> Path:
+    return Path(csv_path).with_suffix({"csv": ".csv", "jsonl": ".jsonl", "sqlite": ".sqlite"}[backend])
+
+
+class LogAggregator:
+    """
+    Single writer for the logs of every worker process.
+
+    Workers put entries on `self.queue` through `QueueLogger`; a thread in the
+    main process collects them and writes them in batches, every `batch_size`
+    rows or every `flush_interval` seconds, to a CSV, JSONL or SQLite file.
+    """
+
+    def __init__(self, path: Path, log_queue=None, backend: str = "csv",
+                 batch_size: int = 200, flush_interval: float = 2.0):
+        if backend not in LOG_BACKENDS:
+            raise ValueError(f"Backend di log non supportato: {backend}")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.queue = log_queue if log_queue is not None else multiprocessing.Queue()
+        self.backend = LOG_BACKENDS[backend](self.path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+
+        self.running = threading.Event()
+        self.running.set()
+        self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def logger(self) -> QueueLogger:
+        return QueueLogger(self.queue)
+
+    def _flush(self, buffer: list[dict]):
+        if buffer:
+            buffer.sort(key=lambda row: (row["timestamp"], row["filename"]))
+            self.backend.write_rows(buffer)
+            self.rows_written += len(buffer)
+            buffer.clear()
+
+    def _writer_loop(self):
+        buffer = []
+        last_flush = time.monotonic()
+        while True:
+            try:
+                buffer.append(self.queue.get(timeout=0.2))
+            except queue.Empty:
+                if not self.running.is_set():
+                    break
+            except (EOFError, OSError):
+                break
+
+            if len(buffer) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                self._flush(buffer)
+                last_flush = time.monotonic()
+        self._flush(buffer)
+
+    def stop(self):
+        # Svuota la coda, scrive l'ultimo batch e chiude il file
+        self.running.clear()
+        self.writer_thread.join()
+        self.backend.close()
@@ -0,0 +1,63 @@
+import numpy as np
+
+
+def psnr(reference: np.ndarray, test: np.ndarray, data_range: float = 255.0) -> float:
+    """
+    Peak signal-to-noise ratio in dB; inf for identical images.
+    """
+    mse = np.mean((reference.astype(np.float64) - test.astype(np.float64)) ** 2)
+    if mse == 0:
+        return float("inf")
+    return float(10 * np.log10(data_range ** 2 / mse))
+
+
+def _gaussian_kernel(size: int = 11, sigma: float = 1.5) -> np.ndarray:
+    x = np.arange(size, dtype=np.float64) - (size - 1) / 2
+    kernel = np.exp(-(x ** 2) / (2 * sigma ** 2))
+    return kernel / kernel.sum()
+
+
+def _filter2d(img: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    """
+    Separable 'valid' filtering of a 2-D array with a 1-D kernel.
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(img, len(kernel), axis=0)
+    img = windows @ kernel
+    windows = np.lib.stride_tricks.sliding_window_view(img, len(kernel), axis=1)
+    return windows @ kernel
+
+
+def ssim(reference: np.ndarray, test: np.ndarray, data_range: float = 255.0) -> float:
+    """
+    Mean structural similarity (Wang et al. 2004: 11x11 Gaussian window, sigma 1.5),
+    averaged over the channels of HxW or HxWxC images.
+    """
+    reference = reference.astype(np.float64)
+    test = test.astype(np.float64)
+    if reference.ndim == 2:
+        reference = reference[..., None]
+        test = test[..., None]
+
+    kernel = _gaussian_kernel()
+    if min(reference.shape[:2]) < len(kernel):
+        raise ValueError(f"Immagine troppo piccola per SSIM: {reference.shape[:2]}")
+
+    c1 = (0.01 * data_range) ** 2
+    c2 = (0.03 * data_range) ** 2
+    values = []
+    for c in range(reference.shape[2]):
+        x, y = reference[..., c], test[..., c]
+        mu_x = _filter2d(x, kernel)
+        mu_y = _filter2d(y, kernel)
+        sigma_xx = _filter2d(x * x, kernel) - mu_x ** 2
+        sigma_yy = _filter2d(y * y, kernel) - mu_y ** 2
+        sigma_xy = _filter2d(x * y, kernel) - mu_x * mu_y
+        ssim_map = ((2 * mu_x * mu_y + c1) * (2 * sigma_xy + c2)) / (
+            (mu_x ** 2 + mu_y ** 2 + c1) * (sigma_xx + sigma_yy + c2)
+        )
+        values.append(ssim_map.mean())
+    return float(np.mean(values))
+
+
+def max_abs_error(reference: np.ndarray, test: np.ndarray) -> float:
+    return float(np.max(np.abs(reference.astype(np.float64) - test.astype(np.float64))))
@@ -0,0 +1,264 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+
+from .quality_metrics import psnr, ssim
+from .super_resolution import decrypt_model_file, encrypt_model_file, model_file_name
+
+# Immagini di esempio per calibrazione e controllo di qualità
+DEFAULT_SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "input")
+DEFAULT_MIN_PSNR = 40.0
+DEFAULT_MIN_SSIM = 0.98
+
+
+def load_sample_tiles(sample_paths: List[str], tile_size: int = 128, count: int = 32,
+                      seed: int = 0) -> List[np.ndarray]:
+    """
+    Cut random tiles from the sample images, in the model input layout (1, 3, H, W) float32 in [0, 1].
+
+    Tiles with almost no content are skipped, so that calibration and accuracy check
+    see text and edges rather than background.
+    """
+    rng = np.random.default_rng(seed)
+    images = []
+    for path in sample_paths:
+        with Image.open(path) as img:
+            array = np.asarray(img.convert("RGB"), dtype=np.float32) / 255.0
+        if min(array.shape[:2]) >= tile_size:
+            images.append(array)
+    if not images:
+        raise ValueError(f"Nessuna immagine di esempio di almeno {tile_size}x{tile_size} px")
+
+    tiles = []
+    attempts = 0
+    while len(tiles) < count and attempts < count * 20:
+        attempts += 1
+        img = images[int(rng.integers(len(images)))]
+        y = int(rng.integers(img.shape[0] - tile_size + 1))
+        x = int(rng.integers(img.shape[1] - tile_size + 1))
+        tile = img[y:y + tile_size, x:x + tile_size]
+        if tile.var() < 1e-4 and attempts < count * 10:
+            continue
+        tiles.append(np.ascontiguousarray(tile.transpose(2, 0, 1)[None]))
+    return tiles
+
+
+def _session(model_bytes: bytes) -> ort.InferenceSession:
+    return ort.InferenceSession(model_bytes, providers=["CPUExecutionProvider"])
+
+
+def simplify_model(model_bytes: bytes) -> bytes:
+    """
+    Simplify the graph with onnxsim if installed, otherwise save ONNX Runtime's offline
+    basic optimizations (constant folding, redundant node elimination).
+    """
+    try:
+        import onnx
+        from onnxsim import simplify
+    except ImportError:
+        with tempfile.TemporaryDirectory() as tmp:
+            output_path = os.path.join(tmp, "optimized.onnx")
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+            options.optimized_model_filepath = output_path
+            ort.InferenceSession(model_bytes, options, providers=["CPUExecutionProvider"])
+            with open(output_path, "rb") as f:
+                return f.read()
+
+    simplified, ok = simplify(onnx.load_from_string(model_bytes))
+    if not ok:
+        raise RuntimeError("onnxsim: il modello semplificato non supera la verifica")
+    return simplified.SerializeToString()
+
+
+def quantize_model_bytes(model_bytes: bytes, mode: str,
+                         calibration_tiles: Optional[List[np.ndarray]] = None) -> bytes:
+    """
+    Quantize the ONNX graph to INT8.
+
+    Args:
+        model_bytes (bytes): Decrypted FP32 graph.
+        mode (str): "dynamic" (weights only, activations quantized at run time) or
+            "static" (QDQ, activation ranges calibrated on `calibration_tiles`).
+        calibration_tiles (list, optional): Input tiles, required for "static".
+
+    Returns:
+        bytes: Quantized graph.
+    """
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "fp32.onnx")
+        output_path = os.path.join(tmp, "int8.onnx")
+        with open(input_path, "wb") as f:
+            f.write(model_bytes)
+
+        if mode == "dynamic":
+            quantize_dynamic(input_path, output_path, weight_type=QuantType.QInt8)
+        elif mode == "static":
+            if not calibration_tiles:
+                raise ValueError("La quantizzazione statica richiede tile di calibrazione")
+            input_name = _session(model_bytes).get_inputs()[0].name
+
+            class _TileReader(CalibrationDataReader):
+                def __init__(self):
+                    self.tiles = iter(calibration_tiles)
+
+                def get_next(self):
+                    tile = next(self.tiles, None)
+                    return None if tile is None else {input_name: tile}
+
+            quantize_static(
+                input_path, output_path, _TileReader(),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=True,
+            )
+        else:
+            raise ValueError(f"Modalità di quantizzazione sconosciuta: {mode}")
+
+        with open(output_path, "rb") as f:
+            return f.read()
+
+
+def _to_uint8(output: np.ndarray) -> np.ndarray:
+    return np.clip(output[0].transpose(1, 2, 0) * 255, 0, 255).round().astype(np.uint8)
+
+
+def evaluate_variant(reference_bytes: bytes, candidate_bytes: bytes, tiles: List[np.ndarray]) -> Dict[str, Any]:
+    """
+    Compare the candidate graph with the FP32 reference on the given tiles.
+
+    Outputs are compared as 8-bit images, as they are written by the pipeline.
+
+    Returns:
+        dict: Minimum and mean PSNR/SSIM, seconds per tile of both models and speedup.
+    """
+    reference = _session(reference_bytes)
+    candidate = _session(candidate_bytes)
+    input_name = reference.get_inputs()[0].name
+
+    psnr_values, ssim_values = [], []
+    reference_time = candidate_time = 0.0
+    for tile in tiles:
+        t0 = time.perf_counter()
+        expected = reference.run(None, {input_name: tile})[0]
+        t1 = time.perf_counter()
+        actual = candidate.run(None, {input_name: tile})[0]
+        t2 = time.perf_counter()
+        reference_time += t1 - t0
+        candidate_time += t2 - t1
+
+        expected, actual = _to_uint8(expected), _to_uint8(actual)
+        psnr_values.append(psnr(expected, actual))
+        ssim_values.append(ssim(expected, actual))
+
+    return {
+        "tiles": len(tiles),
+        "psnr_min": min(psnr_values),
+        "psnr_mean": float(np.mean(psnr_values)),
+        "ssim_min": min(ssim_values),
+        "ssim_mean": float(np.mean(ssim_values)),
+        "reference_s_per_tile": reference_time / len(tiles),
+        "candidate_s_per_tile": candidate_time / len(tiles),
+        "speedup": reference_time / candidate_time if candidate_time else 0.0,
+    }
+
+
+def build_variant(models_dir: str, scale: int, mode: str = "dynamic", simplify: bool = False,
+                  variant: Optional[str] = None, sample_paths: Optional[List[str]] = None,
+                  tile_size: int = 128, num_tiles: int = 32,
+                  min_psnr: float = DEFAULT_MIN_PSNR, min_ssim: float = DEFAULT_MIN_SSIM) -> Dict[str, Any]:
+    """
+    Produce an optimized variant of `edsr_{scale}x.ven` and save it encrypted next to it,
+    only if it passes the accuracy gate against the FP32 model.
+
+    Args:
+        models_dir (str): Directory with the encrypted models.
+        scale (int): Super-resolution factor.
+        mode (str): "dynamic", "static" or "none" (simplification only).
+        simplify (bool): Simplify the graph before quantizing.
+        variant (str, optional): Variant name; default "int8" / "int8static" / "opt".
+        sample_paths (list, optional): Images for calibration and accuracy check.
+        tile_size (int): Side of the sample tiles.
+        num_tiles (int): Number of sample tiles.
+        min_psnr (float): Minimum PSNR (dB) on every tile.
+        min_ssim (float): Minimum SSIM on every tile.
+
+    Returns:
+        dict: Accuracy report, with "accepted" and the output "path" if accepted.
+    """
+    variant = variant or {"dynamic": "int8", "static": "int8static", "none": "opt"}[mode]
+    if sample_paths is None:
+        sample_paths = [
+            os.path.join(DEFAULT_SAMPLES_DIR, name) for name in sorted(os.listdir(DEFAULT_SAMPLES_DIR))
+            if name.lower().endswith((".png", ".jpg", ".jpeg", ".tif", ".tiff"))
+        ]
+
+    reference_bytes = decrypt_model_file(os.path.join(models_dir, model_file_name(scale)))
+    # Tile diversi per calibrazione e verifica, per non valutare sugli stessi dati
+    calibration_tiles = load_sample_tiles(sample_paths, tile_size, num_tiles, seed=0)
+    check_tiles = load_sample_tiles(sample_paths, tile_size, num_tiles, seed=1)
+
+    candidate_bytes = simplify_model(reference_bytes) if simplify else reference_bytes
+    if mode != "none":
+        candidate_bytes = quantize_model_bytes(candidate_bytes, mode, calibration_tiles)
+
+    report = evaluate_variant(reference_bytes, candidate_bytes, check_tiles)
+    report.update({"variant": variant, "mode": mode, "simplify": simplify,
+                   "min_psnr": min_psnr, "min_ssim": min_ssim})
+    report["accepted"] = report["psnr_min"] >= min_psnr and report["ssim_min"] >= min_ssim
+
+    if report["accepted"]:
+        output_path = os.path.join(models_dir, model_file_name(scale, variant))
+        encrypt_model_file(candidate_bytes, output_path)
+        report["path"] = output_path
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Crea una variante quantizzata/ottimizzata del modello EDSR con verifica di accuratezza."
+    )
+    parser.add_argument("-m", "--models-dir", required=True, help="Cartella con i modelli .ven")
+    parser.add_argument("-s", "--scale", type=int, default=2, help="Fattore di scala del modello")
+    parser.add_argument("--mode", choices=["dynamic", "static", "none"], default="dynamic",
+                        help="Quantizzazione INT8 dinamica, statica (calibrata) o nessuna")
+    parser.add_argument("--simplify", action="store_true", help="Semplifica il grafo prima della quantizzazione")
+    parser.add_argument("--variant", help="Nome della variante (file edsr_<scala>x_<variante>.ven)")
+    parser.add_argument("--samples", nargs="+", help="Immagini di esempio per calibrazione e verifica")
+    parser.add_argument("--tile-size", type=int, default=128)
+    parser.add_argument("--tiles", type=int, default=32, help="Numero di tile di esempio")
+    parser.add_argument("--min-psnr", type=float, default=DEFAULT_MIN_PSNR)
+    parser.add_argument("--min-ssim", type=float, default=DEFAULT_MIN_SSIM)
+    args = parser.parse_args()
+
+    report = build_variant(
+        args.models_dir, args.scale, args.mode, args.simplify, args.variant, args.samples,
+        args.tile_size, args.tiles, args.min_psnr, args.min_ssim,
+    )
+    print(f"PSNR min/medio: {report['psnr_min']:.2f} / {report['psnr_mean']:.2f} dB "
+          f"(soglia {report['min_psnr']:.2f})")
+    print(f"SSIM min/medio: {report['ssim_min']:.4f} / {report['ssim_mean']:.4f} "
+          f"(soglia {report['min_ssim']:.4f})")
+    print(f"Tempo per tile: {report['reference_s_per_tile'] * 1000:.1f} ms FP32, "
+          f"{report['candidate_s_per_tile'] * 1000:.1f} ms {report['variant']} (x{report['speedup']:.2f})")
+
+    if not report["accepted"]:
+        print(f"❌ Variante {report['variant']} rifiutata: accuratezza sotto soglia, nessun file scritto")
+        sys.exit(1)
+    print(f"✅ Variante salvata in {report['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 import os
-from typing import Any, Dict, List, Tuple, Optional  
+import time
+import hashlib
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, List, Tuple, Optional
 import threading
 
 import torch  # NOQA
+import torch.nn.functional as F
 import numpy as np
 import onnxruntime as ort
 
@@ -10,6 +14,34 @@ from cryptography.fernet import Fernet
 
 from .tiling_image_loader import SA_Tiling_ImageLoader
 
+# Chiave Fernet dei modelli .ven
+MODEL_KEY = b"LtBDDJTE04l7Kef4PiYTa21RX4svq1vcGRbBkW_ZSwc="
+
+
+def model_file_name(scale: int, variant: Optional[str] = None) -> str:
+    """
+    File name of the encrypted model: `edsr_2x.ven`, or `edsr_2x_<variant>.ven` for a variant.
+    """
+    suffix = f"_{variant}" if variant else ""
+    return f"edsr_{scale}x{suffix}.ven"
+
+
+def decrypt_model_file(path: str, key: Optional[bytes] = None) -> bytes:
+    """
+    Read a `.ven` file and return the decrypted ONNX graph bytes.
+    """
+    with open(path, "rb") as encrypted_file:
+        encrypted_model = encrypted_file.read()
+    return Fernet(key or MODEL_KEY).decrypt(encrypted_model)
+
+
+def encrypt_model_file(model_bytes: bytes, path: str, key: Optional[bytes] = None) -> None:
+    """
+    Encrypt ONNX graph bytes and write them to `path` in the `.ven` format.
+    """
+    with open(path, "wb") as encrypted_file:
+        encrypted_file.write(Fernet(key or MODEL_KEY).encrypt(model_bytes))
+
 
 class SA_SuperResolution:
     """
@@ -26,6 +58,11 @@ class SA_SuperResolution:
         tile_size: int = 128,
         gpu_id: int = 0,
         verbosity: bool = False,
+        tile_overlap: Optional[int] = None,
+        blank_tile_variance: Optional[float] = None,
+        tile_memo: bool = False,
+        model_variant: Optional[str] = None,
+        intra_op_threads: Optional[int] = None,
     ) -> None:
         """
         Initialize with model directory, scale, and device info.
@@ -36,19 +73,62 @@ class SA_SuperResolution:
             tile_size (int): Tile size for image loader (default 128).
             gpu_id (int): GPU index (>=0 for GPU, -1 for CPU).
             verbosity (bool): Print debug info.
+            tile_overlap (int, optional): Minimum tile overlap in pixels with evenly packed
+                tiles; None keeps the reference tiling (25% overlap).
+            blank_tile_variance (float, optional): Tiles whose pixel variance (values in [0, 1])
+                is below this threshold in every channel are upscaled with bicubic interpolation instead of
+                the model. None sends every tile to the model.
+            tile_memo (bool): Reuse the output of byte-identical tiles within an image.
+            model_variant (str, optional): Load `edsr_{scale}x_{variant}.ven` (e.g. "int8",
+                produced by `quantize_model.py`) instead of the FP32 model.
+            intra_op_threads (int, optional): ONNX Runtime intra-op threads of the session;
+                None lets ORT use one per core of the machine.
         """
         self.scale: int = model_scale
         self.tile_size: int = tile_size
+        self.tile_overlap: Optional[int] = tile_overlap
+        self.blank_tile_variance: Optional[float] = blank_tile_variance
+        self.tile_memo: bool = tile_memo
+        self.model_variant: Optional[str] = model_variant
+        self.intra_op_threads: Optional[int] = intra_op_threads
         self.encrypted_model_path: str = self._model_definition(models_dir)
 
         # Thread lock to make ONNX Runtime calls thread-safe
         self.lock = threading.Lock()
 
         self.network, self.input_name = self._decrypt_model(gpu_id, verbosity)
-        self.dataloader: SA_Tiling_ImageLoader = SA_Tiling_ImageLoader(self.tile_size)
+        self.dataloader: SA_Tiling_ImageLoader = SA_Tiling_ImageLoader(self.tile_size, self.tile_overlap)
+
+        # Optional tracing hook: callable(name, **args) -> context manager.
+        # If trace_tiles is set, every tile also gets its own lock-wait/inference span.
+        self.span_hook: Optional[Callable[..., ContextManager]] = None
+        self.trace_tiles: bool = False
+
+    def set_tiling(self, tile_size: int, tile_overlap: Optional[int] = None) -> None:
+        """
+        Change tile size and overlap without reloading the ONNX session.
+        """
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.dataloader = SA_Tiling_ImageLoader(tile_size, tile_overlap)
+
+    def _span(self, name: str, **args) -> ContextManager:
+        if self.span_hook is None:
+            return nullcontext()
+        return self.span_hook(name, **args)
 
     def _model_definition(self, models_dir: str) -> str:
-        return os.path.join(models_dir, f"edsr_{self.scale}x.ven")
+        return os.path.join(models_dir, model_file_name(self.scale, self.model_variant))
+
+    def _session_options(self) -> ort.SessionOptions:
+        options = ort.SessionOptions()
+        if self.intra_op_threads is not None:
+            options.intra_op_num_threads = self.intra_op_threads
+            options.inter_op_num_threads = 1
+            # Inferences are serialized by self.lock: spinning threads would only
+            # take cores from the decode/resize threads between two tiles.
+            options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+        return options
 
     def _decrypt_model(
         self,
@@ -63,16 +143,7 @@ class SA_SuperResolution:
             model (ort.InferenceSession): ONNX runtime model.
             input_name (str): Name of the input tensor.
         """
-        with open(self.encrypted_model_path, "rb") as encrypted_file:
-            encrypted_model = encrypted_file.read()
-
-        if decryption_key is None:
-            key = b"LtBDDJTE04l7Kef4PiYTa21RX4svq1vcGRbBkW_ZSwc="
-        else:
-            key = decryption_key
-
-        fernet = Fernet(key)
-        decrypted_model = fernet.decrypt(encrypted_model)
+        decrypted_model = decrypt_model_file(self.encrypted_model_path, decryption_key)
 
         # Default to CPU provider
         providers: List[Any] = ["CPUExecutionProvider"]
@@ -90,8 +161,9 @@ class SA_SuperResolution:
                 }
             ))
 
+        options = self._session_options()
         try:
-            model = ort.InferenceSession(decrypted_model, providers=providers)
+            model = ort.InferenceSession(decrypted_model, sess_options=options, providers=providers)
             input_name = model.get_inputs()[0].name
             model_name = os.path.basename(self.encrypted_model_path)
 
@@ -111,7 +183,7 @@ class SA_SuperResolution:
             print("➡️ Falling back to CPUExecutionProvider")
 
             # Fallback to CPU only
-            model = ort.InferenceSession(decrypted_model, providers=["CPUExecutionProvider"])
+            model = ort.InferenceSession(decrypted_model, sess_options=options, providers=["CPUExecutionProvider"])
             input_name = model.get_inputs()[0].name
             return model, input_name
 
@@ -126,38 +198,173 @@ class SA_SuperResolution:
         Returns:
             torch.Tensor: Output tensor after super-resolution.
         """
+        if self.trace_tiles and self.span_hook is not None:
+            with self._span("tile_lock_wait"):
+                self.lock.acquire()
+            try:
+                with self._span("tile_inference"):
+                    output_tile = self.network.run(None, {self.input_name: tile.numpy()})
+            finally:
+                self.lock.release()
+            return torch.from_numpy(output_tile[0])
+
         with self.lock:  # serialize inference calls for thread safety
             input_tile = {self.input_name: tile.numpy()}
             output_tile = self.network.run(None, input_tile)
         output_tensor = torch.from_numpy(output_tile[0])
         return output_tensor
 
-    def run(self, img_np: np.ndarray) -> np.ndarray:
+    def _upsample_bicubic(self, tile: torch.Tensor) -> torch.Tensor:
+        upscaled = F.interpolate(tile, scale_factor=self.scale, mode="bicubic", align_corners=False)
+        return upscaled.clamp_(0.0, 1.0)
+
+    def _infer_tiles(self, img_tiles: List[torch.Tensor]) -> Tuple[List[torch.Tensor], Dict[str, Any]]:
+        """
+        Upscale every tile: blank tiles by bicubic interpolation, repeated tiles from the
+        per-image memo, the others with the model.
+
+        Returns:
+            Tuple[List[torch.Tensor], Dict[str, Any]]: Output tiles and tile counters, with an
+            estimate of the inference time saved.
+        """
+        if self.blank_tile_variance is None and not self.tile_memo:
+            return [self._inference(tile) for tile in img_tiles], {"tiles_inferred": len(img_tiles)}
+
+        memo: Dict[bytes, torch.Tensor] = {}
+        outputs: List[torch.Tensor] = []
+        inferred = skipped = memo_hits = 0
+        inference_time = 0.0
+
+        for tile in img_tiles:
+            key = None
+            if self.tile_memo:
+                key = hashlib.blake2b(tile.numpy().tobytes(), digest_size=16).digest()
+                if key in memo:
+                    outputs.append(memo[key])
+                    memo_hits += 1
+                    continue
+
+            # Varianza per canale: un tile uniforme ma colorato (carta, piano dello scanner) resta vuoto
+            if self.blank_tile_variance is not None and float(tile.var(dim=(2, 3)).max()) < self.blank_tile_variance:
+                output = self._upsample_bicubic(tile)
+                skipped += 1
+            else:
+                t0 = time.perf_counter()
+                output = self._inference(tile)
+                inference_time += time.perf_counter() - t0
+                inferred += 1
+
+            if key is not None:
+                memo[key] = output
+            outputs.append(output)
+
+        avoided = skipped + memo_hits
+        return outputs, {
+            "tiles_inferred": inferred,
+            "tiles_skipped_blank": skipped,
+            "tiles_memo_hits": memo_hits,
+            "skipped_fraction": avoided / len(img_tiles) if img_tiles else 0.0,
+            "inference_time_saved_s": avoided * inference_time / inferred if inferred else 0.0,
+        }
+
+    def run(self, img_np: np.ndarray, timings: Optional[Dict[str, Any]] = None) -> np.ndarray:
         """
         Run the super-resolution model on the full image.
 
         Args:
             img_np (np.ndarray): Input image RGB as numpy array.
+            timings (dict, optional): If given, filled with the seconds spent in
+                "tiling", "inference" and "blending", the number of "tiles", the
+                "redundant_pixel_ratio" of the tiling and the tile counters of `_infer_tiles`.
 
         Returns:
             np.ndarray: Super-resolved output image as numpy uint8 array.
         """
-        img_tiles, original_shape, padded_shape = self.dataloader.load_image(img_np)
-
-        output_tiles = [self._inference(tile) for tile in img_tiles]
-
-        output_img = self.dataloader.reconstruct_image_from_tiles_with_blending(
-            output_tiles,
-            padded_shape,
-            self.scale,
-        )
+        t0 = time.perf_counter()
+        with self._span("tiling"):
+            img_tiles, original_shape, padded_shape = self.dataloader.load_image(img_np)
+        t1 = time.perf_counter()
+
+        with self._span("inference", tiles=len(img_tiles)):
+            output_tiles, tile_stats = self._infer_tiles(img_tiles)
+        t2 = time.perf_counter()
+
+        plan = self.dataloader.tile_plan(*padded_shape)
+        with self._span("blending"):
+            if self.tile_overlap is None:
+                output_img = self.dataloader.reconstruct_image_from_tiles_with_blending(
+                    output_tiles,
+                    padded_shape,
+                    self.scale,
+                )
+            else:
+                output_img = self.dataloader.reconstruct_image_from_plan(output_tiles, plan, self.scale)
+
+            # Crop to original size * scale
+            output_img = output_img[
+                :, : original_shape[0] * self.scale, : original_shape[1] * self.scale
+            ]
+
+            output_img = output_img.squeeze().cpu().numpy().transpose(1, 2, 0)
+            out_img = np.clip(output_img * 255, 0, 255).astype(np.uint8)
+
+        if timings is not None:
+            timings["tiling"] = t1 - t0
+            timings["inference"] = t2 - t1
+            timings["blending"] = time.perf_counter() - t2
+            timings["tiles"] = len(img_tiles)
+            timings["redundant_pixel_ratio"] = plan.redundant_pixel_ratio
+            timings.update(tile_stats)
+
+        return out_img
+
+    def run_in_strips(
+        self,
+        img_np: np.ndarray,
+        strip_height: int,
+        margin: Optional[int] = None,
+        timings: Optional[Dict[str, Any]] = None,
+    ) -> np.ndarray:
+        """
+        Run the model on horizontal strips, so that the float32 buffers only cover one strip.
 
-        # Crop to original size * scale
-        output_img = output_img[
-            :, : original_shape[0] * self.scale, : original_shape[1] * self.scale
-        ]
+        Each strip is processed with `margin` extra rows above and below, which are
+        then discarded, so the seams between strips fall inside processed context.
 
-        output_img = output_img.squeeze().cpu().numpy().transpose(1, 2, 0)
-        out_img = np.clip(output_img * 255, 0, 255).astype(np.uint8)
+        Args:
+            img_np (np.ndarray): Input image RGB as numpy array.
+            strip_height (int): Rows of the input kept from each strip.
+            margin (int, optional): Context rows above and below each strip (default tile_size).
+            timings (dict, optional): Filled as in `run`, summed over the strips.
 
-        return out_img
\ No newline at end of file
+        Returns:
+            np.ndarray: Super-resolved output image as numpy uint8 array.
+        """
+        margin = self.tile_size if margin is None else margin
+        height, width = img_np.shape[:2]
+        out_img = np.empty((height * self.scale, width * self.scale, 3), dtype=np.uint8)
+
+        for y0 in range(0, height, strip_height):
+            y1 = min(height, y0 + strip_height)
+            top = max(0, y0 - margin)
+            bottom = min(height, y1 + margin)
+
+            strip_timings: Optional[Dict[str, Any]] = {} if timings is not None else None
+            with self._span("strip", rows=y1 - y0):
+                strip = self.run(img_np[top:bottom], timings=strip_timings)
+            out_img[y0 * self.scale : y1 * self.scale] = strip[
+                (y0 - top) * self.scale : (y1 - top) * self.scale
+            ]
+
+            if timings is not None:
+                for key, value in strip_timings.items():
+                    timings[key] = timings.get(key, 0) + value
+
+        if timings is not None:
+            # Include anche i margini di contesto ricalcolati tra una striscia e l'altra
+            timings["redundant_pixel_ratio"] = timings["tiles"] * self.tile_size ** 2 / (height * width) - 1.0
+            if "skipped_fraction" in timings:
+                avoided = timings["tiles_skipped_blank"] + timings["tiles_memo_hits"]
+                timings["skipped_fraction"] = avoided / timings["tiles"] if timings["tiles"] else 0.0
+
+        return out_img
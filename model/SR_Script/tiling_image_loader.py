@@ -1,13 +1,92 @@
 from __future__ import annotations
 
 import os
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import numpy as np
 import torch
 from PIL import Image
 
 
+class TilePlan:
+    """
+    Top-left corners of the tiles covering an image, in input pixels.
+    """
+
+    def __init__(self, height: int, width: int, tile_size: int, overlap: int,
+                 starts_h: List[int], starts_w: List[int]):
+        self.height = height
+        self.width = width
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.starts_h = starts_h
+        self.starts_w = starts_w
+
+    @property
+    def num_tiles(self) -> int:
+        return len(self.starts_h) * len(self.starts_w)
+
+    def origins(self) -> List[Tuple[int, int]]:
+        """Tile origins in row-major order, the order of the tile list."""
+        return [(h, w) for h in self.starts_h for w in self.starts_w]
+
+    @property
+    def redundant_pixel_ratio(self) -> float:
+        """
+        Extra pixels sent to the model because of overlaps, as a fraction of the image area
+        (0.0 means every pixel is inferred exactly once).
+        """
+        return self.num_tiles * self.tile_size ** 2 / (self.height * self.width) - 1.0
+
+
+def _even_starts(length: int, tile_size: int, overlap: int) -> List[int]:
+    # Numero minimo di tile con sovrapposizione >= overlap, distribuiti in modo uniforme:
+    # l'ultima riga/colonna non viene spostata indietro con una sovrapposizione maggiore.
+    # Origini arrotondate per eccesso in aritmetica intera, senza errori di virgola mobile: due
+    # origini consecutive distano al massimo ceil((length - tile_size) / (n - 1)) <= tile_size - overlap,
+    # quindi la sovrapposizione non scende mai sotto `overlap`.
+    if length <= tile_size:
+        return [0]
+    n = -(-(length - overlap) // (tile_size - overlap))
+    return [-(-i * (length - tile_size) // (n - 1)) for i in range(n)]
+
+
+def _legacy_starts(length: int, tile_size: int, overlap: int) -> List[int]:
+    stride = tile_size - overlap
+    n = int(np.ceil((length - overlap) / stride))
+    starts = [i * stride for i in range(n)]
+    starts[-1] = max(length - tile_size, 0)
+    return starts
+
+
+def plan_tiles(height: int, width: int, tile_size: int, overlap: int) -> TilePlan:
+    """
+    Plan tiles with a minimum overlap in pixels, independent of the tile size.
+
+    Args:
+        height (int): Image height (already padded to at least tile_size).
+        width (int): Image width (already padded to at least tile_size).
+        tile_size (int): Side of the square tiles.
+        overlap (int): Minimum overlap between neighbouring tiles, in input pixels.
+
+    Returns:
+        TilePlan: Evenly spaced tile origins.
+    """
+    if not 0 <= overlap < tile_size:
+        raise ValueError(f"Overlap must be in [0, tile_size), got {overlap}")
+    return TilePlan(height, width, tile_size, overlap,
+                    _even_starts(height, tile_size, overlap), _even_starts(width, tile_size, overlap))
+
+
+def legacy_tile_plan(height: int, width: int, tile_size: int, overlap_fraction: float = 0.25) -> TilePlan:
+    """
+    Plan reproducing `split_to_tiles_with_overlap`: fixed stride, last row/column shifted back.
+    """
+    overlap = int(tile_size * overlap_fraction)
+    return TilePlan(height, width, tile_size, overlap,
+                    _legacy_starts(height, tile_size, overlap), _legacy_starts(width, tile_size, overlap))
+
+
 class SA_Tiling_ImageLoader:
     """
     A utility class for loading, processing, and saving images. It supports operations such as loading images from disk,
@@ -15,14 +94,25 @@ class SA_Tiling_ImageLoader:
     for blending, and saving the processed images back to disk.
     """
 
-    def __init__(self, tile_size: int):
+    def __init__(self, tile_size: int, overlap: Optional[int] = None):
         """
         Initializes the ImageLoader with a specific tile size.
 
         Args:
             tile_size (int): The size of the squared tiles into which the images will be split. Defaults to 128.
+            overlap (int, optional): Minimum overlap in pixels for the planned tiling. If None, the
+                reference tiling is used (25% of the tile size, last row/column shifted back).
         """
         self.tile_size = tile_size
+        self.overlap = overlap
+
+    def tile_plan(self, height: int, width: int) -> TilePlan:
+        """
+        Returns the tiling used for an image of the given (padded) size.
+        """
+        if self.overlap is None:
+            return legacy_tile_plan(height, width, self.tile_size)
+        return plan_tiles(height, width, self.tile_size, self.overlap)
 
 
         """
@@ -74,7 +164,14 @@ class SA_Tiling_ImageLoader:
         padded_image_for_tensor = (
             padded_image_np.astype(np.float32).transpose([2, 0, 1]) / 255.0
         )
-        tiles = self.split_to_tiles_with_overlap(padded_image_for_tensor)
+        if self.overlap is None:
+            tiles = self.split_to_tiles_with_overlap(padded_image_for_tensor)
+        else:
+            plan = self.tile_plan(*padded_shape)
+            tiles = [
+                padded_image_for_tensor[:, h : h + self.tile_size, w : w + self.tile_size]
+                for h, w in plan.origins()
+            ]
         tiles_tensor = [
             torch.as_tensor(tile[None, :, :, :], dtype=torch.float32) for tile in tiles
         ]
@@ -229,6 +326,65 @@ class SA_Tiling_ImageLoader:
 
         return upscaled_image
 
+    def reconstruct_image_from_plan(
+        self,
+        upscaled_tiles: List[torch.Tensor],
+        plan: TilePlan,
+        scale: int,
+    ) -> torch.Tensor:
+        """
+        Reconstructs an image from upscaled tiles laid out by `plan`, cross-fading every overlap.
+
+        Each tile is weighted by the outer product of two 1-D ramps that rise across the
+        actual overlap with the previous tile and fall across the overlap with the next
+        one, so neighbouring tiles blend linearly whatever their spacing. The weight map
+        is single-channel.
+
+        Parameters:
+            upscaled_tiles (List[torch.Tensor]): Upscaled tiles, in `plan.origins()` order.
+            plan (TilePlan): The plan used to split the image.
+            scale (int): The factor by which the image has been upscaled.
+
+        Returns:
+            torch.Tensor: The reconstructed and blended upscaled image (C, H, W).
+        """
+        upscaled_tile_size = self.tile_size * scale
+        upscaled_image = torch.zeros((3, plan.height * scale, plan.width * scale))
+        weight_map = torch.zeros((1, plan.height * scale, plan.width * scale))
+
+        ramps_h = self._plan_ramps(plan.starts_h, scale)
+        ramps_w = self._plan_ramps(plan.starts_w, scale)
+
+        tile_index = 0
+        for ramp_h, start_h in zip(ramps_h, plan.starts_h):
+            for ramp_w, start_w in zip(ramps_w, plan.starts_w):
+                weight = torch.from_numpy(np.outer(ramp_h, ramp_w)).unsqueeze(0)
+                tile = upscaled_tiles[tile_index].squeeze(0)
+                tile_index += 1
+
+                h0, w0 = start_h * scale, start_w * scale
+                upscaled_image[:, h0 : h0 + upscaled_tile_size, w0 : w0 + upscaled_tile_size] += tile * weight
+                weight_map[:, h0 : h0 + upscaled_tile_size, w0 : w0 + upscaled_tile_size] += weight
+
+        upscaled_image /= weight_map
+        return upscaled_image
+
+    def _plan_ramps(self, starts: List[int], scale: int) -> List[np.ndarray]:
+        size = self.tile_size * scale
+        ramps = []
+        for i, start in enumerate(starts):
+            ramp = np.ones(size, dtype=np.float32)
+            if i > 0:
+                ov = (starts[i - 1] + self.tile_size - start) * scale
+                if ov > 0:
+                    ramp[:ov] = np.minimum(ramp[:ov], (np.arange(ov) + 1) / (ov + 1))
+            if i < len(starts) - 1:
+                ov = (start + self.tile_size - starts[i + 1]) * scale
+                if ov > 0:
+                    ramp[-ov:] = np.minimum(ramp[-ov:], (np.arange(ov, 0, -1)) / (ov + 1))
+            ramps.append(ramp)
+        return ramps
+
     def linear_weight(self, x: np.ndarray, width: float) -> np.ndarray:
         """
         Generates a linear weight that increases from 0 to 1.
@@ -1,6 +1,34 @@
 # Scala per la super risoluzione (cambiare se volete diversa da x2)
 SUPER_RESOLUTION_PAR = 2
 
+# Tiling per l'inferenza: lato dei tile e sovrapposizione minima in pixel.
+# SR_TILE_OVERLAP = None usa il tiling di riferimento (25% del tile, ultima riga/colonna spostata).
+# Confrontare le alternative con: python -m benchmark.tile_planning
+SR_TILE_SIZE = 128
+SR_TILE_OVERLAP = None
+
+# Tile quasi uniformi (varianza di ogni canale sotto soglia, pixel in [0, 1]) ingranditi con bicubica invece che con EDSR.
+# None = tutti i tile passano dal modello. 1e-4 corrisponde a una deviazione standard di ~2.5 livelli su 255.
+SR_BLANK_TILE_VARIANCE = None
+# Riusa l'output dei tile identici byte per byte all'interno della stessa immagine
+SR_TILE_MEMO = False
+
+# Variante del modello: None = FP32 (edsr_2x.ven), "int8" = edsr_2x_int8.ven creato con
+# python -m model.SR_Script.quantize_model -m model/SR_Script/super_res (solo se supera la verifica PSNR/SSIM)
+SR_MODEL_VARIANT = None
+
+# Modalità ROI: EDSR solo su documento e righello, il piano dello scanner viene ingrandito con bicubica.
+# Le regioni vengono cercate su una copia ridotta (lato lungo ROI_DETECTION_LONG_SIDE px).
+SR_ROI_MODE = False
+ROI_DETECTION_LONG_SIDE = 1024
+ROI_BINARY_THRESHOLD = 50           # stessa soglia di binaryize_image
+ROI_MIN_AREA_FRACTION = 0.002       # regioni più piccole (polvere, rumore) ignorate
+ROI_RULER_TEMPLATE_SCALES = [0.5, 0.75, 1.0, 1.25, 1.5]
+ROI_RULER_MATCH_THRESHOLD = 0.6
+ROI_MARGIN_PX = 64                  # margine attorno alle regioni, px di input
+ROI_FEATHER_PX = 16                 # sfumatura ai bordi delle regioni, px di input
+ROI_MAX_FRACTION = 0.9              # oltre questa frazione dell'immagine si super-risolve tutto
+
 # Proporzioni (sono empiriche, cioè misurate dalle foto)
 # NON TOCCARE
 # Le misure sono in px o in mm
@@ -33,10 +61,105 @@ CHROMATIC_BAND_600_PPI = {
     "correction_factor": 600 / 586
 }
 
+# PPI della cartella dai tag XResolution/YResolution degli header TIFF, verificati con il righello
+# dell'ultima immagine; se mancano o non sono coerenti si usa la stima dalle immagini
+TIFF_PPI_FROM_TAGS = True
+TIFF_RULER_TOLERANCE = 0.1  # scarto relativo massimo tra righello misurato e calibrazione
+
+# Indice degli header (dimensioni, risoluzione, compressione) aggiornato a ogni esecuzione:
+# scheduler, stima della memoria e stima del PPI lo interrogano invece di aprire i file
+USE_METADATA_INDEX = True
+# Estensioni delle scansioni in input
+INPUT_IMAGE_SUFFIXES = (".tif", ".tiff", ".jpg", ".jpeg", ".png", ".bmp")
+METADATA_INDEX_WORKERS = 16  # thread di lettura degli header (I/O di rete)
+
 # A4 AREA
 A4_WIDTH_MM = 210
 A4_HEIGHT_MM = 297
 TOLERANCE_MM = 2  # Tolleranza per considerare un'immagine A4
 
 # Threashold for binarization
-BINARY_THRESHOLD = 50
\ No newline at end of file
+BINARY_THRESHOLD = 50
+
+# Piano di output per cartella (python -m src.main: piano e costo stimato stampati per ogni cartella)
+# "reference" = x SUPER_RESOLUTION_PAR, file intermedio, ridimensionamento (comportamento storico)
+# "quality"   = il piano più economico tra quelli di qualità massima (es. x2 con ridimensionamento in memoria)
+# "speed"     = il piano più economico in assoluto (anche ridimensionamento diretto senza SR)
+OUTPUT_PLAN_POLICY = "reference"
+# Costi stimati in secondi CPU per megapixel: da calibrare con --benchmark
+SR_SECONDS_PER_INPUT_MP = {2: 6.0, 3: 7.0, 4: 8.0}
+RESAMPLE_SECONDS_PER_MP = 0.05        # per MP ridimensionato (Lanczos)
+INTERMEDIATE_IO_SECONDS_PER_MP = 0.15  # scrittura e rilettura del file SR intermedio, per MP
+
+# Tempo massimo di import di src.main (senza torch, onnxruntime, cv2): python -m benchmark.import_time
+IMPORT_TIME_BUDGET_S = 1.0
+
+# Intermedi della super-risoluzione: "npy" = array grezzo mappabile in memoria (header + pixel),
+# "tiff" = TIFF non compresso (storico). Quota con eliminazione LRU, rimossi a output finale completo
+SR_INTERMEDIATE_FORMAT = "npy"
+INTERMEDIATE_QUOTA_GB = 50         # None = nessun limite
+INTERMEDIATE_MIN_AGE_S = 600       # gli intermedi più recenti non vengono eliminati (in elaborazione)
+INTERMEDIATE_KEEP_COMPLETED = False  # True = conservati (entro la quota) per ridimensionamenti futuri
+KEEP_PPI_DEBUG_IMAGES = False      # True = conserva in OUTPUT_TMP_DIR le immagini binarizzate della stima PPI
+
+# Output scritti con nome temporaneo e rinomina atomica; verificati con dimensione e checksum
+# registrati in RUN_STATE_PATH invece che decodificandoli (decodifica completa solo con --audit)
+VERIFY_OUTPUT_CHECKSUMS = True  # False = ogni output viene riaperto e decodificato dopo la scrittura
+
+# Errori per immagine: i transitori (file bloccati, timeout di I/O, rete) vengono ritentati solo
+# su quell'immagine, con attesa esponenziale e jitter; quelli del file di input (immagine illeggibile,
+# PPI non supportato) finiscono in quarantena (RUN_STATE_PATH); gli altri lasciano l'immagine alla prossima esecuzione
+IMAGE_MAX_ATTEMPTS = 3
+IMAGE_RETRY_BASE_DELAY_S = 2.0
+IMAGE_RETRY_MAX_DELAY_S = 30.0
+
+# Processi worker supervisionati: un processo caduto viene sostituito e solo le sue immagini in corso
+# tornano in coda; dopo WORKER_MAX_IMAGES immagini o oltre WORKER_MAX_RSS_GB di RSS il processo
+# viene riciclato (frammentazione e perdite di memoria di ORT/PIL). None = nessun limite
+WORKER_MAX_IMAGES = 200
+WORKER_MAX_RSS_GB = None
+WORKER_MAX_CRASHES_PER_IMAGE = 2   # crash del processo sulla stessa immagine prima della quarantena
+WORKER_MAX_STARTUP_FAILURES = 3    # processi consecutivi caduti prima di iniziare un'immagine
+
+# Staging su disco locale per input e output su share di rete (--staging)
+STAGING_ENABLED = False
+STAGING_READ_AHEAD = 8            # immagini copiate in anticipo oltre a quelle in elaborazione
+STAGING_UPLOAD_WORKERS = 4        # thread di upload degli output per processo
+STAGING_MAX_PENDING_UPLOADS = 32  # oltre questo numero di upload in coda i worker attendono
+STAGING_RETRIES = 4               # tentativi di copia (file bloccati, share irraggiungibile)
+STAGING_INPUT_WAIT_S = 120        # attesa massima della copia locale, poi lettura dalla share
+
+# Più nodi sullo stesso albero di input (--distributed): lease per immagine in LEASE_DIR
+LEASE_TTL_S = 300.0        # un lease non rinnovato entro questo tempo viene ripreso da un altro nodo
+LEASE_HEARTBEAT_S = 30.0   # intervallo di rinnovo dei lease tenuti
+
+# Modalità --watch: nuove cartelle nell'albero di input elaborate da un pool sempre attivo
+WATCH_POLL_INTERVAL_S = 10.0  # intervallo di scansione (watchdog, se installato, la anticipa)
+WATCH_SETTLE_S = 30.0         # una cartella è pronta quando i suoi file non cambiano da questo tempo
+
+# Core: budget ripartito tra i processi (thread ORT intra-op, cv2, torch/OpenMP) per non sovrascrivere la CPU
+CORE_BUDGET = None     # None = tutti i core disponibili al processo
+CPU_AFFINITY = False   # True = ogni processo viene legato ai core della sua quota
+
+# Memoria: budget di RAM per le immagini elaborate in contemporanea
+# None = MEMORY_BUDGET_FRACTION della RAM fisica
+MEMORY_BUDGET_GB = None
+MEMORY_BUDGET_FRACTION = 0.8
+
+# Stima del picco di memoria in byte per pixel di input: BASE + PER_SCALE2 * scala²
+# Calibrare con: python -m src.main --memory-benchmark
+MEMORY_BYTES_PER_PIXEL_BASE = 24
+MEMORY_BYTES_PER_PIXEL_PER_SCALE2 = 60
+MEMORY_BYTES_PER_PIXEL_DECODED = 9  # immagine PIL + RGB + array numpy
+MEMORY_BYTES_PER_PIXEL_OUTPUT = 6   # output uint8 + immagine PIL (per scala²)
+
+# Elaborazione a strisce per le immagini che da sole superano il budget
+STRIP_HEIGHT_PX = 2048
+STRIP_MIN_HEIGHT_PX = 256
+STRIP_MARGIN_PX = 128  # contesto sopra e sotto ogni striscia, scartato in uscita
+
+
+# Log degli errori: un solo scrittore nel processo principale, scritture a blocchi
+LOG_BACKEND = "csv"  # "csv", "jsonl" o "sqlite"
+LOG_BATCH_SIZE = 200
+LOG_FLUSH_INTERVAL = 2.0  # secondi
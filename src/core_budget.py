@@ -0,0 +1,176 @@
+import os
+from queue import Empty
+
+from src.config import *
+
+# Piano applicato al processo corrente (dall'initializer del Pool)
+_current_plan = None
+
+# Variabili lette dai pool OpenMP/BLAS all'avvio (torch, numpy)
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def _core_ids() -> list[int]:
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        pass
+
+    try:
+        import psutil
+        return sorted(psutil.Process().cpu_affinity())
+    except (ImportError, AttributeError):
+        return list(range(os.cpu_count() or 1))
+
+
+def available_cores() -> int:
+    """
+    Number of cores this process may run on (its affinity mask, not the whole machine).
+    """
+    return len(_core_ids())
+
+
+class ThreadPlan:
+    """
+    Thread counts and cores assigned to one worker process.
+
+    Args:
+        slot (int): Index of the process in the pool.
+        python_threads (int): Worker threads pulling images from the queue.
+        intra_op_threads (int): ONNX Runtime intra-op threads of the model session.
+        cv2_threads (int): `cv2.setNumThreads` value.
+        torch_threads (int): `torch.set_num_threads` value (and OpenMP/BLAS pools).
+        cpus (list[int], optional): Cores the process is pinned to; None = no affinity.
+    """
+
+    def __init__(self, slot: int, python_threads: int, intra_op_threads: int, cv2_threads: int,
+                 torch_threads: int, cpus: list[int] | None = None):
+        self.slot = slot
+        self.python_threads = python_threads
+        self.intra_op_threads = intra_op_threads
+        self.cv2_threads = cv2_threads
+        self.torch_threads = torch_threads
+        self.cpus = cpus
+
+    def to_dict(self) -> dict:
+        return {
+            "slot": self.slot,
+            "python_threads": self.python_threads,
+            "intra_op_threads": self.intra_op_threads,
+            "cv2_threads": self.cv2_threads,
+            "torch_threads": self.torch_threads,
+            "cpus": self.cpus,
+        }
+
+    def describe(self) -> str:
+        cpus = ",".join(str(c) for c in self.cpus) if self.cpus is not None else "tutti"
+        return (f"processo {self.slot}: {self.python_threads} thread Python, ORT intra-op {self.intra_op_threads}, "
+                f"cv2 {self.cv2_threads}, torch {self.torch_threads}, core {cpus}")
+
+
+def plan_threads(processes: int, threads: int, cores: int | None = None, intra_op_threads: int | None = None,
+                 affinity: bool = CPU_AFFINITY) -> list[ThreadPlan]:
+    """
+    Split a core budget among the worker processes, so the threads started by ORT,
+    OpenCV, torch and OpenMP add up to the cores instead of each library sizing its
+    pool on the whole machine.
+
+    Each process gets an equal share of the cores (the remainder goes to the first
+    ones). The inferences of a process are serialized by the model lock, so its ORT
+    session uses the whole share; cv2 and torch run in the Python threads concurrently
+    and split the share among them.
+
+    Args:
+        processes (int): Worker processes.
+        threads (int): Python threads per process.
+        cores (int, optional): Core budget; default `CORE_BUDGET` or all available cores.
+        intra_op_threads (int, optional): ORT intra-op threads per process instead of the share.
+        affinity (bool): Pin each process to the cores of its share.
+
+    Returns:
+        list[ThreadPlan]: One plan per process.
+    """
+    ids = _core_ids()
+    cores = cores or CORE_BUDGET or len(ids)
+    plans = []
+    start = 0
+    for slot in range(processes):
+        share = max(1, cores // processes + (1 if slot < cores % processes else 0))
+        helper_threads = max(1, share // threads)
+        # Più processi che core: i core vengono riassegnati a giro
+        cpus = [ids[(start + i) % len(ids)] for i in range(share)] if affinity else None
+        plans.append(ThreadPlan(slot, threads, intra_op_threads or share, helper_threads, helper_threads, cpus))
+        start += share
+    return plans
+
+
+def intra_op_candidates(processes: int, cores: int | None = None) -> list[int]:
+    """
+    ORT intra-op thread counts worth benchmarking for `processes`: the whole share of
+    each process, and half of it (the rest left to decoding and resizing).
+    """
+    share = max(1, (cores or CORE_BUDGET or available_cores()) // processes)
+    return sorted({share, max(1, share // 2)}, reverse=True)
+
+
+def apply_thread_plan(plan: ThreadPlan):
+    """
+    Apply a plan to the current process: affinity, OpenMP/BLAS variables, cv2 and torch.
+    Call it before the model is loaded: ORT reads the intra-op count at session creation.
+    """
+    global _current_plan
+    _current_plan = plan
+
+    if plan.cpus is not None:
+        try:
+            os.sched_setaffinity(0, plan.cpus)
+        except AttributeError:
+            try:
+                import psutil
+                psutil.Process().cpu_affinity(plan.cpus)
+            except (ImportError, AttributeError):
+                print(f"⚠️ Affinità CPU non supportata su questo sistema (processo {plan.slot})")
+
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(plan.torch_threads)
+
+    try:
+        import cv2
+        cv2.setNumThreads(plan.cv2_threads)
+    except ImportError:
+        pass
+
+    try:
+        import torch
+        torch.set_num_threads(plan.torch_threads)
+        torch.set_num_interop_threads(1)
+    except ImportError:
+        pass
+    except RuntimeError:
+        pass  # pool inter-op già avviato: resta quello esistente
+
+
+def init_pool_process(plans: list[ThreadPlan], slots):
+    """
+    `Pool` initializer: take a free slot from the shared queue and apply its plan.
+    A process started to replace a dead one finds the queue empty and reuses a plan.
+    """
+    try:
+        slot = slots.get_nowait()
+    except Empty:
+        slot = os.getpid() % len(plans)
+    apply_thread_plan(plans[slot])
+
+
+def pool_slots(manager, processes: int):
+    """
+    Queue of the slots of a new pool, one per process.
+    """
+    slots = manager.Queue()
+    for slot in range(processes):
+        slots.put(slot)
+    return slots
+
+
+def current_plan() -> ThreadPlan | None:
+    return _current_plan
@@ -7,11 +7,79 @@ from pathlib import Path
 from src.utils import *
 from src.config import *
 from src.paths import *
+from src.tiff_metadata import read_tiff_metadata
+from src.output_planner import RULER_CALIBRATION
 from logs.logger import CSVLogger
 
+TIFF_SUFFIXES = (".tif", ".tiff")
+IMAGE_SUFFIXES = INPUT_IMAGE_SUFFIXES
 
-def estimate_ppi_for_folder(folder_path: Path) -> int | None:
+
+def ppi_from_tiff_tags(images: list[Path], index=None) -> tuple[int | None, str]:
+    """
+    PPI of a folder from the resolution tags of its TIFF headers (from the metadata
+    index when given and up to date).
+
+    Returns:
+        tuple[int | None, str]: The PPI if every image declares the same supported
+        resolution, otherwise None; and the reason of the decision.
+    """
+    if not images:
+        return None, "nessuna immagine"
+    if any(img.suffix.lower() not in TIFF_SUFFIXES for img in images):
+        return None, "immagini non TIFF"
+
+    values = set()
+    for img in images:
+        record = index.get(img) if index is not None else None
+        try:
+            ppi = record["ppi"] if record is not None else read_tiff_metadata(img).ppi
+        except (OSError, ValueError) as e:
+            return None, f"header non leggibile in {img.name}: {e}"
+        if ppi is None:
+            return None, f"tag di risoluzione assenti o anisotropi in {img.name}"
+        values.add(round(ppi))
+
+    if len(values) > 1:
+        return None, f"risoluzioni discordanti nei tag: {sorted(values)}"
+    ppi = values.pop()
+    if ppi not in RULER_CALIBRATION:
+        return None, f"risoluzione {ppi} PPI senza calibrazione del righello"
+    return ppi, f"{ppi} PPI dichiarati da {len(images)} header TIFF"
+
+
+def ruler_ppi(chromatic_band_dim_px) -> tuple[int, float]:
+    """
+    Calibrated PPI whose ruler length is closest to the measured one, and the relative deviation.
+    """
+    long_side = max(chromatic_band_dim_px)
+    ppi, calibration = min(RULER_CALIBRATION.items(),
+                           key=lambda item: abs(long_side - item[1]["width_pixel"]))
+    return ppi, abs(long_side - calibration["width_pixel"]) / calibration["width_pixel"]
+
+
+def estimate_ppi_for_folder(folder_path: Path, index=None) -> int | None:
     try:
+        if TIFF_PPI_FROM_TAGS:
+            images = sorted(f for f in folder_path.iterdir() if f.is_file() and f.suffix.lower() in IMAGE_SUFFIXES)
+            tag_ppi, reason = ppi_from_tiff_tags(images, index)
+            if tag_ppi is not None:
+                # Verifica con il righello dell'ultima immagine: una sola misura invece di tutta la cartella
+                ruler_image = OUTPUT_TMP_DIR / folder_path.name / f"chromatic_band_{images[-1].name}"
+                safe_copy(images[-1], ruler_image)
+                chromatic_band_dim_px = measure_chromatic_band_dimension(ruler_image)
+                if chromatic_band_dim_px:
+                    measured_ppi, deviation = ruler_ppi(chromatic_band_dim_px)
+                    if measured_ppi == tag_ppi and deviation <= TIFF_RULER_TOLERANCE:
+                        print(f"[✅] PPI per {folder_path.name}: {tag_ppi} dai metadati "
+                              f"({reason}; righello coerente, scarto {deviation:.1%})")
+                        return tag_ppi
+                    reason = (f"{reason}, ma il righello indica {measured_ppi} PPI "
+                              f"(scarto {deviation:.1%})")
+                else:
+                    reason = f"{reason}, ma il righello non è stato trovato"
+            print(f"[ℹ️] PPI per {folder_path.name} stimato dalle immagini: {reason}")
+
         chromatic_band_img = find_chromatic_band_in_folder(folder_path)
         if not chromatic_band_img:
             return None
@@ -44,6 +112,18 @@ def estimate_ppi_for_folder(folder_path: Path) -> int | None:
     except Exception as e:
         print(f"[⚠️] Errore durante la stima PPI in {folder_path}: {e}")
         return None
+    finally:
+        if not KEEP_PPI_DEBUG_IMAGES:
+            remove_ppi_debug_images(folder_path)
+
+
+def remove_ppi_debug_images(folder_path: Path):
+    """
+    Remove the ruler copy, binarized and annotated images written for `folder_path`.
+    """
+    shutil.rmtree(OUTPUT_TMP_DIR / folder_path.name, ignore_errors=True)
+    for img in folder_path.iterdir():
+        (OUTPUT_TMP_DIR / img.name).unlink(missing_ok=True)
 
 
 def safe_imread(path: Path, retries=3, delay=0.5):
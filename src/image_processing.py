@@ -1,4 +1,9 @@
 # processing.py
+# SA_SuperResolution (torch, onnxruntime) e src.roi (cv2) non vengono importati qui:
+# il modello arriva già caricato dal chiamante, la ROI si importa solo se richiesta.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 from PIL import Image
@@ -7,10 +12,68 @@ from pathlib import Path
 from src.utils import *
 from src.paths import *
 from src.config import *
-from model.SR_Script.super_resolution import SA_SuperResolution
+from src import tracing
+from src.metrics import ImageMetrics, stage
+from src.output_planner import RULER_CALIBRATION, UnsupportedPPIError, final_size
+from src.intermediates import RAW_SUFFIX, raw_path, final_name, save_raw, load_raw
+from src.integrity import WrittenFile, write_atomic
+
+
+def _save_image(image: Image.Image, output_path: Path, written: dict[Path, WrittenFile] | None, **params):
+    # Nome temporaneo e rinomina atomica; dimensione e checksum calcolati durante la codifica
+    image_format = Image.registered_extensions().get(output_path.suffix.lower())
+    result = write_atomic(output_path, lambda f: image.save(f, format=image_format, **params))
+    if written is not None:
+        written[output_path] = result
+
+
+def _decode_rgb(image_path: Path, metrics: ImageMetrics | None) -> np.ndarray:
+    try:
+        with stage(metrics, "decode"), Image.open(image_path) as img:
+            img_rgb = img.convert("RGB")
+            img_np = np.array(img_rgb)
+    except Exception as e:
+        raise RuntimeError(f"Failed to load or convert image {image_path}: {e}")
+
+    if metrics is not None:
+        metrics.set("megapixels", img_np.shape[0] * img_np.shape[1] / 1e6)
+    return img_np
+
 
+def _super_resolve(image_path: Path, img_np: np.ndarray, sr_model: "SA_SuperResolution",
+                   metrics: ImageMetrics | None, strip_height: int | None, roi: bool) -> np.ndarray:
+    boxes = None
+    if roi:
+        from src.roi import detect_roi_boxes
+        with stage(metrics, "roi_detection"):
+            boxes = detect_roi_boxes(img_np)
+        roi_area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in boxes)
+        # Nessuna regione trovata o regioni quasi a tutta pagina: conviene l'immagine intera
+        if not boxes or roi_area > ROI_MAX_FRACTION * img_np.shape[0] * img_np.shape[1]:
+            boxes = None
+        if boxes is None and metrics is not None:
+            metrics.set("roi_fraction", 1.0)
+
+    try:
+        timings = {} if metrics is not None else None
+        if boxes is not None:
+            from src.roi import super_resolve_roi
+            upscaled_image_np = super_resolve_roi(sr_model, img_np, boxes, strip_height, timings=timings)
+        elif strip_height is not None:
+            upscaled_image_np = sr_model.run_in_strips(img_np, strip_height, timings=timings)
+        else:
+            upscaled_image_np = sr_model.run(img_np, timings=timings)
+        if metrics is not None:
+            metrics.add_timings(timings)
+    except Exception as e:
+        raise RuntimeError(f"Super-resolution model failed for {image_path}: {e}")
+    return upscaled_image_np
 
-def apply_super_resolution_single(image_path: Path, output_dir: Path, sr_model: SA_SuperResolution) -> Path:
+
+def apply_super_resolution_single(image_path: Path, output_dir: Path, sr_model: "SA_SuperResolution",
+                                  metrics: ImageMetrics | None = None, strip_height: int | None = None,
+                                  roi: bool = SR_ROI_MODE, raw: bool = SR_INTERMEDIATE_FORMAT == "npy",
+                                  written: dict[Path, WrittenFile] | None = None) -> Path:
     """
     Apply super-resolution model to a single image.
 
@@ -18,6 +81,12 @@ def apply_super_resolution_single(image_path: Path, output_dir: Path, sr_model:
         image_path (Path): Path to input image.
         output_dir (Path): Directory to save super-resolved image.
         sr_model (SA_SuperResolution): Preloaded super-resolution model instance.
+        metrics (ImageMetrics, optional): Collector for per-stage timings.
+        strip_height (int, optional): If set, process the image in horizontal strips of this height.
+        roi (bool): Run the model only on the document and ruler regions, upscaling the
+            scanner bed with bicubic interpolation.
+        raw (bool): Save a memory-mappable `.npy` array instead of a TIFF.
+        written (dict, optional): Filled with the size and checksum of the TIFF written.
 
     Returns:
         Path: Output path of the super-resolved image.
@@ -25,76 +94,189 @@ def apply_super_resolution_single(image_path: Path, output_dir: Path, sr_model:
     Raises:
         RuntimeError: If image loading or saving fails.
     """
-    try:
-        with Image.open(image_path) as img:
-            img_rgb = img.convert("RGB")
-            img_np = np.array(img_rgb)
-    except Exception as e:
-        raise RuntimeError(f"Failed to load or convert image {image_path}: {e}")
+    img_np = _decode_rgb(image_path, metrics)
+    upscaled_image_np = _super_resolve(image_path, img_np, sr_model, metrics, strip_height, roi)
 
-    try:
-        upscaled_image_np = sr_model.run(img_np)
-        output_img = numpy_to_image(upscaled_image_np)
-    except Exception as e:
-        raise RuntimeError(f"Super-resolution model failed for {image_path}: {e}")
+    if raw:
+        output_path = raw_path(output_dir, image_path.name)
+        try:
+            with stage(metrics, "sr_write"):
+                save_raw(output_path, upscaled_image_np)
+        except Exception as e:
+            raise RuntimeError(f"Failed to save super-resolved image to {output_path}: {e}")
+        return output_path
+
+    output_img = numpy_to_image(upscaled_image_np)
 
     output_path = output_dir / image_path.name
-    output_path.parent.mkdir(parents=True, exist_ok=True)
 
     try:
-        if output_path.exists():
-            output_path.unlink()
-        output_img.save(output_path)
+        with stage(metrics, "sr_write"):
+            _save_image(output_img, output_path, written)
     except Exception as e:
         raise RuntimeError(f"Failed to save super-resolved image to {output_path}: {e}")
     
     return output_path
 
 
-def apply_personalized_downscaling_single(image_path: Path, output_dir: Path, ppi = int) -> Path:
+def apply_personalized_downscaling_single(image_path: Path, output_dir: Path, ppi = int,
+                                          metrics: ImageMetrics | None = None,
+                                          sr_scale: int = SUPER_RESOLUTION_PAR, target_ppi: int | None = None,
+                                          written: dict[Path, WrittenFile] | None = None) -> Path:
     """
     Resize a super-resolved image based on PPI info in filename.
 
     Args:
-        image_path (Path): Path to the super-resolved image.
+        image_path (Path): Path to the super-resolved image (a TIFF, or a `.npy` intermediate
+            that is memory-mapped instead of decoded).
         output_dir (Path): Directory to save the resized image.
+        metrics (ImageMetrics, optional): Collector for per-stage timings.
+        sr_scale (int): Factor by which the image was super-resolved.
+        target_ppi (int, optional): PPI of the output, default `ppi` (the PPI of the scan).
+        written (dict, optional): Filled with the size and checksum of the image written.
 
     Returns:
         Path: Output path of the resized image.
 
     Raises:
-        ValueError: If PPI is invalid or unsupported.
+        UnsupportedPPIError: If PPI is invalid or unsupported.
         RuntimeError: If image loading or saving fails.
     """
-
-    if ppi == 400:
-        chromatic_ruler = CHROMATIC_BAND_400_PPI
-        target_ruler_px = TARGET_RULER_PX_400_PPI
-    elif ppi == 600:
-        chromatic_ruler = CHROMATIC_BAND_600_PPI
-        target_ruler_px = TARGET_RULER_PX_600_PPI
-
-    original_ruler_inch = chromatic_ruler["width_mm"] / INCH_CONVERSION
-    original_ruler_px = SUPER_RESOLUTION_PAR * chromatic_ruler["ppi"] * original_ruler_inch
-
-    scale_factor = target_ruler_px / original_ruler_px
-    scale_factor *= chromatic_ruler["correction_factor"]
+    if ppi not in RULER_CALIBRATION:
+        raise UnsupportedPPIError(f"PPI non supportato: {ppi}")
 
     try:
-        with Image.open(image_path) as image:
-            new_width = int(image.width * scale_factor)
-            new_height = int(image.height * scale_factor)
-            new_size = (new_width, new_height)
-            resized_img = image.resize(new_size, resample=Image.LANCZOS)
+        if image_path.suffix == RAW_SUFFIX:
+            with stage(metrics, "resize"):
+                image = Image.fromarray(load_raw(image_path))
+                new_size = final_size(image.width // sr_scale, image.height // sr_scale, ppi, target_ppi)
+                resized_img = image.resize(new_size, resample=Image.LANCZOS)
+                del image
+        else:
+            with stage(metrics, "resize"), Image.open(image_path) as image:
+                new_size = final_size(image.width // sr_scale, image.height // sr_scale, ppi, target_ppi)
+                resized_img = image.resize(new_size, resample=Image.LANCZOS)
     except Exception as e:
         raise RuntimeError(f"Failed to load or resize image {image_path}: {e}")
 
-    output_path = output_dir / image_path.name
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path = output_dir / final_name(image_path)
 
     try:
-        resized_img.save(output_path, dpi=(ppi, ppi))
+        with stage(metrics, "final_write"):
+            _save_image(resized_img, output_path, written, dpi=(target_ppi or ppi, target_ppi or ppi))
     except Exception as e:
         raise RuntimeError(f"Failed to save resized image to {output_path}: {e}")
     
-    return output_path
\ No newline at end of file
+    return output_path
+
+
+def _resize_and_save(image: Image.Image, size: tuple[int, int], output_path: Path, target_ppi: int,
+                     written: dict[Path, WrittenFile] | None) -> dict:
+    t0 = time.perf_counter()
+    with tracing.span("resize", target_ppi=target_ppi):
+        resized_img = image.resize(size, resample=Image.LANCZOS)
+    t1 = time.perf_counter()
+    with tracing.span("final_write", target_ppi=target_ppi):
+        _save_image(resized_img, output_path, written, dpi=(target_ppi, target_ppi))
+    return {"resize": t1 - t0, "final_write": time.perf_counter() - t1}
+
+
+def apply_multi_ppi_processing_single(image_path: Path, output_dirs: dict[int, Path],
+                                      sr_model: "SA_SuperResolution | None", ppi: int,
+                                      metrics: ImageMetrics | None = None, strip_height: int | None = None,
+                                      roi: bool = SR_ROI_MODE, sr_output_dir: Path | None = None,
+                                      raw: bool = SR_INTERMEDIATE_FORMAT == "npy",
+                                      written: dict[Path, WrittenFile] | None = None) -> dict[int, Path]:
+    """
+    Super-resolve a scan once and write one resized deliverable per target PPI.
+
+    The resizes of the in-memory result run in parallel threads (PIL releases the GIL).
+
+    Args:
+        image_path (Path): Path to input image.
+        output_dirs (dict[int, Path]): Output directory for each target PPI.
+        sr_model (SA_SuperResolution, optional): Model to upscale with; None resizes the scan directly.
+        ppi (int): PPI of the scan.
+        metrics (ImageMetrics, optional): Collector for per-stage timings (resize and write summed over targets).
+        strip_height (int, optional): If set, super-resolve in horizontal strips of this height.
+        roi (bool): Run the model only on the document and ruler regions.
+        sr_output_dir (Path, optional): If set, the super-resolved image is also saved there.
+        raw (bool): Save that image as a memory-mappable `.npy` array instead of a TIFF.
+        written (dict, optional): Filled with the size and checksum of every image written.
+
+    Returns:
+        dict[int, Path]: Output path of the deliverable for each target PPI.
+
+    Raises:
+        UnsupportedPPIError: If PPI is unsupported.
+        RuntimeError: If image loading, processing or saving fails.
+    """
+    if ppi not in RULER_CALIBRATION:
+        raise UnsupportedPPIError(f"PPI non supportato: {ppi}")
+
+    img_np = _decode_rgb(image_path, metrics)
+    sizes = {target: final_size(img_np.shape[1], img_np.shape[0], ppi, target) for target in output_dirs}
+    if sr_model is not None:
+        img_np = _super_resolve(image_path, img_np, sr_model, metrics, strip_height, roi)
+    if sr_output_dir is not None and raw:
+        sr_output_path = raw_path(sr_output_dir, image_path.name)
+        try:
+            with stage(metrics, "sr_write"):
+                save_raw(sr_output_path, img_np)
+        except Exception as e:
+            raise RuntimeError(f"Failed to save super-resolved image to {sr_output_path}: {e}")
+        sr_output_dir = None
+    image = numpy_to_image(img_np)
+    del img_np
+
+    if sr_output_dir is not None:
+        sr_output_path = sr_output_dir / image_path.name
+        try:
+            with stage(metrics, "sr_write"):
+                _save_image(image, sr_output_path, written)
+        except Exception as e:
+            raise RuntimeError(f"Failed to save super-resolved image to {sr_output_path}: {e}")
+
+    output_paths = {target: output_dirs[target] / image_path.name for target in output_dirs}
+    try:
+        with ThreadPoolExecutor(max_workers=len(output_paths)) as executor:
+            futures = {
+                target: executor.submit(_resize_and_save, image, sizes[target], path, target, written)
+                for target, path in output_paths.items()
+            }
+            timings = [future.result() for future in futures.values()]
+    except Exception as e:
+        raise RuntimeError(f"Failed to resize or save {image_path}: {e}")
+
+    if metrics is not None:
+        for timing in timings:
+            for name, seconds in timing.items():
+                metrics.add_time(name, seconds)
+    return output_paths
+
+
+def apply_fused_processing_single(image_path: Path, output_dir: Path, sr_model: "SA_SuperResolution | None",
+                                  ppi: int, metrics: ImageMetrics | None = None, strip_height: int | None = None,
+                                  roi: bool = SR_ROI_MODE, written: dict[Path, WrittenFile] | None = None) -> Path:
+    """
+    Super-resolve (or not) and resize a scan in memory, writing only the final image.
+
+    Args:
+        image_path (Path): Path to input image.
+        output_dir (Path): Directory to save the final image.
+        sr_model (SA_SuperResolution, optional): Model to upscale with; None resizes the scan directly.
+        ppi (int): Target PPI.
+        metrics (ImageMetrics, optional): Collector for per-stage timings.
+        strip_height (int, optional): If set, super-resolve in horizontal strips of this height.
+        roi (bool): Run the model only on the document and ruler regions.
+        written (dict, optional): Filled with the size and checksum of the image written.
+
+    Returns:
+        Path: Output path of the final image.
+
+    Raises:
+        UnsupportedPPIError: If PPI is unsupported.
+        RuntimeError: If image loading, processing or saving fails.
+    """
+    return apply_multi_ppi_processing_single(image_path, {ppi: output_dir}, sr_model, ppi, metrics,
+                                             strip_height, roi, written=written)[ppi]
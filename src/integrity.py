@@ -0,0 +1,220 @@
+import os
+import time
+import uuid
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+
+from src.paths import *
+from src.config import *
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _new_hash():
+    return hashlib.blake2b(digest_size=16)
+
+
+class WrittenFile:
+    """
+    Size and content checksum of an output, as written by `write_atomic`.
+    """
+
+    def __init__(self, size: int, checksum: str):
+        self.size = size
+        self.checksum = checksum
+
+    def __eq__(self, other):
+        return isinstance(other, WrittenFile) and (self.size, self.checksum) == (other.size, other.checksum)
+
+    def __repr__(self):
+        return f"WrittenFile(size={self.size}, checksum={self.checksum!r})"
+
+
+class _HashingFile:
+    """
+    Write-only file wrapper that hashes the bytes while the encoder writes them.
+
+    `fileno` is deliberately not exposed, so encoders (e.g. libtiff through PIL) write
+    through `write` instead of the raw descriptor. An encoder that seeks back to patch
+    bytes already written makes the running hash useless: `result` then re-reads the file.
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self._hash = _new_hash()
+        self._hashed = 0
+        self.sequential = True
+
+    def write(self, data) -> int:
+        if self._f.tell() != self._hashed:
+            self.sequential = False
+        written = self._f.write(data)
+        if self.sequential:
+            self._hash.update(data)
+            self._hashed += written
+        return written
+
+    def tell(self) -> int:
+        return self._f.tell()
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._f.seek(offset, whence)
+
+    def flush(self):
+        self._f.flush()
+
+    def result(self, path: Path) -> WrittenFile:
+        size = path.stat().st_size
+        if self.sequential and size == self._hashed:
+            return WrittenFile(size, self._hash.hexdigest())
+        return WrittenFile(size, file_checksum(path))
+
+
+def file_checksum(path: Path) -> str:
+    """
+    Checksum of a file's content (BLAKE2b, 128 bit).
+    """
+    h = _new_hash()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_atomic(path: Path, write) -> WrittenFile:
+    """
+    Write a file under a temporary name in the same directory, then rename it in place,
+    so a crash never leaves a truncated file at `path`.
+
+    Args:
+        path (Path): Final path.
+        write (callable): Called with a writable binary file object (e.g. `lambda f: img.save(f, format="TIFF")`).
+
+    Returns:
+        WrittenFile: Size and checksum of the content, hashed while it was written.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.part")
+    try:
+        with open(tmp, "wb") as f:
+            hashing = _HashingFile(f)
+            write(hashing)
+        written = hashing.result(tmp)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return written
+
+
+def verify_written(path: Path, expected: WrittenFile) -> tuple[bool, str]:
+    """
+    Check an output against its size and checksum, without decoding it.
+
+    Returns:
+        tuple[bool, str]: (True, "") if it matches, (False, error) otherwise.
+    """
+    try:
+        size = Path(path).stat().st_size
+    except FileNotFoundError:
+        return False, "File non trovato (path inesistente)"
+    if size != expected.size:
+        return False, f"[SIZE FAIL] {size} byte, attesi {expected.size}"
+    checksum = file_checksum(path)
+    if checksum != expected.checksum:
+        return False, f"[CHECKSUM FAIL] {checksum}, atteso {expected.checksum}"
+    return True, ""
+
+
+class OutputState:
+    """
+    SQLite run state of the outputs: size and checksum of every file written, keyed by
+    its final path (on the share when staging), with the run that wrote it.
+
+    One instance per process, shared by its threads; processes write concurrently
+    through SQLite's own locking.
+    """
+
+    def __init__(self, path: Path = RUN_STATE_PATH, run_id: str | None = None):
+        self.path = Path(path)
+        self.run_id = run_id
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS outputs ("
+                "path TEXT PRIMARY KEY, size INTEGER, checksum TEXT, run_id TEXT, written_at REAL)"
+            )
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def record(self, path: Path, written: WrittenFile):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?)",
+                              (str(path), written.size, written.checksum, self.run_id, time.time()))
+            self.conn.commit()
+
+    def get(self, path: Path) -> WrittenFile | None:
+        with self.lock:
+            row = self.conn.execute("SELECT size, checksum FROM outputs WHERE path = ?", (str(path),)).fetchone()
+        return WrittenFile(*row) if row is not None else None
+
+    def forget(self, path: Path):
+        with self.lock:
+            self.conn.execute("DELETE FROM outputs WHERE path = ?", (str(path),))
+            self.conn.commit()
+
+
+def audit_outputs(roots: list[Path], validate, state: OutputState | None = None, remove: bool = True) -> dict:
+    """
+    Full check of every output under `roots`: decode with `validate` and compare with
+    the size and checksum recorded in `state`.
+
+    Invalid outputs are removed (with their record), so the next run produces them
+    again; leftover temporary files of interrupted writes are removed too. Valid
+    outputs without a record are recorded, so later runs can verify them by checksum.
+
+    Args:
+        roots (list[Path]): Output directories.
+        validate (callable): Path -> (bool, error), e.g. `is_valid_image_file`.
+        state (OutputState, optional): Run state to compare against and update.
+        remove (bool): Remove invalid outputs instead of only reporting them.
+
+    Returns:
+        dict: Counts ("checked", "invalid", "recorded", "partial") and "errors" (path -> error).
+    """
+    stats = {"checked": 0, "invalid": 0, "recorded": 0, "partial": 0, "errors": {}}
+    for root in roots:
+        for current_dir, _, filenames in os.walk(root):
+            for filename in sorted(filenames):
+                path = Path(current_dir) / filename
+                if filename.startswith(".") and filename.endswith(".part"):
+                    stats["partial"] += 1
+                    if remove:
+                        path.unlink(missing_ok=True)
+                    continue
+
+                stats["checked"] += 1
+                valid, err = validate(path)
+                expected = state.get(path) if state is not None else None
+                if valid and expected is not None:
+                    valid, err = verify_written(path, expected)
+                if valid:
+                    if state is not None and expected is None:
+                        state.record(path, WrittenFile(path.stat().st_size, file_checksum(path)))
+                        stats["recorded"] += 1
+                    continue
+
+                stats["invalid"] += 1
+                stats["errors"][str(path)] = err
+                if remove:
+                    path.unlink(missing_ok=True)
+                    if state is not None:
+                        state.forget(path)
+    return stats
@@ -0,0 +1,157 @@
+import os
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from src.paths import *
+from src.config import *
+
+RAW_SUFFIX = ".npy"
+
+
+def raw_path(output_dir: Path, image_name: str) -> Path:
+    """
+    Raw intermediate of `image_name` (e.g. `001.tif` -> `001.tif.npy`).
+    """
+    return Path(output_dir) / f"{image_name}{RAW_SUFFIX}"
+
+
+def final_name(path: Path) -> str:
+    """
+    Name of the image a file stands for: the raw suffix is dropped.
+    """
+    return path.name[:-len(RAW_SUFFIX)] if path.name.endswith(RAW_SUFFIX) else path.name
+
+
+def save_raw(path: Path, array: np.ndarray) -> Path:
+    """
+    Write an image array as `.npy` (a short header followed by the raw pixels), under a
+    temporary name renamed in place, so a partial file is never seen by a reader.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.part")
+    try:
+        with open(tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return path
+
+
+def load_raw(path: Path) -> np.ndarray:
+    """
+    Map a raw intermediate read-only: pixels are paged in on access, nothing is decoded.
+    """
+    array = np.load(path, mmap_mode="r", allow_pickle=False)
+    # La data di modifica fa da data di ultimo uso per l'LRU (atime spesso disabilitato)
+    os.utime(path)
+    return array
+
+
+def is_valid_raw_file(path: Path) -> tuple[bool, str]:
+    """
+    Check that a raw intermediate has a valid header and the size it declares.
+    """
+    try:
+        with open(path, "rb") as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+            header_size = f.tell()
+    except FileNotFoundError:
+        return False, "File non trovato (path inesistente)"
+    except Exception as e:
+        return False, f"[RAW FAIL] Header non valido: {e}"
+
+    expected = header_size + int(np.prod(shape)) * dtype.itemsize
+    actual = path.stat().st_size
+    if actual != expected or len(shape) not in (2, 3):
+        return False, f"[RAW FAIL] Dimensione {actual} byte, attesi {expected} per {shape} {dtype}"
+    return True, ""
+
+
+class IntermediateStore:
+    """
+    Disk quota for the intermediates under `root`, with least-recently-used eviction.
+
+    Last use is the file modification time, refreshed by `load_raw`. Files younger than
+    `min_age_s` are never evicted, so images still being processed by other workers
+    keep their intermediate even when the quota is too small for all of them.
+    """
+
+    def __init__(self, root: Path, quota_bytes: int | None = None, min_age_s: float = INTERMEDIATE_MIN_AGE_S):
+        self.root = Path(root)
+        if quota_bytes is None and INTERMEDIATE_QUOTA_GB is not None:
+            quota_bytes = int(INTERMEDIATE_QUOTA_GB * 1024 ** 3)
+        self.quota_bytes = quota_bytes
+        self.min_age_s = min_age_s
+        self.evicted = 0
+        self.evicted_bytes = 0
+
+    def entries(self) -> list[tuple[float, int, Path]]:
+        """
+        (last use, size, path) of every intermediate, least recently used first.
+        """
+        entries = []
+        for path in self.root.rglob("*"):
+            if path.name.startswith("."):
+                continue  # scritture in corso
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.is_file():
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def usage(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def enforce_quota(self, protect: tuple[Path, ...] = ()) -> int:
+        """
+        Evict least recently used intermediates until the total fits the quota.
+
+        Returns:
+            int: Bytes freed.
+        """
+        if self.quota_bytes is None:
+            return 0
+        entries = self.entries()
+        used = sum(size for _, size, _ in entries)
+        freed = 0
+        now = time.time()  # stesso orologio delle date di modifica
+        for last_use, size, path in entries:
+            if used - freed <= self.quota_bytes:
+                break
+            if path in protect or now - last_use < self.min_age_s:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue  # in uso (Windows) o già rimosso
+            freed += size
+            self.evicted += 1
+            self.evicted_bytes += size
+        return freed
+
+    def cleanup_completed(self, final_paths_for) -> int:
+        """
+        Remove the intermediates whose final outputs all exist.
+
+        Args:
+            final_paths_for (callable): Maps an intermediate path to the list of its final outputs.
+
+        Returns:
+            int: Number of intermediates removed.
+        """
+        removed = 0
+        for _, _, path in self.entries():
+            if all(p.exists() for p in final_paths_for(path)):
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import threading
+from pathlib import Path
+
+from src.paths import *
+from src.config import *
+
+
+def process_node_id(pid: int | None = None) -> str:
+    """
+    Node id of a process of this machine, as written in its leases.
+    """
+    return f"{socket.gethostname()}:{pid if pid is not None else os.getpid()}"
+
+
+class LeaseManager:
+    """
+    Coordinates several nodes (or processes) working on the same input tree through
+    lease files in a shared directory.
+
+    An image is claimed by creating `<key>.lease` with `O_EXCL`, which is atomic on local
+    disks and SMB shares. A lease expires `ttl` seconds after the last modification of its
+    file; the holder renews its leases from a heartbeat thread by touching them in place,
+    so the file never disappears while held. A lease whose expiry has passed belongs to a
+    dead node and can be taken over. Leases found taken over at renewal are reported by
+    `lost`, so the worker can drop the image. Finished images get a `<key>.done` marker,
+    so no node processes them again.
+
+    Expiry times are wall-clock: the clocks of the nodes must be synchronized to well
+    within `ttl`.
+    """
+
+    def __init__(self, lease_dir: Path = LEASE_DIR, root: Path = INPUT_IMAGES_DIR,
+                 ttl: float = LEASE_TTL_S, heartbeat: float = LEASE_HEARTBEAT_S, node_id: str | None = None):
+        self.lease_dir = Path(lease_dir)
+        self.lease_dir.mkdir(parents=True, exist_ok=True)
+        self.root = Path(root)
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.node_id = node_id or process_node_id()
+        # Distingue due istanze con lo stesso nodo (es. dopo un riavvio con lo stesso PID)
+        self.token = uuid.uuid4().hex
+
+        self._held: dict[str, str] = {}  # chiave -> percorso dell'immagine
+        self._lost: set[str] = set()     # lease trovati ripresi da un altro nodo al rinnovo
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def key(self, image_path: Path) -> str:
+        image_path = Path(image_path)
+        try:
+            rel = image_path.relative_to(self.root)
+        except ValueError:
+            rel = image_path
+        return rel.as_posix()
+
+    def _file(self, key: str, suffix: str) -> Path:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return self.lease_dir / f"{digest}{suffix}"
+
+    def _record(self, key: str) -> bytes:
+        return json.dumps({
+            "image": key,
+            "node": self.node_id,
+            "token": self.token,
+            "ttl": self.ttl,
+        }).encode("utf-8")
+
+    def _read(self, path: Path) -> dict | None:
+        # Scadenza dalla data di modifica: il rinnovo aggiorna solo quella, senza riscrivere il file
+        try:
+            with open(path, "rb") as f:
+                mtime = os.fstat(f.fileno()).st_mtime
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            record = json.loads(data.decode("utf-8"))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            # File vuoto o parziale (scrittura in corso o nodo caduto durante la scrittura)
+            record = {}
+        record["expires_at"] = mtime + record.get("ttl", self.ttl)
+        return record
+
+    def _create(self, path: Path, key: str) -> bool:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "wb") as f:
+            f.write(self._record(key))
+        return True
+
+    def is_done(self, image_path: Path) -> bool:
+        return self._file(self.key(image_path), ".done").exists()
+
+    def claim(self, image_path: Path) -> bool:
+        """
+        Try to take the lease of an image.
+
+        Returns:
+            bool: True if this node now holds the lease; False if the image is done
+            or leased by a live node.
+        """
+        key = self.key(image_path)
+        if self._file(key, ".done").exists():
+            return False
+
+        lease_path = self._file(key, ".lease")
+        if not self._create(lease_path, key):
+            record = self._read(lease_path)
+            if record is not None and record["expires_at"] > time.time():
+                return False
+            # Lease scaduto: lo rinomina in un nome univoco, solo un nodo ci riesce
+            stale = lease_path.with_name(f"{lease_path.name}.{self.token}.stale")
+            try:
+                os.rename(lease_path, stale)
+            except OSError:
+                return False
+            # Un altro nodo può aver ripreso il lease tra la lettura e la rinomina: lo restituisce
+            record = self._read(stale)
+            if record is not None and record["expires_at"] > time.time():
+                if not lease_path.exists():
+                    os.rename(stale, lease_path)
+                return False
+            stale.unlink(missing_ok=True)
+            if not self._create(lease_path, key):
+                return False
+
+        # Il nodo precedente potrebbe aver completato l'immagine subito prima di perdere il lease
+        if self._file(key, ".done").exists():
+            lease_path.unlink(missing_ok=True)
+            return False
+
+        with self._lock:
+            self._held[key] = str(image_path)
+            self._lost.discard(key)
+        self._start_heartbeat()
+        return True
+
+    def lost(self, image_path: Path) -> bool:
+        """
+        Whether the heartbeat found the lease of an image taken over by another node: the
+        image is no longer ours to publish or complete.
+        """
+        with self._lock:
+            return self.key(image_path) in self._lost
+
+    def _owns(self, key: str) -> bool:
+        record = self._read(self._file(key, ".lease"))
+        return record is not None and record.get("token") == self.token
+
+    def release(self, image_path: Path):
+        """
+        Give up the lease without marking the image done (e.g. after a failure).
+        """
+        key = self.key(image_path)
+        with self._lock:
+            self._held.pop(key, None)
+            self._lost.discard(key)
+        if self._owns(key):
+            self._file(key, ".lease").unlink(missing_ok=True)
+
+    def break_lease(self, image_path: Path, node_id: str) -> bool:
+        """
+        Drop the lease of an image held by `node_id`, a process known to be dead (e.g. a
+        crashed worker of this node), without waiting for it to expire.
+
+        Returns:
+            bool: True if the lease was held by `node_id` and has been removed.
+        """
+        lease_path = self._file(self.key(image_path), ".lease")
+        record = self._read(lease_path)
+        if record is None or record.get("node") != node_id:
+            return False
+        lease_path.unlink(missing_ok=True)
+        return True
+
+    def complete(self, image_path: Path):
+        """
+        Record the image as finished and drop its lease.
+        """
+        key = self.key(image_path)
+        done_path = self._file(key, ".done")
+        tmp = done_path.with_name(f"{done_path.name}.{self.token}.tmp")
+        tmp.write_text(json.dumps({"image": key, "node": self.node_id, "finished_at": time.time()}),
+                       encoding="utf-8")
+        os.replace(tmp, done_path)
+        self.release(image_path)
+
+    def renew(self) -> list[str]:
+        """
+        Extend the expiry of every held lease.
+
+        Returns:
+            list[str]: Keys of the leases lost to another node (expired before renewal).
+        """
+        with self._lock:
+            keys = list(self._held)
+        lost = [key for key in keys if not self._renew(key)]
+        with self._lock:
+            # Un lease rilasciato durante il rinnovo non è perso
+            lost = [key for key in lost if self._held.pop(key, None) is not None]
+            self._lost.update(lost)
+        return lost
+
+    def _renew(self, key: str) -> bool:
+        lease_path = self._file(key, ".lease")
+        if not self._owns(key):
+            return False
+        # Rinnovo sul posto: il file resta presente, nessun altro nodo può crearlo nel frattempo
+        try:
+            os.utime(lease_path)
+        except FileNotFoundError:
+            return False
+        except OSError:
+            return True  # file in uso (Windows): nuovo tentativo al prossimo heartbeat
+        # Ripreso tra il controllo e il rinnovo (era già scaduto): il rinnovo è andato all'altro nodo
+        return self._owns(key)
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._heartbeat_loop, name="lease-heartbeat", daemon=True)
+            self._thread.start()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat):
+            for key in self.renew():
+                print(f"⚠️ Lease perso per {key}: scaduto e preso da un altro nodo, l'immagine non verrà pubblicata")
+
+    def held(self) -> list[str]:
+        with self._lock:
+            return list(self._held)
+
+    def stop(self):
+        """
+        Stop the heartbeat and release every lease still held.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for key in self.held():
+            with self._lock:
+                self._held.pop(key, None)
+            if self._owns(key):
+                self._file(key, ".lease").unlink(missing_ok=True)
@@ -1,109 +1,457 @@
+import os
 import sys
 import time
-import csv
 import json
 import argparse
+import threading
 
 from pathlib import Path
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from multiprocessing import Pool, set_start_method, Manager
+from multiprocessing import Manager
 from functools import partial
-from more_itertools import chunked
-from math import ceil
+from collections import Counter
+from datetime import datetime
+from queue import Empty
 
 from src.utils import *
 from src.paths import *
 from src.config import *
-from src.estimate_ppi_from_ruler import *
-from src.worker import ImageWorker
-from logs.logger import CSVLogger
-from model.SR_Script.super_resolution import SA_SuperResolution
-from benchmark.benchmark import benchmark
-
-MAX_ATTEMPTS = 10
-RETRY_DELAY = 5  # seconds
-
-# Modifica della funzione per aggiornare via queue
-def process_batch(images, threads, super_resolution_dir, downscaling_dir, model_path, logger_path, progress_queue):
-    model = SA_SuperResolution(
-        models_dir=model_path,
-        model_scale=SUPER_RESOLUTION_PAR,
-        tile_size=128,
-        gpu_id=0,
-        verbosity=False,
-    )
-    logger = CSVLogger(logger_path)
-    worker = ImageWorker(logger, super_resolution_dir, downscaling_dir, model)
-
+from src import tracing
+from src.scheduler import (MemoryAdmission, memory_budget_bytes, read_image_sizes, plan_memory_job,
+                           order_largest_first)
+from src.profiling import SamplingProfiler, merge_profiles, format_profile_report, profile_path
+from src.metrics import MetricsSink, load_metrics, summarize_metrics, print_metrics_summary
+from src.output_planner import plan_output
+from src.core_budget import plan_threads, current_plan
+from src.supervisor import WorkerSupervisor
+from logs.logger import LogAggregator, QueueLogger, log_path_for_backend
+
+# torch, onnxruntime, cv2 e cryptography vengono importati solo negli stage che li usano:
+# l'avvio (e il controllo di un albero già elaborato) resta sotto IMPORT_TIME_BUDGET_S.
+# Verificare con: python -m benchmark.import_time
+
+def load_sr_model(model_path, sr_scale=SUPER_RESOLUTION_PAR, trace_dir=None, trace_tiles=False):
+    from model.SR_Script.super_resolution import SA_SuperResolution
+
+    # Thread ORT dalla quota di core del processo (applicata all'avvio del processo worker)
+    plan = current_plan()
+    with tracing.span("load_model"):
+        model = SA_SuperResolution(
+            models_dir=model_path,
+            model_scale=sr_scale,
+            tile_size=SR_TILE_SIZE,
+            tile_overlap=SR_TILE_OVERLAP,
+            blank_tile_variance=SR_BLANK_TILE_VARIANCE,
+            tile_memo=SR_TILE_MEMO,
+            model_variant=SR_MODEL_VARIANT,
+            intra_op_threads=plan.intra_op_threads if plan is not None else None,
+            gpu_id=0,
+            verbosity=False,
+        )
+    if trace_dir is not None:
+        model.span_hook = tracing.span
+        model.trace_tiles = trace_tiles
+    return model
+
+# Ogni thread di ogni processo preleva la prossima immagine dalla coda condivisa
+def process_batch(work_queue, threads, super_resolution_dir, downscaling_dir, model_path, log_queue,
+                  ppi, run_id, trace_dir=None, trace_tiles=False, profile_dir=None,
+                  memory_admission=None, memory_jobs=None, output_plan=None, target_dirs=None, lease_dir=None,
+                  staging_dir=None, control=None):
+    from src.worker import ImageWorker
+    from src.leases import LeaseManager
+    from src.staging import StagingCache
+    from src.integrity import OutputState
+    from src.retry import Quarantine
+
+    profiler = None
+    if profile_dir is not None:
+        profiler = SamplingProfiler()
+        profiler.start()
+
+    if trace_dir is not None:
+        tracing.enable(trace_dir, process_name=f"process_batch {os.getpid()}")
+
+    model = None
+    # Con il piano "direct" il modello non serve: le immagini vengono solo ridimensionate
+    if output_plan is None or output_plan.method == "sr":
+        model = load_sr_model(model_path, output_plan.sr_scale if output_plan is not None else SUPER_RESOLUTION_PAR,
+                              trace_dir, trace_tiles)
+    logger = QueueLogger(log_queue)
+    metrics_sink = MetricsSink(run_id)
+    # Un gestore dei lease (e un heartbeat) per processo
+    leases = LeaseManager(lease_dir) if lease_dir is not None else None
+    staging = StagingCache(staging_dir) if staging_dir is not None else None
+    output_state = OutputState(run_id=run_id) if VERIFY_OUTPUT_CHECKSUMS else None
+    quarantine = Quarantine()
+    worker = ImageWorker(logger, super_resolution_dir, downscaling_dir, model, ppi, metrics_sink=metrics_sink,
+                         memory_admission=memory_admission, memory_jobs=memory_jobs, output_plan=output_plan,
+                         target_dirs=target_dirs, leases=leases, staging=staging, output_state=output_state,
+                         quarantine=quarantine)
+
+    # Inizio e fine di ogni immagine segnalati al supervisore, che può chiedere il riciclo del processo
+    callbacks = (control.started, control.done, control.should_stop) if control is not None else ()
     with ThreadPoolExecutor(max_workers=threads) as executor:
-        futures = {executor.submit(worker.run, img): img for img in images}
-
+        futures = [executor.submit(worker.run_from_queue, work_queue, *callbacks) for _ in range(threads)]
         for future in as_completed(futures):
-            img = futures[future]
+            future.result()
+
+    counts = dict(worker.counts)
+    if staging is not None:
+        # Gli output sono completi solo quando tutti gli upload sono terminati
+        with tracing.span("staging_flush"):
+            staging.close()
+        counts["staging"] = staging.stats()
+    if leases is not None:
+        leases.stop()
+    if output_state is not None:
+        output_state.close()
+    quarantine.close()
+    logger.stop()
+    tracing.flush()
+
+    if profiler is not None:
+        profiler.stop()
+        profiler.dump(profile_path(profile_dir, "process_batch"))
+
+    if control is not None:
+        control.exit(counts)
+    return counts
+
+# Modalità --watch: un processo del pool resta attivo tra una cartella e l'altra
+def process_stream(work_queue, threads, super_resolution_dir, downscaling_dir, model_path, log_queue,
+                   run_id, memory_admission=None, target_dirs=None, lease_dir=None, control=None):
+    """
+    Long-lived worker process: models stay loaded between folders.
+
+    Work items are (image_path, ppi, output_plan, memory_job) tuples, terminated by one
+    `None` per thread or by a recycling request of `control`, which is told when each
+    image starts and finishes.
+    """
+    from src.worker import ImageWorker
+    from src.leases import LeaseManager
+    from src.integrity import OutputState
+    from src.retry import Quarantine
+
+    logger = QueueLogger(log_queue)
+    metrics_sink = MetricsSink(run_id)
+    leases = LeaseManager(lease_dir) if lease_dir is not None else None
+    output_state = OutputState(run_id=run_id) if VERIFY_OUTPUT_CHECKSUMS else None
+    quarantine = Quarantine()
+    # Modello di riferimento caricato subito, così la prima cartella non attende
+    models = {SUPER_RESOLUTION_PAR: load_sr_model(model_path)}  # scala -> modello
+    workers = {}  # (PPI, piano) -> ImageWorker
+    lock = threading.Lock()
+
+    def get_worker(ppi, plan):
+        key = (ppi, plan.name if plan is not None else None)
+        with lock:
+            if key not in workers:
+                model = None
+                if plan is None or plan.method == "sr":
+                    scale = plan.sr_scale if plan is not None else SUPER_RESOLUTION_PAR
+                    if scale not in models:
+                        models[scale] = load_sr_model(model_path, scale)
+                    model = models[scale]
+                workers[key] = ImageWorker(logger, super_resolution_dir, downscaling_dir, model, ppi,
+                                           metrics_sink=metrics_sink, memory_admission=memory_admission,
+                                           output_plan=plan, target_dirs=target_dirs, leases=leases,
+                                           output_state=output_state, quarantine=quarantine)
+            return workers[key]
+
+    def consume():
+        while not control.should_stop():
             try:
-                future.result()
+                item = work_queue.get(timeout=0.5)
+            except Empty:
+                continue
+            if item is None:
+                return
+            image_path, ppi, plan, job = item
+            control.started(image_path)
+            status = "failed"
+            try:
+                worker = get_worker(ppi, plan)
+                if job is not None:
+                    worker.memory_jobs[image_path] = job
+                status = worker.run(image_path)
+                worker.memory_jobs.pop(image_path, None)
             except Exception as e:
-                logger.log(img.name, "run", success=False, error=f"Thread error: {e}")
-            finally:
-                progress_queue.put(1)  # segnala un'immagine completata
+                logger.log(image_path.name, "run", success=False, error=f"Thread error: {e}")
+            control.done(image_path, status)
 
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(consume) for _ in range(threads)]
+        for future in as_completed(futures):
+            future.result()
+
+    counts = {}
+    for worker in workers.values():
+        for key, value in worker.counts.items():
+            counts[key] = counts.get(key, 0) + value
+    if leases is not None:
+        leases.stop()
+    if output_state is not None:
+        output_state.close()
+    quarantine.close()
     logger.stop()
-
-def run_standard_processing(processes, threads):
-    print("🔍 Caricamento modello di super-risoluzione (test iniziale)...")
-    try:
-        _ = SA_SuperResolution(
-            models_dir=SR_SCRIPT_MODEL_DIR,
-            model_scale=SUPER_RESOLUTION_PAR,
-            tile_size=128,
-            gpu_id=0,
-            verbosity=True,
-        )
-    except Exception as e:
-        raise RuntimeError(f"Errore nel caricamento modello SR: {e}")
+    control.exit(counts)
+
+def open_metadata_index(root=INPUT_IMAGES_DIR):
+    if not USE_METADATA_INDEX:
+        return None
+    from src.metadata_manager import MetadataIndex
+
+    index = MetadataIndex()
+    with tracing.span("metadata_index"):
+        stats = index.update(root)
+    print(f"🗂️  Indice metadati: {stats['indexed']} header letti, {stats['unchanged']} invariati "
+          f"({stats['seconds']:.1f}s)")
+    return index
+
+def summarize_staging(folder_stats: list[dict]) -> dict:
+    prefetch = [s["prefetch"] for s in folder_stats]
+    uploads = [u for s in folder_stats for u in s["uploads"]]
+
+    def rate(items, mb_key="mb"):
+        mb = sum(item[mb_key] for item in items)
+        seconds = sum(item[mb_key] / item["mb_s"] for item in items if item["mb_s"])
+        return mb, mb / seconds if seconds else 0.0
+
+    prefetch_mb, prefetch_mb_s = rate(prefetch)
+    upload_mb, upload_mb_s = rate(uploads)
+    return {
+        "prefetch_files": sum(p["files"] for p in prefetch),
+        "prefetch_failed": sum(p["failed"] for p in prefetch),
+        "prefetch_mb": prefetch_mb,
+        "prefetch_mb_s": prefetch_mb_s,
+        "prefetch_max_depth": max((p["max_depth"] for p in prefetch), default=0),
+        "prefetch_window": max((p["window"] for p in prefetch), default=0),
+        "staged_reads": sum(u["staged_reads"] for u in uploads),
+        "input_waits": sum(u["input_waits"] for u in uploads),
+        "input_wait_s": sum(u["input_wait_s"] for u in uploads),
+        "input_timeouts": sum(u["input_timeouts"] for u in uploads),
+        "upload_files": sum(u["files"] for u in uploads),
+        "upload_failed": sum(u["failed"] for u in uploads),
+        "upload_mb": upload_mb,
+        "upload_mb_s": upload_mb_s,
+        "upload_max_pending": max((u["max_pending"] for u in uploads), default=0),
+    }
+
+def print_staging_summary(stats: dict):
+    print("\n💾 Staging locale:")
+    print(f"   Prefetch: {stats['prefetch_files']} file, {stats['prefetch_mb']:.0f} MB a {stats['prefetch_mb_s']:.1f} MB/s "
+          f"(finestra {stats['prefetch_window']}, profondità massima {stats['prefetch_max_depth']}, "
+          f"falliti {stats['prefetch_failed']})")
+    print(f"   Letture locali: {stats['staged_reads']} | attese dell'input: {stats['input_waits']} "
+          f"({stats['input_wait_s']:.1f}s, {stats['input_timeouts']} scadute con lettura dalla share)")
+    print(f"   Upload: {stats['upload_files']} file, {stats['upload_mb']:.0f} MB a {stats['upload_mb_s']:.1f} MB/s "
+          f"(coda massima {stats['upload_max_pending']}, falliti {stats['upload_failed']})")
+
+def cleanup_intermediates(super_resolution_dir, output_roots):
+    """
+    Remove the raw SR intermediates whose images have every final output.
+    """
+    if SR_INTERMEDIATE_FORMAT != "npy" or INTERMEDIATE_KEEP_COMPLETED or not Path(super_resolution_dir).exists():
+        return
+    from src.intermediates import IntermediateStore, final_name
+    store = IntermediateStore(super_resolution_dir)
+    removed = store.cleanup_completed(lambda p: [root / p.parent.name / final_name(p) for root in output_roots])
+    if removed:
+        print(f"🧹 Rimossi {removed} intermedi SR di immagini completate")
+
+
+def find_images_to_process(folder, output_roots, leases=None, quarantined=None):
+    images_to_process = []
+    for img in folder.glob("*"):
+        if quarantined and str(img) in quarantined:
+            continue  # file di input non elaborabile in un'esecuzione precedente
+        # Solo estensione e stat: la decodifica (e la quarantena dei file corrotti) spetta al worker
+        if img.suffix.lower() not in INPUT_IMAGE_SUFFIXES or not img.is_file():
+            continue
+        rel = img.relative_to(INPUT_IMAGES_DIR)
+        subdir = rel.parent
+        if all((root / subdir / img.name).exists() for root in output_roots):
+            continue
+        if leases is not None and leases.is_done(img):
+            continue  # completata da un altro nodo
+        images_to_process.append(img)
+    return images_to_process
+
+def print_thread_plans(plans):
+    print(f"🧵 Piano dei thread ({len(plans)} processi):")
+    for plan in plans:
+        print(f"   {plan.describe()}")
+
+def print_worker_stats(stats: dict):
+    if not any(stats.values()):
+        return
+    print(f"🔄 Processi worker: {stats['restarts']} sostituiti dopo un crash, {stats['recycles']} riciclati, "
+          f"{stats['requeued']} immagini rimesse in coda, {stats['lost']} in quarantena per crash ripetuti")
+
+def run_audit(target_ppis=None):
+    """
+    Decode every output and compare it with the size and checksum in the run state;
+    invalid outputs are removed so the next run produces them again.
+    """
+    from src.integrity import OutputState, audit_outputs
+
+    _, downscaling_dir = find_output_dir()
+    target_dirs = find_ppi_output_dirs(downscaling_dir, target_ppis) if target_ppis else None
+    output_roots = list(target_dirs.values()) if target_dirs else [downscaling_dir]
+
+    print(f"🔎 Audit degli output in {', '.join(str(root) for root in output_roots)}...")
+    state = OutputState()
+    stats = audit_outputs(output_roots, is_valid_image_file, state)
+    state.close()
+
+    for path, err in stats["errors"].items():
+        print(f"❌ {path}: {err} (rimosso)")
+    print(f"✅ Audit completato: {stats['checked']} output verificati, {stats['invalid']} non validi, "
+          f"{stats['recorded']} registrati nello stato, {stats['partial']} file temporanei rimossi")
+
+def load_quarantine(retry_quarantined=False, report=True) -> dict:
+    """
+    Images in quarantine (skipped by this run), after releasing them all if requested.
+    """
+    from src.retry import Quarantine
+
+    quarantine = Quarantine()
+    if retry_quarantined:
+        released = quarantine.release()
+        if released:
+            print(f"🔓 {released} immagini tolte dalla quarantena")
+    entries = quarantine.entries()
+    quarantine.close()
+    if entries and report:
+        print(f"🚫 {len(entries)} immagini in quarantena per errori del file di input (--retry-quarantined per riprovarle)")
+    return entries
+
+def run_standard_processing(processes, threads, trace=False, trace_tiles=False, profile=False,
+                            memory_budget_gb=MEMORY_BUDGET_GB, target_ppis=None, distributed=False,
+                            staging=STAGING_ENABLED, intra_op_threads=None, retry_quarantined=False):
+    run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    trace_dir = TRACE_DIR / run_id if trace else None
+    profile_dir = PROFILE_DIR / run_id if profile else None
+    if trace_dir is not None:
+        tracing.enable(trace_dir, process_name="main")
 
     print("\n📂 Scansione cartelle da elaborare...")
 
     super_resolution_dir, downscaling_dir = find_output_dir()
+    # Con --ppi ogni PPI richiesto ha la sua cartella di output
+    target_dirs = find_ppi_output_dirs(downscaling_dir, target_ppis) if target_ppis else None
+    output_roots = list(target_dirs.values()) if target_dirs else [downscaling_dir]
     folders = [f for f in INPUT_IMAGES_DIR.rglob("*") if f.is_dir()]
     folder_to_images = {}
 
+    lease_dir = None
+    leases = None
+    if distributed:
+        from src.leases import LeaseManager
+        lease_dir = LEASE_DIR
+        leases = LeaseManager(lease_dir)
+        print(f"🤝 Modalità distribuita: nodo {leases.node_id}, lease in {lease_dir}")
+
+    quarantined = load_quarantine(retry_quarantined)
     for folder in folders:
-        images = [
-            img for img in folder.glob("*")
-            if is_valid_image_file(img)
-        ]
-        images_to_process = []
-        for img in images:
-            rel = img.relative_to(INPUT_IMAGES_DIR)
-            subdir = rel.parent
-            out_path = downscaling_dir / subdir / img.name
-            if not out_path.exists():
-                images_to_process.append(img)
+        images_to_process = find_images_to_process(folder, output_roots, leases, quarantined)
         if images_to_process:
             folder_to_images[folder] = images_to_process
 
     if not folder_to_images:
         print("✅ Tutte le immagini risultano già elaborate.")
+        cleanup_intermediates(super_resolution_dir, output_roots)
         return
 
+    from model.SR_Script.super_resolution import SA_SuperResolution
+    from src.estimate_ppi_from_ruler import estimate_ppi_for_folder
+
+    print("🔍 Caricamento modello di super-risoluzione (test iniziale)...")
+    try:
+        _ = SA_SuperResolution(
+            models_dir=SR_SCRIPT_MODEL_DIR,
+            model_scale=SUPER_RESOLUTION_PAR,
+            tile_size=SR_TILE_SIZE,
+            tile_overlap=SR_TILE_OVERLAP,
+            model_variant=SR_MODEL_VARIANT,
+            gpu_id=0,
+            verbosity=True,
+        )
+    except Exception as e:
+        raise RuntimeError(f"Errore nel caricamento modello SR: {e}")
+
     manager = Manager()
-    progress_queue = manager.Queue()
+
+    # Unico scrittore del log per tutti i processi
+    log_aggregator = LogAggregator(
+        log_path_for_backend(CSV_LOG_PATH, LOG_BACKEND),
+        log_queue=manager.Queue(),
+        backend=LOG_BACKEND,
+        batch_size=LOG_BATCH_SIZE,
+        flush_interval=LOG_FLUSH_INTERVAL,
+    )
+
+    # Budget di RAM condiviso da tutti i processi e thread
+    budget = memory_budget_bytes(memory_budget_gb)
+    memory_admission = MemoryAdmission(budget, lock=manager.Lock(), used=manager.Value("q", 0),
+                                       holders=manager.dict())
+    print(f"🧠 Budget di memoria: {budget / 1024 ** 3:.1f} GB")
+
+    # Core ripartiti tra i processi: i thread di ORT, cv2 e torch insieme non superano il budget
+    thread_plans = plan_threads(processes, threads, intra_op_threads=intra_op_threads)
+    print_thread_plans(thread_plans)
+
+    # Dimensioni e risoluzioni dagli header indicizzati, senza riaprire le immagini
+    index = open_metadata_index()
+
+    run_start = time.perf_counter()
 
     total_success = 0
     total_error = 0
+    total_remote = 0
+    total_retried = 0
+    total_quarantined = 0
+    output_plans = {}
+    staging_stats = []
+    worker_stats = Counter()
+    from src.retry import Quarantine
+    # Immagini che fanno cadere il processo worker: in quarantena come i file di input non elaborabili
+    quarantine = Quarantine()
 
     for folder, images in folder_to_images.items():
         print(f"\n📂 Cartella: {folder} ({len(images)} immagini da processare)")
 
-        ppi = estimate_ppi_for_folder(folder)
+        with tracing.span("estimate_ppi", folder=folder.name):
+            ppi = estimate_ppi_for_folder(folder, index)
         if not ppi:
             print(f"⚠️ Impossibile stimare PPI per {folder}. Skip cartella.")
             continue
 
-        chunk_size = ceil(len(images) / processes)
-        chunks = list(chunked(images, chunk_size))
+        sizes = read_image_sizes(images, index)
+        # Piano di output scelto prima dell'inferenza, in base al fattore netto richiesto dal PPI
+        output_plan = plan_output(ppi, sizes, target_ppis=target_ppis)
+        output_plans[folder.name] = output_plan.to_dict()
+        print(f"   🗺️  Piano di output: {output_plan.describe()}")
+
+        memory_jobs = {
+            img: plan_memory_job(img, size, budget, scale=output_plan.sr_scale or 1)
+            for img, size in sizes.items()
+        }
+        strips = sum(1 for job in memory_jobs.values() if job.mode == "strips")
+        if strips:
+            print(f"   🧩 {strips} immagini superano da sole il budget: elaborazione a strisce")
+
+        # Immagini distribuite ai processi in ordine di megapixel decrescenti (LPT)
+        ordered = order_largest_first(images, sizes)
+
+        prefetcher = None
+        if staging:
+            from src.staging import Prefetcher
+            # Finestra: le immagini in elaborazione più STAGING_READ_AHEAD in attesa
+            prefetcher = Prefetcher(STAGING_DIR, window=STAGING_READ_AHEAD + processes * threads)
+            prefetcher.start(ordered)
 
         target = partial(
             process_batch,
@@ -111,105 +459,291 @@ def run_standard_processing(processes, threads):
             super_resolution_dir=super_resolution_dir,
             downscaling_dir=downscaling_dir,
             model_path=SR_SCRIPT_MODEL_DIR,
-            logger_path=CSV_LOG_PATH,
-            progress_queue=progress_queue,
+            log_queue=log_aggregator.queue,
+            ppi=ppi,
+            run_id=run_id,
+            trace_dir=trace_dir,
+            trace_tiles=trace_tiles,
+            profile_dir=profile_dir,
+            memory_admission=memory_admission,
+            memory_jobs=memory_jobs,
+            output_plan=output_plan,
+            target_dirs=target_dirs,
+            lease_dir=lease_dir,
+            staging_dir=STAGING_DIR if staging else None,
         )
 
+        # Processi supervisionati: uno che cade viene sostituito e solo le sue immagini tornano in coda
+        supervisor = WorkerSupervisor(target, processes, threads, manager, plans=thread_plans,
+                                      memory_admission=memory_admission, leases=leases, quarantine=quarantine,
+                                      release_inputs=prefetcher.release if prefetcher is not None else None)
+        statuses = Counter()
         try:
-            set_start_method("spawn", force=True)
-            with Pool(processes) as pool:
-                result = pool.map_async(target, chunks)
-
-                completed = 0
+            with tracing.span("folder", folder=folder.name, images=len(images)):
+                supervisor.submit(ordered)
+                supervisor.start()
                 with tqdm(total=len(images), desc="📷 Immagini elaborate", ncols=80) as pbar:
-                    while completed < len(images):
-                        try:
-                            progress_queue.get(timeout=1)
-                            completed += 1
+                    while supervisor.busy():
+                        for _, status in supervisor.poll(timeout=1.0):
+                            statuses[status] += 1
                             pbar.update(1)
-                        except:
-                            if result.ready():
-                                while not progress_queue.empty():
-                                    progress_queue.get_nowait()
-                                    completed += 1
-                                    pbar.update(1)
-                                break
-                            continue
-                result.wait()
+                supervisor.stop()
         except KeyboardInterrupt:
+            supervisor.terminate()
             print("\n[🚪] Interrotto manualmente dall'utente. Uscita.")
+            log_aggregator.stop()
             sys.exit(0)
-
-        # Conta successi e fallimenti per questa cartella
-        folder_error_count = 0
-        if CSV_LOG_PATH.exists():
-            with open(CSV_LOG_PATH, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                folder_error_count = sum(
-                    1 for row in reader
-                    if row["status"] == "false" and Path(row["filename"]).parent.name == folder.name
-                )
-
-        folder_success = len(images) - folder_error_count
+        except Exception:
+            supervisor.terminate()
+            raise
+
+        # Esiti dai messaggi dei worker: restano validi anche per le immagini di un processo poi caduto
+        batch_counts = supervisor.results
+        if prefetcher is not None:
+            prefetcher.stop()
+            staging_stats.append({"prefetch": prefetcher.stats(),
+                                  "uploads": [c["staging"] for c in batch_counts if "staging" in c]})
+        folder_success = statuses["ok"] + statuses["skipped"]
+        folder_remote = statuses["remote"]
+        folder_error_count = len(images) - folder_success - folder_remote
         total_success += folder_success
         total_error += folder_error_count
+        total_remote += folder_remote
+        total_retried += sum(c["retried"] for c in batch_counts)
+        total_quarantined += sum(c["quarantined"] for c in batch_counts) + supervisor.stats["lost"]
+        worker_stats.update(supervisor.stats)
 
-        print(f"   ✅ Successi: {folder_success} | ❌ Errori: {folder_error_count}")
+        print(f"   ✅ Successi: {folder_success} | ❌ Errori: {folder_error_count}"
+              + (f" | 🤝 Altri nodi: {folder_remote}" if distributed else ""))
 
     print("\n📊 Risultato finale:")
     print(f"✅ Immagini processate con successo: {total_success}")
     print(f"❌ Immagini con errore:              {total_error}")
+    if distributed:
+        print(f"🤝 Immagini elaborate da altri nodi: {total_remote}")
+    if total_retried or total_quarantined:
+        print(f"🔁 Nuovi tentativi per errori transitori: {total_retried}")
+        print(f"🚫 Immagini messe in quarantena:         {total_quarantined}")
+    worker_stats = {key: worker_stats[key] for key in ("restarts", "recycles", "requeued", "lost")}
+    print_worker_stats(worker_stats)
+
+    summary = summarize_metrics(load_metrics(run_id), wall_time=time.perf_counter() - run_start)
+    print_metrics_summary(summary)
+    summary["output_plans"] = output_plans
+    summary["thread_plan"] = [plan.to_dict() for plan in thread_plans]
+    summary["retries"] = {"retried": total_retried, "quarantined": total_quarantined}
+    summary["workers"] = worker_stats
+    if staging_stats:
+        summary["staging"] = summarize_staging(staging_stats)
+        print_staging_summary(summary["staging"])
+    METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    with (METRICS_DIR / f"{run_id}_summary.json").open("w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=4)
+
+    if trace_dir is not None:
+        tracing.flush()
+        trace_path = tracing.merge_traces(trace_dir, TRACE_DIR / f"{run_id}.json")
+        print(f"🧭 Trace salvata in {trace_path} (aprire con Perfetto o chrome://tracing)")
+
+    if profile_dir is not None and profile_dir.exists():
+        report = format_profile_report(merge_profiles(profile_dir))
+        report_path = PROFILE_DIR / f"{run_id}_report.txt"
+        report_path.write_text(report, encoding="utf-8")
+        print(f"\n🔬 Funzioni più costose (tempo cumulativo su tutti i worker):\n{report}")
+        print(f"🔬 Report completo salvato in {report_path}")
+
+    if index is not None:
+        index.close()
+    quarantine.close()
+    log_aggregator.stop()
+    print(f"📜 Log scritto in {log_aggregator.path} ({log_aggregator.rows_written} righe)")
+
+    cleanup_intermediates(super_resolution_dir, output_roots)
+
+
+def run_daemon(processes, threads, memory_budget_gb=MEMORY_BUDGET_GB, target_ppis=None, distributed=False,
+               intra_op_threads=None):
+    """
+    Watch the input tree and process each folder as soon as its copy has settled,
+    on a pool of worker processes that stays up, with the model loaded, between folders.
+    """
+    from src.watcher import FolderWatcher
+    from src.estimate_ppi_from_ruler import estimate_ppi_for_folder
+
+    run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    super_resolution_dir, downscaling_dir = find_output_dir()
+    target_dirs = find_ppi_output_dirs(downscaling_dir, target_ppis) if target_ppis else None
+    output_roots = list(target_dirs.values()) if target_dirs else [downscaling_dir]
 
-    resort_csv_log()
+    lease_dir = None
+    leases = None
+    if distributed:
+        from src.leases import LeaseManager
+        lease_dir = LEASE_DIR
+        leases = LeaseManager(lease_dir)
+        print(f"🤝 Modalità distribuita: nodo {leases.node_id}, lease in {lease_dir}")
 
-    #shutil.rmtree(OUTPUT_TMP_DIR)
+    manager = Manager()
+    log_aggregator = LogAggregator(
+        log_path_for_backend(CSV_LOG_PATH, LOG_BACKEND),
+        log_queue=manager.Queue(),
+        backend=LOG_BACKEND,
+        batch_size=LOG_BATCH_SIZE,
+        flush_interval=LOG_FLUSH_INTERVAL,
+    )
+    budget = memory_budget_bytes(memory_budget_gb)
+    memory_admission = MemoryAdmission(budget, lock=manager.Lock(), used=manager.Value("q", 0),
+                                       holders=manager.dict())
+
+    target = partial(
+        process_stream,
+        threads=threads,
+        super_resolution_dir=super_resolution_dir,
+        downscaling_dir=downscaling_dir,
+        model_path=SR_SCRIPT_MODEL_DIR,
+        log_queue=log_aggregator.queue,
+        run_id=run_id,
+        memory_admission=memory_admission,
+        target_dirs=target_dirs,
+        lease_dir=lease_dir,
+    )
+    thread_plans = plan_threads(processes, threads, intra_op_threads=intra_op_threads)
+    print_thread_plans(thread_plans)
+    from src.retry import Quarantine
+    quarantine = Quarantine()
+    supervisor = WorkerSupervisor(target, processes, threads, manager, plans=thread_plans,
+                                  memory_admission=memory_admission, leases=leases, quarantine=quarantine)
+    supervisor.start()
+
+    index = open_metadata_index()
+    watcher = FolderWatcher()
+    watcher.start()
+    print(f"👀 In attesa di nuove cartelle in {INPUT_IMAGES_DIR} (Ctrl+C per uscire)...")
+
+    in_flight = {}  # immagine -> cartella
+    folders = {}    # cartella -> {"remaining", "failed", "detected"}
+    try:
+        while True:
+            # Scansione della share solo quando dovuta: tra una e l'altra si raccolgono gli esiti
+            for folder in (watcher.poll() if watcher.due() else []):
+                images = [img for img in find_images_to_process(folder, output_roots, leases, load_quarantine(report=False))
+                          if img not in in_flight]
+                if not images:
+                    continue
+                if index is not None:
+                    index.update(folder)
+                ppi = estimate_ppi_for_folder(folder, index)
+                if not ppi:
+                    print(f"⚠️ Impossibile stimare PPI per {folder}. Skip cartella.")
+                    continue
+
+                sizes = read_image_sizes(images, index)
+                output_plan = plan_output(ppi, sizes, target_ppis=target_ppis)
+                print(f"\n📂 Nuova cartella: {folder} ({len(images)} immagini) - piano {output_plan.describe()}")
+                items = []
+                for img in order_largest_first(images, sizes):
+                    job = plan_memory_job(img, sizes.get(img), budget, scale=output_plan.sr_scale or 1)
+                    items.append((img, ppi, output_plan, job))
+                    in_flight[img] = folder
+                supervisor.submit(items)
+                state = folders.setdefault(folder, {"remaining": 0, "failed": 0, "detected": time.perf_counter()})
+                state["remaining"] += len(images)
+
+            # Con immagini in corso l'avanzamento viene atteso fino a un secondo
+            for image_path, status in supervisor.poll(timeout=1.0 if in_flight else 0):
+                state = folders[in_flight.pop(image_path)]
+                state["remaining"] -= 1
+                state["failed"] += status == "failed"
+            for folder, state in list(folders.items()):
+                if state["remaining"] == 0:
+                    elapsed = time.perf_counter() - state["detected"]
+                    print(f"   ✅ {folder.name} completata in {elapsed:.0f}s (❌ errori: {state['failed']})")
+                    del folders[folder]
+
+            if not in_flight:
+                watcher.wait()
+    except KeyboardInterrupt:
+        print("\n[🚪] Interrotto manualmente dall'utente. Uscita.")
+    finally:
+        watcher.stop()
+        if index is not None:
+            index.close()
+        supervisor.terminate()
+        quarantine.close()
+        print_worker_stats(supervisor.stats)
+        log_aggregator.stop()
 
 
 def main():
     parser = argparse.ArgumentParser(description="Processa immagini o esegui benchmark.")
     parser.add_argument("--benchmark", action="store_true", help="Esegui benchmark multiprocesso e multithread")
+    parser.add_argument("--memory-benchmark", action="store_true", help="Misura il picco di memoria su scansioni sintetiche")
+    parser.add_argument("--sizes", type=int, nargs="+", help="Megapixel delle scansioni sintetiche per --memory-benchmark (default: 10-300)")
+    parser.add_argument("--memory-budget-gb", type=float, default=MEMORY_BUDGET_GB, help="RAM massima per le immagini in elaborazione (default: frazione della RAM fisica)")
+    parser.add_argument("--trace", action="store_true", help="Registra una trace Chrome/Perfetto di tutti gli stage")
+    parser.add_argument("--trace-tiles", action="store_true", help="Con --trace, registra anche attesa lock e inferenza di ogni tile")
+    parser.add_argument("--profile", action="store_true", help="Profila ogni worker a campionamento e stampa un report aggregato")
+    parser.add_argument("--watch", action="store_true", help="Resta in ascolto ed elabora le nuove cartelle appena la copia è completa")
+    parser.add_argument("--staging", action=argparse.BooleanOptionalAction, default=STAGING_ENABLED, help="Copia gli input su disco locale in anticipo e carica gli output sulla share in background (--no-staging per disattivarlo)")
+    parser.add_argument("--distributed", action="store_true", help="Coordina più nodi sullo stesso input con lease in LEASE_DIR (share condivisa)")
+    parser.add_argument("--ppi", type=int, nargs="+", help="PPI di destinazione (es. 400 600): una sola SR, un output per PPI in cartelle separate")
+    parser.add_argument("--audit", action="store_true", help="Decodifica tutti gli output, li confronta con i checksum registrati e rimuove quelli non validi")
+    parser.add_argument("--retry-quarantined", action="store_true", help="Riprova anche le immagini in quarantena per errori del file di input")
     args = parser.parse_args()
 
+    if args.audit:
+        run_audit(args.ppi)
+        return
+
+    if args.memory_benchmark:
+        from benchmark.memory_benchmark import memory_benchmark, DEFAULT_SIZES_MP
+        memory_benchmark(args.sizes or DEFAULT_SIZES_MP)
+        return
+
     if args.benchmark:
-        benchmark()
+        from benchmark.benchmark import benchmark
+        benchmark(trace=args.trace, trace_tiles=args.trace_tiles, profile=args.profile)
         return
 
     if not JSON_BENCHMARK_BEST_CONFIG_PATH.exists():
         print("⚠️ Nessuna configurazione ottimale trovata. Eseguo benchmark...")
-        benchmark()
+        from benchmark.benchmark import benchmark
+        benchmark(trace=args.trace, trace_tiles=args.trace_tiles, profile=args.profile)
 
     with JSON_BENCHMARK_BEST_CONFIG_PATH.open("r", encoding="utf-8") as f:
         best_config = json.load(f)
 
     processes = int(best_config["processes"])
     threads = int(best_config["threads"])
-    print(f"\n📌 Uso della configurazione ottimale: {processes} processi, {threads} thread")
+    # Assente nelle configurazioni salvate prima del piano dei core: quota intera per processo
+    intra_op_threads = best_config.get("intra_op_threads")
+    print(f"\n📌 Uso della configurazione ottimale: {processes} processi, {threads} thread"
+          + (f", {intra_op_threads} thread ORT intra-op" if intra_op_threads else ""))
+
+    if args.watch:
+        run_daemon(processes, threads, memory_budget_gb=args.memory_budget_gb, target_ppis=args.ppi,
+                   distributed=args.distributed, intra_op_threads=intra_op_threads)
+        return
 
+    log_path = log_path_for_backend(CSV_LOG_PATH, LOG_BACKEND)
+    if log_path.exists():
+        print(f"\n📜 Log esistente trovato: {log_path}. Rimuovo per una nuova esecuzione.")
+        log_path.unlink()
+    # Gli errori vengono gestiti per immagine (nuovi tentativi o quarantena) e per cartella:
+    # un crash qui è un errore di configurazione o di ambiente, che un riavvio non risolve
     try:
-        for attempt in range(1, MAX_ATTEMPTS + 1):
-            if CSV_LOG_PATH.exists():
-                print(f"\n📜 Log esistente trovato: {CSV_LOG_PATH}. Rimuovo per una nuova esecuzione.")
-                CSV_LOG_PATH.unlink()
-            try:
-                print(f"\n🔁 Tentativo {attempt} di {MAX_ATTEMPTS}...\n")
-                run_standard_processing(processes, threads)
-                print("✅ Elaborazione completata con successo.")
-                break
-            except KeyboardInterrupt:
-                print("\n[🚪] Interrotto manualmente dall'utente. Uscita.")
-                sys.exit(0)
-            except Exception as e:
-                print(f"\n❌ Crash: {e}")
-                if attempt < MAX_ATTEMPTS:
-                    print(f"⏳ Nuovo tentativo in {RETRY_DELAY} secondi...")
-                    time.sleep(RETRY_DELAY)
-                else:
-                    print("\n❌ Numero massimo di tentativi raggiunto. Uscita.")
-                    sys.exit(1)
+        run_standard_processing(processes, threads, trace=args.trace, trace_tiles=args.trace_tiles,
+                                profile=args.profile, memory_budget_gb=args.memory_budget_gb,
+                                target_ppis=args.ppi, distributed=args.distributed,
+                                staging=args.staging, intra_op_threads=intra_op_threads,
+                                retry_quarantined=args.retry_quarantined)
+        print("✅ Elaborazione completata con successo.")
     except KeyboardInterrupt:
         print("\n[🚪] Interrotto manualmente dall'utente. Uscita.")
         sys.exit(0)
-
+    except Exception as e:
+        print(f"\n❌ Crash: {e}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,227 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from src.paths import *
+from src.config import *
+from src.tiff_metadata import read_tiff_metadata
+
+INDEX_SUFFIXES = INPUT_IMAGE_SUFFIXES
+COLUMNS = ["path", "size", "mtime_ns", "width", "height", "x_resolution", "y_resolution", "resolution_unit",
+           "ppi", "compression", "photometric", "samples_per_pixel", "bits_per_sample", "error"]
+
+COMPRESSION_NAMES = {1: "none", 5: "lzw", 7: "jpeg", 8: "deflate", 32773: "packbits", 32946: "deflate"}
+PHOTOMETRIC_NAMES = {0: "min-is-white", 1: "min-is-black", 2: "rgb", 3: "palette", 5: "cmyk", 6: "ycbcr"}
+
+
+# Righe sotto una cartella: confronto esatto del prefisso (LIKE tratterebbe "_" come jolly)
+_UNDER_ROOT = "WHERE substr(path, 1, ?) = ?"
+
+
+def _root_params(root: Path) -> tuple[int, str]:
+    prefix = os.path.join(str(root), "")
+    return len(prefix), prefix
+
+
+def read_header_record(path: Path, size: int, mtime_ns: int) -> dict:
+    """
+    Index row of one image, from its header only.
+
+    TIFF files are parsed by `read_tiff_metadata`; other formats through PIL's lazy
+    open, which reads the header without decoding the pixels.
+    """
+    record = dict.fromkeys(COLUMNS)
+    record.update(path=str(path), size=size, mtime_ns=mtime_ns)
+    try:
+        if path.suffix.lower() in (".tif", ".tiff"):
+            meta = read_tiff_metadata(path)
+            bits = meta.tags.get("bits_per_sample")
+            record.update(
+                width=meta.width,
+                height=meta.height,
+                x_resolution=meta.x_resolution,
+                y_resolution=meta.y_resolution,
+                resolution_unit=meta.resolution_unit,
+                ppi=meta.ppi,
+                compression=COMPRESSION_NAMES.get(meta.tags.get("compression", 1), str(meta.tags.get("compression"))),
+                photometric=PHOTOMETRIC_NAMES.get(meta.tags.get("photometric"), meta.tags.get("photometric")),
+                samples_per_pixel=meta.tags.get("samples_per_pixel", 1),
+                bits_per_sample=bits[0] if isinstance(bits, tuple) else bits,
+            )
+        else:
+            from PIL import Image
+            with Image.open(path) as img:
+                dpi = img.info.get("dpi")
+                record.update(
+                    width=img.width,
+                    height=img.height,
+                    x_resolution=float(dpi[0]) if dpi else None,
+                    y_resolution=float(dpi[1]) if dpi else None,
+                    resolution_unit="inch" if dpi else None,
+                    ppi=float(dpi[0]) if dpi and dpi[0] == dpi[1] else None,
+                    compression=(img.format or "").lower(),
+                    photometric=img.mode.lower(),
+                    samples_per_pixel=len(img.getbands()),
+                    bits_per_sample=8,
+                )
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+
+class MetadataIndex:
+    """
+    SQLite index of the headers of the input tree: one row per image with size,
+    dimensions, resolution, compression, photometric and mtime.
+
+    Rows are keyed by path and reused while size and mtime are unchanged, so only new
+    or modified files are read on update. Lookups only `stat` the file.
+    """
+
+    def __init__(self, path: Path = METADATA_INDEX_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS images ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, width INTEGER, height INTEGER, "
+            "x_resolution REAL, y_resolution REAL, resolution_unit TEXT, ppi REAL, compression TEXT, "
+            "photometric TEXT, samples_per_pixel INTEGER, bits_per_sample INTEGER, error TEXT)"
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def update(self, root: Path = INPUT_IMAGES_DIR, workers: int = METADATA_INDEX_WORKERS) -> dict:
+        """
+        Walk `root` and (re)index new or modified images with a pool of threads.
+
+        Returns:
+            dict: Number of files "indexed", "unchanged", "removed" and "errors", and "seconds".
+        """
+        start = time.perf_counter()
+        root = Path(root)
+        known = {row["path"]: (row["size"], row["mtime_ns"])
+                 for row in self.conn.execute(f"SELECT path, size, mtime_ns FROM images {_UNDER_ROOT}",
+                                              _root_params(root))}
+
+        to_read = []
+        seen = set()
+        for current_dir, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = Path(current_dir) / filename
+                if path.suffix.lower() not in INDEX_SUFFIXES:
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                seen.add(str(path))
+                if known.get(str(path)) != (stat.st_size, stat.st_mtime_ns):
+                    to_read.append((path, stat.st_size, stat.st_mtime_ns))
+
+        # Letture dell'header in parallelo (I/O di rete), scritture da questo thread
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            records = list(executor.map(lambda item: read_header_record(*item), to_read))
+
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        self.conn.executemany(f"INSERT OR REPLACE INTO images VALUES ({placeholders})",
+                              [tuple(record[c] for c in COLUMNS) for record in records])
+        removed = [(path,) for path in known if path not in seen]
+        self.conn.executemany("DELETE FROM images WHERE path = ?", removed)
+        self.conn.commit()
+
+        return {
+            "indexed": len(records),
+            "unchanged": len(seen) - len(records),
+            "removed": len(removed),
+            "errors": sum(1 for record in records if record["error"]),
+            "seconds": time.perf_counter() - start,
+        }
+
+    def get(self, path: Path) -> dict | None:
+        """
+        Indexed header of `path`, or None if missing, stale or unreadable.
+        """
+        row = self.conn.execute("SELECT * FROM images WHERE path = ?", (str(path),)).fetchone()
+        if row is None or row["error"]:
+            return None
+        try:
+            stat = Path(path).stat()
+        except FileNotFoundError:
+            return None
+        if (row["size"], row["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        return dict(row)
+
+    def sizes(self, paths: list[Path]) -> dict[Path, tuple[int, int]]:
+        """
+        (width, height) of the images found up to date in the index.
+        """
+        sizes = {}
+        for path in paths:
+            record = self.get(path)
+            if record is not None and record["width"] and record["height"]:
+                sizes[path] = (record["width"], record["height"])
+        return sizes
+
+    def summary(self, root: Path = INPUT_IMAGES_DIR) -> dict:
+        """
+        Counts and megapixels of the indexed images under `root`, by PPI and compression.
+        """
+        params = _root_params(root)
+        totals = self.conn.execute(
+            f"SELECT COUNT(*) AS images, SUM(width * height) / 1e6 AS megapixels, SUM(size) AS bytes, "
+            f"SUM(error IS NOT NULL) AS errors FROM images {_UNDER_ROOT}", params
+        ).fetchone()
+        by_ppi = self.conn.execute(
+            f"SELECT CAST(ROUND(ppi) AS INTEGER) AS ppi, COUNT(*) AS images FROM images {_UNDER_ROOT} "
+            f"GROUP BY CAST(ROUND(ppi) AS INTEGER)", params
+        ).fetchall()
+        by_compression = self.conn.execute(
+            f"SELECT compression, COUNT(*) AS images FROM images {_UNDER_ROOT} GROUP BY compression", params
+        ).fetchall()
+        return {
+            "images": totals["images"],
+            "megapixels": totals["megapixels"] or 0.0,
+            "bytes": totals["bytes"] or 0,
+            "errors": totals["errors"] or 0,
+            "by_ppi": {row["ppi"]: row["images"] for row in by_ppi},
+            "by_compression": {row["compression"]: row["images"] for row in by_compression},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indicizza gli header delle immagini di input in SQLite.")
+    parser.add_argument("--root", type=Path, default=INPUT_IMAGES_DIR, help="Cartella da indicizzare")
+    parser.add_argument("--index", type=Path, default=METADATA_INDEX_PATH, help="File SQLite dell'indice")
+    parser.add_argument("--workers", type=int, default=METADATA_INDEX_WORKERS, help="Thread di lettura")
+    args = parser.parse_args()
+
+    if not args.root.exists():
+        print(f"❌ Cartella non trovata: {args.root}")
+        sys.exit(1)
+
+    index = MetadataIndex(args.index)
+    stats = index.update(args.root, args.workers)
+    summary = index.summary(args.root)
+    index.close()
+
+    print(f"🗂️  Indice aggiornato in {stats['seconds']:.1f}s: {stats['indexed']} lette, "
+          f"{stats['unchanged']} invariate, {stats['removed']} rimosse, {stats['errors']} errori")
+    print(f"   {summary['images']} immagini, {summary['megapixels']:.0f} MP, {summary['bytes'] / 1024 ** 3:.1f} GB")
+    for ppi, count in sorted(summary["by_ppi"].items(), key=lambda kv: (kv[0] is None, kv[0] or 0)):
+        print(f"   PPI {ppi if ppi is not None else 'n/d'}: {count}")
+    for compression, count in summary["by_compression"].items():
+        print(f"   Compressione {compression or 'n/d'}: {count}")
+    print(f"✅ Indice salvato in {args.index}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from src import tracing
+from src.paths import METRICS_DIR
+
+# Ordine con cui gli stage vengono riportati nel sommario finale
+STAGES = [
+    "decode",
+    "roi_detection",
+    "tiling",
+    "inference",
+    "blending",
+    "sr_write",
+    "validation",
+    "resize",
+    "final_write",
+]
+
+
+def peak_rss_mb() -> float | None:
+    """
+    Return the peak resident set size of the current process in MB.
+
+    Uses `resource` on POSIX and `psutil` (if installed) elsewhere.
+
+    Returns:
+        float | None: Peak RSS in MB, or None if it cannot be measured.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux riporta KB, macOS byte
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def current_rss_mb() -> float | None:
+    """
+    Return the current resident set size of the current process in MB.
+
+    Reads /proc on Linux and uses `psutil` (if installed) elsewhere.
+
+    Returns:
+        float | None: Current RSS in MB, or None if it cannot be measured.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+class ImageMetrics:
+    """
+    Collects per-stage durations and counters for a single image.
+    """
+
+    def __init__(self, image_path: Path):
+        self.image_path = Path(image_path)
+        self.stages: dict[str, float] = {}
+        self.values: dict = {}
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            with tracing.span(name, image=self.image_path.name):
+                yield
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+
+    def add_time(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_timings(self, timings: dict):
+        """
+        Merge the timings dict filled by `SA_SuperResolution.run`.
+        """
+        for key, value in timings.items():
+            if key in STAGES:
+                self.add_time(key, value)
+            else:
+                self.values[key] = value
+
+    def set(self, key: str, value):
+        self.values[key] = value
+
+    def to_record(self, status: str, step: str = "") -> dict:
+        return {
+            "timestamp": time.time(),
+            "filename": self.image_path.name,
+            "folder": self.image_path.parent.name,
+            "status": status,
+            "step": step,
+            "pid": os.getpid(),
+            "total_s": time.perf_counter() - self.start,
+            "stages": self.stages,
+            "peak_rss_mb": peak_rss_mb(),
+            **self.values,
+        }
+
+
+def stage(metrics: ImageMetrics | None, name: str):
+    """
+    Context manager that times `name` on `metrics`; without metrics only the trace span is kept.
+    """
+    if metrics is None:
+        return tracing.span(name)
+    return metrics.stage(name)
+
+
+class MetricsSink:
+    """
+    Thread-safe JSONL sink, one file per process and per run.
+    """
+
+    def __init__(self, run_id: str, metrics_dir: Path = METRICS_DIR):
+        self.path = Path(metrics_dir) / f"{run_id}_{os.getpid()}.jsonl"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+
+    def write(self, record: dict):
+        line = json.dumps(record, default=str)
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def load_metrics(run_id: str, metrics_dir: Path = METRICS_DIR) -> list[dict]:
+    records = []
+    for path in sorted(Path(metrics_dir).glob(f"{run_id}_*.jsonl")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    return records
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Nearest-rank percentile, q in [0, 100].
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))  # ceil
+    return ordered[int(min(rank, len(ordered))) - 1]
+
+
+def summarize_metrics(records: list[dict], wall_time: float | None = None) -> dict:
+    """
+    Compute p50/p95 per stage and the throughput in megapixel per second.
+
+    Args:
+        records (list[dict]): Records written by `MetricsSink`.
+        wall_time (float | None): Wall-clock duration of the run, in seconds.
+
+    Returns:
+        dict: Summary with per-stage percentiles, image counts and MP/s.
+    """
+    ok = [r for r in records if r.get("status") == "ok"]
+
+    stages = {}
+    names = STAGES + sorted({k for r in ok for k in r["stages"]} - set(STAGES))
+    for name in names:
+        values = [r["stages"][name] for r in ok if name in r["stages"]]
+        if values:
+            stages[name] = {
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "count": len(values),
+            }
+
+    total_mp = sum(r.get("megapixels", 0.0) for r in ok)
+    total_busy = sum(r["total_s"] for r in ok)
+    rss = [r["peak_rss_mb"] for r in records if r.get("peak_rss_mb") is not None]
+    redundancy = [r["redundant_pixel_ratio"] for r in ok if "redundant_pixel_ratio" in r]
+    roi = [r["roi_fraction"] for r in ok if "roi_fraction" in r]
+    total_tiles = sum(r.get("tiles", 0) for r in ok)
+    avoided_tiles = sum(r.get("tiles_skipped_blank", 0) + r.get("tiles_memo_hits", 0) for r in ok)
+
+    return {
+        "images_ok": len(ok),
+        "images_failed": len(records) - len(ok),
+        "megapixels": total_mp,
+        "mp_per_s": total_mp / wall_time if wall_time else 0.0,
+        "mp_per_busy_s": total_mp / total_busy if total_busy else 0.0,
+        "peak_rss_mb": max(rss) if rss else None,
+        "redundant_pixel_ratio": sum(redundancy) / len(redundancy) if redundancy else None,
+        "roi_fraction": sum(roi) / len(roi) if roi else None,
+        "tiles_skipped_fraction": avoided_tiles / total_tiles if total_tiles else None,
+        "inference_time_saved_s": sum(r.get("inference_time_saved_s", 0.0) for r in ok),
+        "stages": stages,
+    }
+
+
+def print_metrics_summary(summary: dict):
+    print("\n⏱️  Tempi per stage (secondi):")
+    print(f"   {'stage':<14}{'p50':>10}{'p95':>10}{'n':>8}")
+    for name, s in summary["stages"].items():
+        print(f"   {name:<14}{s['p50']:>10.3f}{s['p95']:>10.3f}{s['count']:>8}")
+    print(f"   Megapixel elaborati: {summary['megapixels']:.1f} MP")
+    print(f"   Throughput: {summary['mp_per_s']:.3f} MP/s "
+          f"({summary['mp_per_busy_s']:.3f} MP/s per thread)")
+    if summary["peak_rss_mb"] is not None:
+        print(f"   Picco RSS per processo: {summary['peak_rss_mb']:.0f} MB")
+    if summary["redundant_pixel_ratio"] is not None:
+        print(f"   Pixel ridondanti inferiti per sovrapposizione dei tile: {summary['redundant_pixel_ratio']:.1%}")
+    if summary.get("roi_fraction") is not None:
+        print(f"   Frazione media di pagina super-risolta con EDSR (modalità ROI): {summary['roi_fraction']:.1%}")
+    if summary.get("tiles_skipped_fraction"):
+        print(f"   Tile non inferiti (sfondo uniforme o duplicati): {summary['tiles_skipped_fraction']:.1%}, "
+              f"~{summary['inference_time_saved_s']:.1f}s di inferenza risparmiati")
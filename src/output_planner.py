@@ -0,0 +1,199 @@
+from pathlib import Path
+
+from src.paths import *
+from src.config import *
+
+# Calibrazione della banda cromatica per ogni PPI di scansione supportato
+RULER_CALIBRATION = {
+    400: CHROMATIC_BAND_400_PPI,
+    600: CHROMATIC_BAND_600_PPI,
+}
+OUTPUT_PLAN_POLICIES = ["reference", "quality", "speed"]
+
+
+class UnsupportedPPIError(ValueError):
+    """
+    The scan PPI has no ruler calibration: the image cannot be processed until it is rescanned.
+    """
+
+
+def target_ruler_px(target_ppi: int) -> float:
+    """
+    Length in pixels of the ruler in the output at `target_ppi` (TARGET_RULER_MM_OUTPUT mm).
+    """
+    return target_ppi * TARGET_RULER_INCH_OUTPUT
+
+
+def downscale_factor(ppi: int, sr_scale: int = SUPER_RESOLUTION_PAR, target_ppi: int | None = None) -> float:
+    """
+    Resize factor applied to an image already upscaled by `sr_scale` to reach the target PPI.
+
+    Args:
+        ppi (int): PPI of the scan, selecting the ruler calibration.
+        sr_scale (int): Factor by which the image was super-resolved.
+        target_ppi (int, optional): PPI of the deliverable, default `ppi`.
+
+    Raises:
+        UnsupportedPPIError: If the PPI has no ruler calibration.
+    """
+    if ppi not in RULER_CALIBRATION:
+        raise UnsupportedPPIError(f"PPI non supportato: {ppi} (supportati: {sorted(RULER_CALIBRATION)})")
+    chromatic_ruler = RULER_CALIBRATION[ppi]
+
+    original_ruler_inch = chromatic_ruler["width_mm"] / INCH_CONVERSION
+    original_ruler_px = sr_scale * chromatic_ruler["ppi"] * original_ruler_inch
+
+    scale_factor = target_ruler_px(target_ppi or ppi) / original_ruler_px
+    scale_factor *= chromatic_ruler["correction_factor"]
+    return scale_factor
+
+
+def net_scale_factor(ppi: int, target_ppi: int | None = None) -> float:
+    """
+    Overall factor from the scanned image to the final output (about 1.53 at 400 PPI, 1.63 at 600 PPI).
+    """
+    return downscale_factor(ppi, sr_scale=1, target_ppi=target_ppi)
+
+
+def final_size(width: int, height: int, ppi: int, target_ppi: int | None = None) -> tuple[int, int]:
+    """
+    Final output size of a scan of `width` x `height` pixels.
+
+    Uses the same arithmetic as the historical x`SUPER_RESOLUTION_PAR` + resize path,
+    so every plan produces exactly the reference dimensions.
+    """
+    scale_factor = downscale_factor(ppi, SUPER_RESOLUTION_PAR, target_ppi)
+    return int(width * SUPER_RESOLUTION_PAR * scale_factor), int(height * SUPER_RESOLUTION_PAR * scale_factor)
+
+
+def available_sr_scales(models_dir: Path = SR_SCRIPT_MODEL_DIR, variant: str | None = SR_MODEL_VARIANT) -> list[int]:
+    """
+    Scales among x2/x3/x4 whose encrypted model is present in `models_dir`.
+    """
+    suffix = f"_{variant}" if variant else ""
+    return [scale for scale in (2, 3, 4) if (Path(models_dir) / f"edsr_{scale}x{suffix}.ven").exists()]
+
+
+class OutputPlan:
+    """
+    How the images of a folder reach their final size, and the estimated cost.
+
+    `method` is "sr" (EDSR at `sr_scale`, then resize) or "direct" (resize of the scan only).
+    With `fused` the upscaled image is resized in memory and only the final image is
+    written, skipping the intermediate super-resolved file and its re-read.
+    """
+
+    def __init__(self, ppi: int, method: str, sr_scale: int | None, fused: bool,
+                 estimated_seconds: float, quality_tier: int, images: int = 0, megapixels: float = 0.0,
+                 target_ppis: list[int] | None = None):
+        self.ppi = ppi
+        self.target_ppis = target_ppis or [ppi]
+        self.method = method
+        self.sr_scale = sr_scale
+        self.fused = fused
+        self.estimated_seconds = estimated_seconds
+        self.quality_tier = quality_tier
+        self.images = images
+        self.megapixels = megapixels
+
+    @property
+    def net_factor(self) -> float:
+        return max(net_scale_factor(self.ppi, target) for target in self.target_ppis)
+
+    @property
+    def name(self) -> str:
+        if self.method == "direct":
+            return "direct"
+        return f"sr_x{self.sr_scale}" + ("_fused" if self.fused else "")
+
+    def to_dict(self) -> dict:
+        return {
+            "ppi": self.ppi,
+            "target_ppis": self.target_ppis,
+            "plan": self.name,
+            "method": self.method,
+            "sr_scale": self.sr_scale,
+            "fused": self.fused,
+            "net_factor": self.net_factor,
+            "quality_tier": self.quality_tier,
+            "images": self.images,
+            "megapixels": self.megapixels,
+            "estimated_seconds": self.estimated_seconds,
+        }
+
+    def describe(self) -> str:
+        targets = ", ".join(str(t) for t in self.target_ppis)
+        return (f"{self.name} (fattore netto x{self.net_factor:.2f}, scansione {self.ppi} PPI -> {targets} PPI, "
+                f"{self.megapixels:.0f} MP, costo stimato {self.estimated_seconds:.0f}s CPU)")
+
+
+def estimate_cost_per_mp(method: str, sr_scale: int | None, fused: bool, net_factors: list[float]) -> float:
+    """
+    Estimated CPU seconds per input megapixel, with the coefficients in `config.py`.
+
+    `net_factors` has one entry per deliverable: SR runs once, the resize once per deliverable.
+    """
+    if method == "direct":
+        return sum(RESAMPLE_SECONDS_PER_MP * max(1.0, net ** 2) for net in net_factors)
+
+    upscaled_mp = sr_scale ** 2
+    cost = SR_SECONDS_PER_INPUT_MP[sr_scale] + RESAMPLE_SECONDS_PER_MP * upscaled_mp * len(net_factors)
+    if not fused:
+        cost += INTERMEDIATE_IO_SECONDS_PER_MP * upscaled_mp
+    return cost
+
+
+def _quality_tier(method: str, sr_scale: int | None, net_factor: float) -> int:
+    # 2: solo riduzione dopo la SR (o nessun ingrandimento necessario)
+    # 1: SR seguita da un ulteriore ingrandimento, 0: ingrandimento per sola interpolazione
+    if method == "direct":
+        return 2 if net_factor <= 1.0 else 0
+    return 2 if sr_scale >= net_factor else 1
+
+
+def plan_output(ppi: int, sizes: dict[Path, tuple[int, int]], policy: str = OUTPUT_PLAN_POLICY,
+                scales: list[int] | None = None, target_ppis: list[int] | None = None) -> OutputPlan:
+    """
+    Choose how to reach the final size of a folder before any inference.
+
+    Policies:
+        "reference": x`SUPER_RESOLUTION_PAR`, intermediate file, resize (historical behaviour).
+        "quality": the cheapest plan among those of the best quality tier.
+        "speed": the cheapest plan overall.
+
+    Args:
+        ppi (int): PPI of the scans of the folder.
+        sizes (dict): (width, height) of the images, from the headers.
+        policy (str): One of `OUTPUT_PLAN_POLICIES`.
+        scales (list[int], optional): Available SR scales; default from the model directory.
+        target_ppis (list[int], optional): PPI of the deliverables, default `[ppi]`;
+            the quality tier is set by the largest net factor.
+
+    Returns:
+        OutputPlan: The chosen plan with its estimated cost for the whole folder.
+    """
+    if policy not in OUTPUT_PLAN_POLICIES:
+        raise ValueError(f"Policy sconosciuta: {policy} (disponibili: {OUTPUT_PLAN_POLICIES})")
+
+    target_ppis = target_ppis or [ppi]
+    net_factors = [net_scale_factor(ppi, target) for target in target_ppis]
+    net = max(net_factors)
+    megapixels = sum(w * h for w, h in sizes.values()) / 1e6
+    scales = available_sr_scales() if scales is None else scales
+
+    def make(method: str, sr_scale: int | None, fused: bool) -> OutputPlan:
+        return OutputPlan(ppi, method, sr_scale, fused,
+                          estimate_cost_per_mp(method, sr_scale, fused, net_factors) * megapixels,
+                          _quality_tier(method, sr_scale, net), len(sizes), megapixels, target_ppis)
+
+    if policy == "reference":
+        return make("sr", SUPER_RESOLUTION_PAR, False)
+
+    candidates = [make("direct", None, False)]
+    candidates += [make("sr", scale, fused) for scale in scales if scale in SR_SECONDS_PER_INPUT_MP
+                   for fused in (False, True)]
+
+    if policy == "quality":
+        best_tier = max(plan.quality_tier for plan in candidates)
+        candidates = [plan for plan in candidates if plan.quality_tier == best_tier]
+    return min(candidates, key=lambda plan: plan.estimated_seconds)
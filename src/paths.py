@@ -6,9 +6,23 @@ IMAGES_DIR = BASE_DIR / "images"
 INPUT_IMAGES_DIR = Path(r"C:\Users\andre\Desktop\B001")
 OUTPUT_IMAGES_DIR = IMAGES_DIR / "output"
 OUTPUT_TMP_DIR = OUTPUT_IMAGES_DIR / "tmp"
+# Copie locali di input e output con --staging: deve stare su disco locale (SSD)
+STAGING_DIR = IMAGES_DIR / "staging"
 
 CSV_LOG_DIR = BASE_DIR / "logs"
 CSV_LOG_PATH = CSV_LOG_DIR / "processing_log.csv"
+CSV_LOG_BENCHMARK_PATH = CSV_LOG_DIR / "processing_log_benchmark.csv"
+METRICS_DIR = CSV_LOG_DIR / "metrics"
+TRACE_DIR = CSV_LOG_DIR / "traces"
+PROFILE_DIR = CSV_LOG_DIR / "profiles"
+# Lease dei nodi in modalità --distributed: deve stare sulla share condivisa da tutti i nodi
+LEASE_DIR = OUTPUT_IMAGES_DIR / "leases"
+
+# Indice SQLite degli header delle immagini di input (python -m src.metadata_manager)
+METADATA_DIR = BASE_DIR / "metadata"
+METADATA_INDEX_PATH = METADATA_DIR / "index.sqlite"
+# Stato degli output scritti: dimensione e checksum di ogni file, per la verifica senza decodifica
+RUN_STATE_PATH = METADATA_DIR / "run_state.sqlite"
 
 MODEL_DIR = BASE_DIR / "model"
 SR_SCRIPT_MODEL_DIR = MODEL_DIR / "SR_Script" / "super_res"
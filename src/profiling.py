@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import time
+import threading
+from pathlib import Path
+
+# Intervallo di campionamento di default (secondi)
+DEFAULT_INTERVAL = 0.005
+
+
+def _frame_key(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+
+
+class SamplingProfiler:
+    """
+    Low-overhead statistical profiler for every thread of the current process.
+
+    A daemon thread snapshots all stacks with `sys._current_frames()` every
+    `interval` seconds. For each function it counts the samples in which it is
+    on top of the stack (self) and those in which it appears anywhere (cumulative),
+    so time spent inside C extensions (PIL, OpenCV, ONNX Runtime) is charged to
+    the Python function that called them.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.self_counts: dict[str, int] = {}
+        self.cumulative_counts: dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_time = None
+        self.duration = 0.0
+
+    def start(self):
+        self._start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample_loop, name="sampling_profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._start_time
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self._record(frame)
+            self.samples += 1
+
+    def _record(self, frame):
+        top = _frame_key(frame)
+        self.self_counts[top] = self.self_counts.get(top, 0) + 1
+
+        seen = set()
+        while frame is not None:
+            key = _frame_key(frame)
+            if key not in seen:
+                seen.add(key)
+                self.cumulative_counts[key] = self.cumulative_counts.get(key, 0) + 1
+            frame = frame.f_back
+
+    def dump(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "pid": os.getpid(),
+                "interval": self.interval,
+                "samples": self.samples,
+                "duration": self.duration,
+                "functions": {
+                    key: [self.self_counts.get(key, 0), count]
+                    for key, count in self.cumulative_counts.items()
+                },
+            }, f)
+        return path
+
+
+def merge_profiles(profile_dir: Path) -> dict:
+    """
+    Merge every per-process profile in `profile_dir`.
+
+    Returns:
+        dict: {"processes", "duration", "functions": {key: {"self_s", "cumulative_s"}}}
+    """
+    functions: dict[str, dict] = {}
+    processes = 0
+    duration = 0.0
+
+    for path in sorted(Path(profile_dir).glob("profile_*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        processes += 1
+        duration += data["duration"]
+        interval = data["interval"]
+        for key, (self_count, cumulative_count) in data["functions"].items():
+            entry = functions.setdefault(key, {"self_s": 0.0, "cumulative_s": 0.0})
+            entry["self_s"] += self_count * interval
+            entry["cumulative_s"] += cumulative_count * interval
+
+    return {"processes": processes, "duration": duration, "functions": functions}
+
+
+def format_profile_report(merged: dict, top: int = 30) -> str:
+    """
+    Format the merged profile as a table of the top functions by cumulative time.
+
+    Times are thread-seconds summed over every sampled thread of every process.
+    """
+    lines = [
+        f"Processi profilati: {merged['processes']} | durata totale: {merged['duration']:.1f}s",
+        f"{'cumulative_s':>13} {'self_s':>10}  funzione",
+    ]
+    ranked = sorted(merged["functions"].items(), key=lambda kv: kv[1]["cumulative_s"], reverse=True)
+    for key, entry in ranked[:top]:
+        lines.append(f"{entry['cumulative_s']:>13.2f} {entry['self_s']:>10.2f}  {key}")
+    return "\n".join(lines)
+
+
+def profile_path(profile_dir: Path, name: str) -> Path:
+    return Path(profile_dir) / f"profile_{name}_{os.getpid()}_{time.time_ns()}.json"
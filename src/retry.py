@@ -0,0 +1,147 @@
+import os
+import time
+import errno
+import random
+import sqlite3
+import threading
+from pathlib import Path
+
+from src.paths import *
+from src.config import *
+from src.output_planner import UnsupportedPPIError
+
+try:
+    from PIL import Image, UnidentifiedImageError
+    PIL_INPUT_ERRORS = (UnidentifiedImageError, Image.DecompressionBombError)
+except ImportError:
+    PIL_INPUT_ERRORS = ()
+
+# Errori di I/O che un nuovo tentativo può risolvere (share di rete, file bloccati)
+TRANSIENT_ERRNOS = {
+    errno.EAGAIN, errno.EBUSY, errno.EINTR, errno.EIO, errno.ETIMEDOUT, errno.ESTALE, errno.ENOLCK,
+    errno.ECONNRESET, errno.ECONNABORTED, errno.ENETDOWN, errno.ENETUNREACH, errno.EHOSTUNREACH,
+}
+# Windows: violazione di condivisione o di lock, rete non disponibile, timeout del semaforo
+TRANSIENT_WINERRORS = {32, 33, 53, 64, 121, 1231}
+# Errori di decodifica di PIL (OSError senza errno, quindi non di sistema)
+DECODE_ERROR_MESSAGES = (
+    "cannot identify image file", "image file is truncated", "broken data stream", "decoder error",
+    "not a TIFF file", "unknown pixel mode", "cannot decode",
+)
+
+
+def _chain(error: BaseException | None):
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def is_transient(error: BaseException | None) -> bool:
+    """
+    Whether an image failure is worth retrying: locked files, I/O timeouts, network
+    errors and memory exhaustion, also when wrapped by the processing functions
+    (which re-raise them as RuntimeError inside their `except` blocks).
+    """
+    for error in _chain(error):
+        if isinstance(error, (TimeoutError, ConnectionError, BlockingIOError, InterruptedError, MemoryError)):
+            return True
+        if isinstance(error, OSError) and (error.errno in TRANSIENT_ERRNOS
+                                           or getattr(error, "winerror", None) in TRANSIENT_WINERRORS):
+            return True
+    return False
+
+
+def is_input_error(error: BaseException | None) -> bool:
+    """
+    Whether an image failure is caused by the input file itself (unreadable or corrupt
+    image, unsupported PPI), so retrying it is pointless until the file changes.
+
+    Anything else (code bugs, ORT allocation failures, a full or unmounted output share)
+    is an environment fault that can hit every image: it must not quarantine them.
+    """
+    for error in _chain(error):
+        if isinstance(error, PIL_INPUT_ERRORS + (UnsupportedPPIError, SyntaxError)):
+            return True  # PIL segnala le intestazioni non valide con SyntaxError
+        if (isinstance(error, OSError) and error.errno is None
+                and any(message in str(error) for message in DECODE_ERROR_MESSAGES)):
+            return True
+    return False
+
+
+def retry_delay(attempt: int, base: float = IMAGE_RETRY_BASE_DELAY_S, cap: float = IMAGE_RETRY_MAX_DELAY_S) -> float:
+    """
+    Wait before retry number `attempt` (from 1): exponential, capped, with full jitter,
+    so the threads that failed together on a busy share do not retry together.
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class Quarantine:
+    """
+    Images whose input file cannot be processed, with the step and the reason, in the SQLite run state.
+
+    Quarantined images are skipped by later runs until released or until the input
+    file changes (size or modification time).
+    """
+
+    def __init__(self, path: Path = RUN_STATE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS quarantine ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, step TEXT, reason TEXT, "
+                "attempts INTEGER, quarantined_at REAL)"
+            )
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def add(self, image_path: Path, step: str, reason: str, attempts: int = 1):
+        try:
+            stat = Path(image_path).stat()
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        except FileNotFoundError:
+            size, mtime_ns = None, None
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO quarantine VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (str(image_path), size, mtime_ns, step, reason, attempts, time.time()))
+            self.conn.commit()
+
+    def entries(self) -> dict[str, dict]:
+        """
+        Quarantined images still unchanged, by path.
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM quarantine").fetchall()
+        entries = {}
+        for row in rows:
+            try:
+                stat = Path(row["path"]).stat()
+            except FileNotFoundError:
+                continue
+            if (row["size"], row["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                entries[row["path"]] = dict(row)
+        return entries
+
+    def release(self, image_path: Path | None = None) -> int:
+        """
+        Take an image (or every image, if None) out of quarantine.
+
+        Returns:
+            int: Number of images released.
+        """
+        with self.lock:
+            if image_path is None:
+                cursor = self.conn.execute("DELETE FROM quarantine")
+            else:
+                cursor = self.conn.execute("DELETE FROM quarantine WHERE path = ?", (str(image_path),))
+            self.conn.commit()
+        return cursor.rowcount
@@ -0,0 +1,207 @@
+import time
+
+import cv2
+import numpy as np
+
+from src.paths import *
+from src.config import *
+
+# Tiffen template usato anche da ruler_detection e find_all_chromatic_bands
+RULER_TEMPLATE_PATH = IMAGES_DIR / "input" / "assets" / "tiffen_template.jpg"
+_ruler_template = None
+
+
+def _load_ruler_template() -> np.ndarray | None:
+    global _ruler_template
+    if _ruler_template is None and RULER_TEMPLATE_PATH.exists():
+        template = cv2.imread(str(RULER_TEMPLATE_PATH))
+        if template is not None:
+            _ruler_template = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+    return _ruler_template
+
+
+def _reduced_copy(img_np: np.ndarray, long_side: int) -> tuple[np.ndarray, float]:
+    """
+    Return a grayscale copy whose longest side is at most `long_side`, and the reduction factor.
+    """
+    gray = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY) if img_np.ndim == 3 else img_np
+    height, width = gray.shape
+    factor = max(height, width) / long_side
+    if factor <= 1:
+        return gray, 1.0
+    size = (max(1, round(width / factor)), max(1, round(height / factor)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA), factor
+
+
+def _document_boxes(gray: np.ndarray) -> list[tuple[int, int, int, int]]:
+    """
+    Bounding boxes of the bright regions on the dark scanner bed, as in `binaryize_image`
+    and `measure_document_from_binary`: the document and, if separate, the ruler.
+    """
+    _, binary = cv2.threshold(gray, ROI_BINARY_THRESHOLD, 255, cv2.THRESH_BINARY)
+    binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    min_area = ROI_MIN_AREA_FRACTION * gray.shape[0] * gray.shape[1]
+    boxes = []
+    for contour in contours:
+        if cv2.contourArea(contour) < min_area:
+            continue
+        x, y, w, h = cv2.boundingRect(contour)
+        boxes.append((x, y, x + w, y + h))
+    return boxes
+
+
+def _ruler_box(gray: np.ndarray, factor: float) -> tuple[int, int, int, int] | None:
+    """
+    Locate the Tiffen ruler by multiscale template matching on the reduced copy.
+    """
+    template = _load_ruler_template()
+    if template is None:
+        return None
+
+    best = (0.0, None, None)
+    for scale in ROI_RULER_TEMPLATE_SCALES:
+        # Il template è alla risoluzione della scansione: va ridotto come l'immagine
+        size = (round(template.shape[1] * scale / factor), round(template.shape[0] * scale / factor))
+        if size[0] < 8 or size[1] < 8 or size[0] > gray.shape[1] or size[1] > gray.shape[0]:
+            continue
+        resized = cv2.resize(template, size, interpolation=cv2.INTER_AREA)
+        result = cv2.matchTemplate(gray, resized, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        if max_val > best[0]:
+            best = (max_val, max_loc, size)
+
+    max_val, top_left, size = best
+    if top_left is None or max_val < ROI_RULER_MATCH_THRESHOLD:
+        return None
+    return (top_left[0], top_left[1], top_left[0] + size[0], top_left[1] + size[1])
+
+
+def _merge_boxes(boxes: list[tuple[int, int, int, int]]) -> list[tuple[int, int, int, int]]:
+    """
+    Merge overlapping boxes, so that no pixel is super-resolved twice.
+    """
+    merged = list(boxes)
+    changed = True
+    while changed:
+        changed = False
+        result = []
+        for box in merged:
+            for i, other in enumerate(result):
+                if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]:
+                    result[i] = (min(box[0], other[0]), min(box[1], other[1]),
+                                 max(box[2], other[2]), max(box[3], other[3]))
+                    changed = True
+                    break
+            else:
+                result.append(box)
+        merged = result
+    return merged
+
+
+def detect_roi_boxes(img_np: np.ndarray, margin: int = ROI_MARGIN_PX) -> list[tuple[int, int, int, int]]:
+    """
+    Detect the document and ruler regions on a reduced-resolution copy of the scan.
+
+    Args:
+        img_np (np.ndarray): RGB image at full resolution.
+        margin (int): Pixels added around every region, at full resolution.
+
+    Returns:
+        list[tuple[int, int, int, int]]: Non-overlapping (x0, y0, x1, y1) boxes at full
+        resolution; empty if nothing was found.
+    """
+    height, width = img_np.shape[:2]
+    gray, factor = _reduced_copy(img_np, ROI_DETECTION_LONG_SIDE)
+
+    boxes = _document_boxes(gray)
+    ruler = _ruler_box(gray, factor)
+    if ruler is not None:
+        boxes.append(ruler)
+
+    full_res = [
+        (max(0, int(x0 * factor) - margin), max(0, int(y0 * factor) - margin),
+         min(width, int(np.ceil(x1 * factor)) + margin), min(height, int(np.ceil(y1 * factor)) + margin))
+        for x0, y0, x1, y1 in boxes
+    ]
+    return _merge_boxes(full_res)
+
+
+def _feather_weights(length: int, ramp: int, fade_start: bool, fade_end: bool) -> np.ndarray:
+    """
+    1-D blending weights: linear ramps on the sides that border interpolated pixels.
+    """
+    weights = np.ones(length, dtype=np.float32)
+    ramp = min(ramp, length // 2)
+    if ramp > 0:
+        ramp_values = (np.arange(ramp, dtype=np.float32) + 0.5) / ramp
+        if fade_start:
+            weights[:ramp] = ramp_values
+        if fade_end:
+            weights[-ramp:] = ramp_values[::-1]
+    return weights
+
+
+def super_resolve_roi(sr_model, img_np: np.ndarray, boxes: list[tuple[int, int, int, int]],
+                      strip_height: int | None = None, timings: dict | None = None) -> np.ndarray:
+    """
+    Super-resolve only the given regions; the rest of the image is upscaled bicubically.
+
+    Each region is run through the model on its own and pasted over the bicubic
+    upscale, with a linear cross-fade of `ROI_FEATHER_PX` input pixels on the sides
+    that do not touch the image border.
+
+    Args:
+        sr_model (SA_SuperResolution): Preloaded super-resolution model.
+        img_np (np.ndarray): RGB image as uint8 array.
+        boxes (list): (x0, y0, x1, y1) regions from `detect_roi_boxes`.
+        strip_height (int, optional): If set, each region is processed in strips.
+        timings (dict, optional): Filled as in `SA_SuperResolution.run`, summed over the regions,
+            plus "roi_fraction", the share of the image sent to the model.
+
+    Returns:
+        np.ndarray: Upscaled image as uint8 array.
+    """
+    scale = sr_model.scale
+    height, width = img_np.shape[:2]
+
+    t0 = time.perf_counter()
+    out_img = cv2.resize(img_np, (width * scale, height * scale), interpolation=cv2.INTER_CUBIC)
+    blend_time = time.perf_counter() - t0
+
+    roi_area = 0
+    for x0, y0, x1, y1 in boxes:
+        region = img_np[y0:y1, x0:x1]
+        region_timings = {} if timings is not None else None
+        if strip_height is not None:
+            sr_region = sr_model.run_in_strips(region, strip_height, timings=region_timings)
+        else:
+            sr_region = sr_model.run(region, timings=region_timings)
+
+        t0 = time.perf_counter()
+        ramp = ROI_FEATHER_PX * scale
+        weight_y = _feather_weights(sr_region.shape[0], ramp, y0 > 0, y1 < height)
+        weight_x = _feather_weights(sr_region.shape[1], ramp, x0 > 0, x1 < width)
+        weight = (weight_y[:, None] * weight_x[None, :])[..., None]
+
+        target = out_img[y0 * scale:y1 * scale, x0 * scale:x1 * scale]
+        blended = weight * sr_region + (1.0 - weight) * target
+        target[...] = np.clip(np.rint(blended), 0, 255).astype(np.uint8)
+        blend_time += time.perf_counter() - t0
+
+        roi_area += (y1 - y0) * (x1 - x0)
+        if timings is not None:
+            for key, value in region_timings.items():
+                timings[key] = timings.get(key, 0) + value
+
+    if timings is not None:
+        timings["blending"] = timings.get("blending", 0.0) + blend_time
+        timings["roi_fraction"] = roi_area / (height * width)
+        if roi_area:
+            timings["redundant_pixel_ratio"] = timings["tiles"] * sr_model.tile_size ** 2 / roi_area - 1.0
+            if "skipped_fraction" in timings:
+                avoided = timings["tiles_skipped_blank"] + timings["tiles_memo_hits"]
+                timings["skipped_fraction"] = avoided / timings["tiles"] if timings["tiles"] else 0.0
+
+    return out_img
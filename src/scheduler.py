@@ -0,0 +1,241 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from PIL import Image
+
+from src import tracing
+from src.config import *
+
+# Le scansioni più grandi superano il limite anti decompression-bomb di PIL
+Image.MAX_IMAGE_PIXELS = None
+
+
+def total_memory_bytes() -> int | None:
+    """
+    Return the physical memory of the machine in bytes, or None if unknown.
+    """
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, AttributeError, OSError):
+        pass
+
+    try:
+        import psutil
+        return psutil.virtual_memory().total
+    except ImportError:
+        return None
+
+
+def memory_budget_bytes(budget_gb: float | None = MEMORY_BUDGET_GB) -> int:
+    """
+    Resolve the RAM budget: the configured value, or a fraction of the physical memory.
+    """
+    if budget_gb is not None:
+        return int(budget_gb * 1024 ** 3)
+    total = total_memory_bytes()
+    if total is None:
+        raise RuntimeError("Impossibile determinare la RAM totale: impostare MEMORY_BUDGET_GB in config.py")
+    return int(total * MEMORY_BUDGET_FRACTION)
+
+
+def read_image_size(image_path: Path) -> tuple[int, int]:
+    """
+    Read (width, height) from the image header, without decoding the pixels.
+    """
+    with Image.open(image_path) as img:
+        return img.size
+
+
+def read_image_sizes(image_paths: list[Path], index=None) -> dict[Path, tuple[int, int]]:
+    """
+    (width, height) of each image, from the metadata index when given and up to date,
+    otherwise from the image header.
+    """
+    sizes = index.sizes(image_paths) if index is not None else {}
+    for path in image_paths:
+        if path in sizes:
+            continue
+        try:
+            sizes[path] = read_image_size(path)
+        except Exception as e:
+            print(f"⚠️ Impossibile leggere le dimensioni di {path}: {e}")
+    return sizes
+
+
+def order_largest_first(images: list[Path], sizes: dict[Path, tuple[int, int]]) -> list[Path]:
+    """
+    Sort images by decreasing area (longest-processing-time first).
+
+    Images whose header could not be read are ordered by file size, after the others.
+    """
+    def key(path: Path):
+        if path in sizes:
+            width, height = sizes[path]
+            return (1, width * height)
+        return (0, path.stat().st_size)
+
+    return sorted(images, key=key, reverse=True)
+
+
+def fill_work_queue(work_queue, images: list[Path], consumers: int):
+    """
+    Put the images in the shared queue followed by one `None` sentinel per consumer thread.
+    """
+    for img in images:
+        work_queue.put(img)
+    for _ in range(consumers):
+        work_queue.put(None)
+
+
+def estimate_peak_memory(width: int, height: int, scale: int = SUPER_RESOLUTION_PAR,
+                         strip_height: int | None = None) -> int:
+    """
+    Estimate the peak memory, in bytes, of super-resolution plus downscaling of one image.
+
+    The model is `base + per_scale2 * scale²` bytes per input pixel: the base covers the
+    decoded input and its float32 copy, the second term the upscaled float32 tiles,
+    blending buffers and output copies. In strip mode the float32 buffers only cover one
+    strip, while the uint8 input and output still cover the whole image.
+
+    Args:
+        width (int): Input width in pixels.
+        height (int): Input height in pixels.
+        scale (int): Super-resolution factor.
+        strip_height (int, optional): Strip height in input pixels, None for the whole image.
+
+    Returns:
+        int: Estimated peak memory in bytes.
+    """
+    pixels = width * height
+    per_pixel = MEMORY_BYTES_PER_PIXEL_BASE + MEMORY_BYTES_PER_PIXEL_PER_SCALE2 * scale ** 2
+    if strip_height is None or strip_height >= height:
+        return int(pixels * per_pixel)
+
+    # Striscia con contesto sopra e sotto, più input e output uint8 interi
+    strip_pixels = width * (strip_height + 2 * STRIP_MARGIN_PX)
+    whole_image = pixels * (MEMORY_BYTES_PER_PIXEL_DECODED + MEMORY_BYTES_PER_PIXEL_OUTPUT * scale ** 2)
+    return int(strip_pixels * per_pixel + whole_image)
+
+
+class MemoryJob:
+    """
+    Engine mode and estimated memory chosen for one image.
+    """
+
+    def __init__(self, image_path: Path, size: tuple[int, int] | None, bytes_needed: int,
+                 strip_height: int | None = None):
+        self.image_path = image_path
+        self.size = size
+        self.bytes_needed = bytes_needed
+        self.strip_height = strip_height
+
+    @property
+    def megapixels(self) -> float:
+        return self.size[0] * self.size[1] / 1e6 if self.size else 0.0
+
+    @property
+    def mode(self) -> str:
+        return "strips" if self.strip_height is not None else "full"
+
+
+def plan_memory_job(image_path: Path, size: tuple[int, int] | None, budget_bytes: int,
+                    scale: int = SUPER_RESOLUTION_PAR) -> MemoryJob:
+    """
+    Choose between full-image and strip-wise processing so that the image fits the budget alone.
+    """
+    if size is None:
+        return MemoryJob(image_path, None, 0)
+
+    width, height = size
+    full = estimate_peak_memory(width, height, scale)
+    if full <= budget_bytes:
+        return MemoryJob(image_path, size, full)
+
+    strip_height = STRIP_HEIGHT_PX
+    while strip_height > STRIP_MIN_HEIGHT_PX and estimate_peak_memory(width, height, scale, strip_height) > budget_bytes:
+        strip_height //= 2
+    strip_height = max(strip_height, STRIP_MIN_HEIGHT_PX)
+    return MemoryJob(image_path, size, estimate_peak_memory(width, height, scale, strip_height), strip_height)
+
+
+class MemoryAdmission:
+    """
+    Admits jobs only while the sum of their estimated memory stays within a budget.
+
+    With a `multiprocessing.Manager` lock and value the budget is shared by every
+    process of the pool; without them it only covers the threads of this process.
+    A job larger than the whole budget is still admitted when nothing else is running.
+    With a Manager dict as `holders`, the bytes held by each process are tracked, so
+    those of a process that died can be given back with `release_process`.
+    """
+
+    def __init__(self, budget_bytes: int, lock=None, used=None, poll_interval: float = 0.2, holders=None):
+        self.budget_bytes = budget_bytes
+        self.lock = lock if lock is not None else threading.Lock()
+        self.used = used
+        self._local_used = 0
+        self.poll_interval = poll_interval
+        self.holders = holders
+
+    def _get_used(self) -> int:
+        return self.used.value if self.used is not None else self._local_used
+
+    def _set_used(self, value: int):
+        if self.used is not None:
+            self.used.value = value
+        else:
+            self._local_used = value
+
+    def try_acquire(self, nbytes: int) -> bool:
+        with self.lock:
+            used = self._get_used()
+            if used == 0 or used + nbytes <= self.budget_bytes:
+                self._set_used(used + nbytes)
+                self._hold(os.getpid(), nbytes)
+                return True
+            return False
+
+    def acquire(self, nbytes: int):
+        if self.try_acquire(nbytes):
+            return
+        with tracing.span("memory_admission_wait", mb=nbytes // (1024 * 1024)):
+            while not self.try_acquire(nbytes):
+                time.sleep(self.poll_interval)
+
+    def release(self, nbytes: int):
+        with self.lock:
+            self._set_used(max(0, self._get_used() - nbytes))
+            self._hold(os.getpid(), -nbytes)
+
+    def _hold(self, pid: int, nbytes: int):
+        if self.holders is not None:
+            held = self.holders.get(pid, 0) + nbytes
+            if held > 0:
+                self.holders[pid] = held
+            else:
+                self.holders.pop(pid, None)
+
+    def release_process(self, pid: int) -> int:
+        """
+        Give back the bytes still held by a dead process.
+
+        Returns:
+            int: Bytes released.
+        """
+        if self.holders is None:
+            return 0
+        with self.lock:
+            nbytes = self.holders.pop(pid, 0)
+            self._set_used(max(0, self._get_used() - nbytes))
+        return nbytes
+
+    @contextmanager
+    def admit(self, nbytes: int):
+        self.acquire(nbytes)
+        try:
+            yield
+        finally:
+            self.release(nbytes)
@@ -0,0 +1,288 @@
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+
+from src.paths import *
+from src.config import *
+
+
+def _bucket(directory: Path) -> str:
+    return hashlib.sha1(str(directory).encode("utf-8")).hexdigest()[:12]
+
+
+def staged_input_path(stage_dir: Path, image_path: Path) -> Path:
+    """
+    Local copy of an input image. The file name is kept, so outputs are named as with the original.
+    """
+    return Path(stage_dir) / "inputs" / _bucket(image_path.parent) / image_path.name
+
+
+def _copy_atomic(src: Path, dst: Path, retries: int = STAGING_RETRIES) -> int:
+    """
+    Copy `src` to a temporary name next to `dst`, then rename it in place.
+
+    Returns:
+        int: Bytes copied.
+    """
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.{uuid.uuid4().hex[:8]}.part")
+    for attempt in range(retries):
+        try:
+            shutil.copyfile(src, tmp)
+            size = tmp.stat().st_size
+            if size != src.stat().st_size:
+                raise OSError(f"copia incompleta: {size} byte su {src.stat().st_size}")
+            os.replace(tmp, dst)
+            return size
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            if attempt == retries - 1:
+                raise
+            # File bloccato o share momentaneamente irraggiungibile: attesa crescente
+            time.sleep(0.5 * 2 ** attempt)
+
+
+class _Throughput:
+    def __init__(self):
+        self.bytes = 0
+        self.seconds = 0.0
+        self.files = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def add(self, nbytes: int, seconds: float):
+        with self.lock:
+            self.bytes += nbytes
+            self.seconds += seconds
+            self.files += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "files": self.files,
+            "failed": self.failed,
+            "mb": self.bytes / (1024 * 1024),
+            "mb_s": self.bytes / (1024 * 1024) / self.seconds if self.seconds else 0.0,
+        }
+
+
+class Prefetcher:
+    """
+    Copies the upcoming input images of a folder onto local disk, ahead of the workers.
+
+    Runs in the main process and follows the order of the work queue, keeping at most
+    `window` local copies that the workers have not released yet. Each free slot is
+    refilled with the next images, copied in path order (directory order on the share).
+    Every image waiting to be staged has a `.pending` marker, so workers know whether
+    to wait for the local copy or to read the share directly. An image released before
+    its copy is made (a worker that stopped waiting for it) is not staged, or its late
+    copy is dropped, so it does not hold a slot of the window.
+    """
+
+    def __init__(self, stage_dir: Path = STAGING_DIR, window: int = STAGING_READ_AHEAD):
+        self.stage_dir = Path(stage_dir)
+        self.window = window
+        self.throughput = _Throughput()
+        self.max_depth = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, images: list[Path]):
+        for img in images:
+            marker = _pending_marker(staged_input_path(self.stage_dir, img))
+            marker.parent.mkdir(parents=True, exist_ok=True)
+            marker.touch()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(list(images),), name="prefetch", daemon=True)
+        self._thread.start()
+
+    def _loop(self, images: list[Path]):
+        staged = []
+        position = 0
+        while position < len(images) and not self._stop.is_set():
+            staged = [local for local in staged if local.exists()]  # copie non ancora rilasciate
+            self.max_depth = max(self.max_depth, len(staged))
+            free = self.window - len(staged)
+            if free <= 0:
+                self._stop.wait(0.05)
+                continue
+
+            batch = sorted(images[position:position + free])
+            position += len(batch)
+            for img in batch:
+                if self._stop.is_set():
+                    break
+                local = staged_input_path(self.stage_dir, img)
+                marker = _pending_marker(local)
+                if not marker.exists():
+                    continue  # già rilasciata: letta dalla share
+                t0 = time.perf_counter()
+                try:
+                    nbytes = _copy_atomic(img, local)
+                    self.throughput.add(nbytes, time.perf_counter() - t0)
+                except OSError as e:
+                    self.throughput.failed += 1
+                    print(f"⚠️ Prefetch fallito per {img.name}: {e} (verrà letto dalla share)")
+                    marker.unlink(missing_ok=True)
+                    continue
+                try:
+                    marker.unlink()
+                except FileNotFoundError:
+                    local.unlink(missing_ok=True)  # rilasciata durante la copia
+                    continue
+                staged.append(local)
+
+    def stop(self):
+        """
+        Stop prefetching and remove the markers of images not staged.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for marker in (self.stage_dir / "inputs").rglob("*.pending"):
+            marker.unlink(missing_ok=True)
+
+    def release(self, images: list[Path]):
+        """
+        Drop the local copies of images no worker will release (e.g. those of a crashed
+        worker): they are read from the share if processed again.
+        """
+        for img in images:
+            _release_local(staged_input_path(self.stage_dir, img))
+
+    def stats(self) -> dict:
+        return dict(self.throughput.to_dict(), max_depth=self.max_depth, window=self.window)
+
+
+def _pending_marker(local: Path) -> Path:
+    return local.with_name(local.name + ".pending")
+
+
+def _release_local(local: Path):
+    # Prima il marker: una copia ancora in corso viene scartata dal prefetcher
+    _pending_marker(local).unlink(missing_ok=True)
+    local.unlink(missing_ok=True)
+
+
+class StagingCache:
+    """
+    Worker-side half of the staging layer.
+
+    Inputs are read from the local copy made by the `Prefetcher` when there is one.
+    Outputs are written under the local staging directory and uploaded by a pool of
+    threads, each copied to a temporary name at the destination and renamed in place,
+    so a partial file is never visible there. At most `max_pending` uploads are queued:
+    beyond that, `upload` blocks until one finishes. Each upload returns a future, so the
+    caller can treat an output as written only once it is on the share.
+    """
+
+    def __init__(self, stage_dir: Path = STAGING_DIR, upload_workers: int = STAGING_UPLOAD_WORKERS,
+                 max_pending: int = STAGING_MAX_PENDING_UPLOADS, retries: int = STAGING_RETRIES,
+                 input_wait_s: float = STAGING_INPUT_WAIT_S):
+        self.stage_dir = Path(stage_dir)
+        self.retries = retries
+        self.input_wait_s = input_wait_s
+        self.executor = ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix="upload")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.uploads = _Throughput()
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.input_waits = 0
+        self.input_wait_seconds = 0.0
+        self.input_timeouts = 0
+        self.staged_reads = 0
+        self._lock = threading.Lock()
+        self._futures = []
+
+    def local_input(self, image_path: Path) -> Path:
+        """
+        Path to read `image_path` from: the local copy, waiting for it (up to `input_wait_s`)
+        if the prefetcher still has to stage it, or the original if it is not being staged.
+        """
+        local = staged_input_path(self.stage_dir, image_path)
+        marker = _pending_marker(local)
+        if marker.exists() and not local.exists():
+            t0 = time.perf_counter()
+            deadline = t0 + self.input_wait_s
+            while marker.exists() and not local.exists():
+                if time.perf_counter() >= deadline:
+                    # Prefetcher fermo o in ritardo: si legge dalla share, la copia verrà scartata
+                    marker.unlink(missing_ok=True)
+                    with self._lock:
+                        self.input_timeouts += 1
+                    break
+                time.sleep(0.02)
+            with self._lock:
+                self.input_waits += 1
+                self.input_wait_seconds += time.perf_counter() - t0
+        if local.exists():
+            with self._lock:
+                self.staged_reads += 1
+            return local
+        return image_path
+
+    def release_input(self, image_path: Path):
+        _release_local(staged_input_path(self.stage_dir, image_path))
+
+    def local_output_dir(self, output_dir: Path) -> Path:
+        return self.stage_dir / "outputs" / _bucket(output_dir)
+
+    def upload(self, local_path: Path, destination: Path) -> Future:
+        """
+        Queue the upload of a finished local file; the local copy is removed afterwards.
+
+        Returns:
+            Future: Bytes copied, or the `OSError` of the last attempt (the local copy is kept).
+        """
+        self.slots.acquire()
+        with self._lock:
+            self.pending += 1
+            self.max_pending_seen = max(self.max_pending_seen, self.pending)
+            future = self.executor.submit(self._upload, Path(local_path), Path(destination))
+            self._futures = [f for f in self._futures if not f.done()] + [future]
+        return future
+
+    def _upload(self, local_path: Path, destination: Path) -> int:
+        t0 = time.perf_counter()
+        try:
+            nbytes = _copy_atomic(local_path, destination, self.retries)
+            self.uploads.add(nbytes, time.perf_counter() - t0)
+            local_path.unlink(missing_ok=True)
+            return nbytes
+        except OSError as e:
+            with self.uploads.lock:
+                self.uploads.failed += 1
+            print(f"❌ Upload fallito: {local_path.name} -> {destination}: {e} (copia locale in {local_path})")
+            raise
+        finally:
+            with self._lock:
+                self.pending -= 1
+            self.slots.release()
+
+    def flush(self):
+        """
+        Wait for every queued upload; failures are already counted and reported to their callers.
+        """
+        with self._lock:
+            futures, self._futures = self._futures, []
+        wait(futures)
+
+    def close(self):
+        self.flush()
+        self.executor.shutdown()
+
+    def stats(self) -> dict:
+        return dict(
+            self.uploads.to_dict(),
+            pending=self.pending,
+            max_pending=self.max_pending_seen,
+            staged_reads=self.staged_reads,
+            input_waits=self.input_waits,
+            input_wait_s=self.input_wait_seconds,
+            input_timeouts=self.input_timeouts,
+        )
@@ -0,0 +1,317 @@
+import os
+import threading
+import multiprocessing
+from collections import Counter, deque
+from pathlib import Path
+from queue import Empty
+
+from src.config import *
+from src.core_budget import ThreadPlan, apply_thread_plan
+from src.metrics import current_rss_mb
+from src.leases import process_node_id
+
+
+def _image_of(item) -> Path:
+    # Elementi della modalità --watch: (immagine, PPI, piano, job)
+    return item[0] if isinstance(item, tuple) else item
+
+
+class WorkerControl:
+    """
+    Worker-process side of the supervisor: reports each image started and finished,
+    and asks to be recycled after `max_images` images or above `max_rss_gb` of RSS.
+
+    Once recycling is requested the threads finish their current image and stop pulling
+    from the inbox (see `should_stop`); the images still queued there are dispatched
+    again by the supervisor.
+    """
+
+    def __init__(self, events, max_images: int | None = WORKER_MAX_IMAGES, max_rss_gb: float | None = WORKER_MAX_RSS_GB):
+        self.events = events
+        self.pid = os.getpid()
+        self.max_images = max_images
+        self.max_rss_mb = max_rss_gb * 1024 if max_rss_gb else None
+        self.images = 0
+        self.recycle_reason = None
+        self._lock = threading.Lock()
+
+    def started(self, image_path: Path):
+        self.events.put(("start", self.pid, image_path))
+
+    def done(self, image_path: Path, status: str):
+        self.events.put(("done", self.pid, image_path, status))
+        with self._lock:
+            self.images += 1
+            if self.recycle_reason is not None:
+                return
+            if self.max_images and self.images >= self.max_images:
+                reason = "images"
+            elif self.max_rss_mb and (current_rss_mb() or 0) > self.max_rss_mb:
+                reason = "rss"
+            else:
+                return
+            self.recycle_reason = reason
+        self.events.put(("retire", self.pid, reason))
+
+    def should_stop(self) -> bool:
+        return self.recycle_reason is not None
+
+    def exit(self, counts: dict):
+        """
+        Last message of a clean exit, with the counters of the process.
+        """
+        self.events.put(("exit", self.pid, counts, self.recycle_reason))
+
+
+def _bootstrap(target, plan: ThreadPlan | None, inbox, events, max_images, max_rss_gb):
+    # Piano dei core applicato prima del caricamento del modello (ORT legge i thread alla creazione)
+    if plan is not None:
+        apply_thread_plan(plan)
+    target(inbox, control=WorkerControl(events, max_images, max_rss_gb))
+
+
+class _Slot:
+    """
+    One worker process of the pool, with its inbox and the images dispatched to it.
+    """
+
+    def __init__(self, index: int, process, inbox):
+        self.index = index
+        self.process = process
+        self.inbox = inbox
+        self.outstanding = {}  # immagine -> elemento inviato e non ancora completato
+        self.started = set()   # immagini in elaborazione (ricevuto "start")
+        self.retiring = None   # motivo del riciclo richiesto
+        self.exited = False    # ricevuto "exit": uscita pulita
+        self.recycle_reason = None
+
+
+class WorkerSupervisor:
+    """
+    Pool of worker processes that survives the death of a worker.
+
+    Every process has its own inbox, fed with at most `threads` images at a time (one per
+    thread) in submission order, so the supervisor always knows which images each process
+    holds. When a process dies without a clean exit, a new one takes its slot and only
+    its images go back to the front of the queue; its memory reservations and leases are
+    released. An image in progress during `max_crashes` crashes is quarantined, so one
+    image that kills the process (e.g. a corrupt file crashing a native decoder) cannot
+    stop the run.
+
+    The target runs in each process as `target(inbox, control=WorkerControl)`: it consumes
+    the inbox until a `None` sentinel per thread or until `control.should_stop()`,
+    reporting every image with `control.started`/`control.done` and finally `control.exit(counts)`.
+
+    Args:
+        target (callable): Worker-process function (a `partial` of `process_batch` or `process_stream`).
+        processes (int): Worker processes.
+        threads (int): Threads per process (images dispatched to each process at a time).
+        manager: `multiprocessing.Manager` for the queues.
+        plans (list[ThreadPlan], optional): Thread plan of each slot.
+        memory_admission (MemoryAdmission, optional): Shared budget, with per-process holders.
+        leases (LeaseManager, optional): Leases of this node, to break those of dead processes.
+        quarantine (Quarantine, optional): Where images crashing their process end up.
+        release_inputs (callable, optional): Called with the images of a dead process, e.g.
+            `Prefetcher.release`, so their staged copies do not hold the read-ahead window.
+    """
+
+    def __init__(self, target, processes: int, threads: int, manager, plans: list[ThreadPlan] | None = None,
+                 memory_admission=None, leases=None, quarantine=None, release_inputs=None,
+                 max_images: int | None = WORKER_MAX_IMAGES, max_rss_gb: float | None = WORKER_MAX_RSS_GB,
+                 max_crashes: int = WORKER_MAX_CRASHES_PER_IMAGE,
+                 max_startup_failures: int = WORKER_MAX_STARTUP_FAILURES):
+        self.target = target
+        self.processes = processes
+        self.threads = threads
+        self.manager = manager
+        self.plans = plans
+        self.memory_admission = memory_admission
+        self.leases = leases
+        self.quarantine = quarantine
+        self.release_inputs = release_inputs
+        self.max_images = max_images
+        self.max_rss_gb = max_rss_gb
+        self.max_crashes = max_crashes
+        self.max_startup_failures = max_startup_failures
+
+        self.context = multiprocessing.get_context("spawn")
+        self.events = manager.Queue()
+        self.pending = deque()
+        self.slots = {}       # indice -> _Slot
+        self._by_pid = {}     # pid -> _Slot
+        self.crashes = Counter()  # immagine -> crash del processo durante la sua elaborazione
+        self.startup_failures = 0
+        self.stopping = False
+
+        # Contatori restituiti dai processi usciti in modo pulito
+        self.results = []
+        self.stats = {"restarts": 0, "recycles": 0, "requeued": 0, "lost": 0}
+
+    def start(self):
+        for index in range(self.processes):
+            self._spawn(index)
+        self._dispatch()
+
+    def _spawn(self, index: int):
+        plan = self.plans[index % len(self.plans)] if self.plans else None
+        inbox = self.manager.Queue()
+        process = self.context.Process(
+            target=_bootstrap,
+            args=(self.target, plan, inbox, self.events, self.max_images, self.max_rss_gb),
+            daemon=True,
+        )
+        process.start()
+        slot = _Slot(index, process, inbox)
+        self.slots[index] = slot
+        self._by_pid[process.pid] = slot
+
+    def submit(self, items):
+        """
+        Queue images (or work items) behind those already waiting.
+        """
+        self.pending.extend(items)
+        self._dispatch()
+
+    def busy(self) -> bool:
+        return bool(self.pending) or any(slot.outstanding for slot in self.slots.values())
+
+    def poll(self, timeout: float = 0.0) -> list[tuple[Path, str]]:
+        """
+        Collect the events of the workers, replace the dead ones and dispatch more images.
+
+        Args:
+            timeout (float): Wait up to this long for the first event.
+
+        Returns:
+            list[tuple[Path, str]]: (image, status) of the images finished since the last call.
+        """
+        finished = []
+        self._drain(finished, timeout)
+        self._reap(finished)
+        self._dispatch()
+        return finished
+
+    def _drain(self, finished: list, timeout: float = 0.0):
+        block = timeout > 0
+        while True:
+            try:
+                event = self.events.get(timeout=timeout) if block else self.events.get_nowait()
+            except Empty:
+                return
+            block = False
+            self._handle(event, finished)
+
+    def _handle(self, event: tuple, finished: list):
+        kind, pid = event[0], event[1]
+        slot = self._by_pid.get(pid)
+        if slot is None:
+            return
+        if kind == "start":
+            slot.started.add(event[2])
+        elif kind == "done":
+            image_path, status = event[2], event[3]
+            slot.started.discard(image_path)
+            if slot.outstanding.pop(image_path, None) is not None:
+                self.crashes.pop(image_path, None)
+                self.startup_failures = 0
+                finished.append((image_path, status))
+        elif kind == "retire":
+            slot.retiring = event[2]
+        elif kind == "exit":
+            self.results.append(event[2])
+            slot.exited = True
+            slot.recycle_reason = event[3]
+
+    def _reap(self, finished: list):
+        dead = [slot for slot in self.slots.values() if not slot.process.is_alive()]
+        if not dead:
+            return
+        # I messaggi inviati prima dell'uscita sono già nella coda degli eventi
+        self._drain(finished)
+        for slot in dead:
+            slot.process.join()
+            del self._by_pid[slot.process.pid]
+            del self.slots[slot.index]
+            if slot.exited:
+                if slot.recycle_reason is not None:
+                    self.stats["recycles"] += 1
+            else:
+                self._crashed(slot, finished)
+            # Immagini inviate ma non iniziate: di nuovo in testa alla coda, nell'ordine originale
+            requeue = list(slot.outstanding.values())
+            self.pending.extendleft(reversed(requeue))
+            self.stats["requeued"] += len(requeue)
+            if not self.stopping:
+                self._spawn(slot.index)
+
+    def _crashed(self, slot: _Slot, finished: list):
+        pid = slot.process.pid
+        exitcode = slot.process.exitcode
+        self.stats["restarts"] += 1
+        print(f"⚠️ Processo worker {pid} terminato (exit code {exitcode}): "
+              f"{len(slot.started)} immagini in corso, {len(slot.outstanding)} da rimettere in coda")
+
+        if self.memory_admission is not None:
+            self.memory_admission.release_process(pid)
+        if self.leases is not None:
+            node_id = process_node_id(pid)
+            for image_path in slot.outstanding:
+                self.leases.break_lease(image_path, node_id)
+        if self.release_inputs is not None and slot.outstanding:
+            self.release_inputs(list(slot.outstanding))
+
+        if not slot.started:
+            # Caduto prima di iniziare un'immagine: errore di avvio (modello, ambiente), non dell'input
+            self.startup_failures += 1
+            if self.startup_failures >= self.max_startup_failures:
+                raise RuntimeError(f"{self.startup_failures} processi worker terminati all'avvio "
+                                   f"(ultimo exit code {exitcode})")
+            return
+
+        for image_path in slot.started:
+            self.crashes[image_path] += 1
+            if self.crashes[image_path] < self.max_crashes:
+                continue
+            slot.outstanding.pop(image_path, None)
+            del self.crashes[image_path]
+            self.stats["lost"] += 1
+            reason = f"processo terminato (exit code {exitcode})"
+            print(f"🚫 {image_path}: {reason} {self.max_crashes} volte, in quarantena")
+            if self.quarantine is not None:
+                self.quarantine.add(image_path, "process", reason, self.max_crashes)
+            finished.append((image_path, "failed"))
+
+    def _dispatch(self):
+        # Un'immagine per processo a giro, finché ogni thread ne ha una
+        while self.pending:
+            dispatched = False
+            for slot in self.slots.values():
+                if not self.pending:
+                    break
+                if slot.retiring is not None or slot.exited or len(slot.outstanding) >= self.threads:
+                    continue
+                item = self.pending.popleft()
+                slot.outstanding[_image_of(item)] = item
+                slot.inbox.put(item)
+                dispatched = True
+            if not dispatched:
+                return
+
+    def stop(self, timeout: float | None = None):
+        """
+        Let every process finish and exit (one `None` per thread), then collect its counters.
+        """
+        self.stopping = True
+        for slot in self.slots.values():
+            for _ in range(self.threads):
+                slot.inbox.put(None)
+        for slot in list(self.slots.values()):
+            slot.process.join(timeout)
+        self.poll()
+
+    def terminate(self):
+        self.stopping = True
+        for slot in self.slots.values():
+            slot.process.terminate()
+        for slot in self.slots.values():
+            slot.process.join()
@@ -0,0 +1,130 @@
+import struct
+from pathlib import Path
+
+# Tag TIFF letti dall'header (TIFF 6.0)
+TIFF_TAGS = {
+    256: "width",
+    257: "height",
+    258: "bits_per_sample",
+    259: "compression",
+    262: "photometric",
+    271: "make",
+    272: "model",
+    274: "orientation",
+    277: "samples_per_pixel",
+    282: "x_resolution",
+    283: "y_resolution",
+    296: "resolution_unit",
+    305: "software",
+}
+
+# Tipo TIFF -> (formato struct, dimensione in byte)
+_TYPES = {
+    1: ("B", 1),   # BYTE
+    2: ("s", 1),   # ASCII
+    3: ("H", 2),   # SHORT
+    4: ("I", 4),   # LONG
+    5: ("II", 8),  # RATIONAL
+    7: ("B", 1),   # UNDEFINED
+    9: ("i", 4),   # SLONG
+    10: ("ii", 8), # SRATIONAL
+    16: ("Q", 8),  # LONG8 (BigTIFF)
+}
+
+RESOLUTION_UNITS = {1: None, 2: "inch", 3: "cm"}
+
+
+class TiffMetadata:
+    """
+    Size and resolution tags of the first image of a TIFF file.
+    """
+
+    def __init__(self, path: Path, tags: dict):
+        self.path = Path(path)
+        self.tags = tags
+        self.width = tags.get("width")
+        self.height = tags.get("height")
+        self.x_resolution = tags.get("x_resolution")
+        self.y_resolution = tags.get("y_resolution")
+        # Il valore di default del formato TIFF è il pollice
+        self.resolution_unit = RESOLUTION_UNITS.get(tags.get("resolution_unit", 2))
+
+    @property
+    def ppi(self) -> float | None:
+        """
+        Horizontal resolution in pixels per inch, or None if missing, unitless or anisotropic.
+        """
+        if not self.x_resolution or not self.resolution_unit:
+            return None
+        if self.y_resolution and abs(self.x_resolution - self.y_resolution) > 0.01 * self.x_resolution:
+            return None
+        return self.x_resolution * (2.54 if self.resolution_unit == "cm" else 1)
+
+
+def _read_value(f, byte_order: str, type_id: int, count: int, inline: bytes, offset_size: int):
+    fmt, size = _TYPES[type_id]
+    total = size * count
+    if total <= offset_size:
+        data = inline[:total]
+    else:
+        offset = struct.unpack(byte_order + ("Q" if offset_size == 8 else "I"), inline)[0]
+        f.seek(offset)
+        data = f.read(total)
+        if len(data) < total:
+            raise ValueError("Tag TIFF oltre la fine del file")
+
+    if type_id == 2:
+        return data.split(b"\0", 1)[0].decode("latin-1").strip()
+    values = struct.unpack(byte_order + fmt * count, data)
+    if type_id in (5, 10):
+        values = tuple(num / den if den else 0.0 for num, den in zip(values[::2], values[1::2]))
+    return values[0] if count == 1 else values
+
+
+def read_tiff_metadata(path: Path) -> TiffMetadata:
+    """
+    Read the tags of the first IFD without decoding the pixels (a few small reads).
+
+    Raises:
+        ValueError: If the file is not a (Big)TIFF or the header is truncated.
+    """
+    with open(path, "rb") as f:
+        header = f.read(16)
+        if header[:2] == b"II":
+            byte_order = "<"
+        elif header[:2] == b"MM":
+            byte_order = ">"
+        else:
+            raise ValueError(f"Non è un file TIFF: {path}")
+
+        magic = struct.unpack(byte_order + "H", header[2:4])[0]
+        if magic == 42:
+            offset_size, count_fmt, entry_size = 4, "H", 12
+            ifd_offset = struct.unpack(byte_order + "I", header[4:8])[0]
+        elif magic == 43:
+            offset_size, count_fmt, entry_size = 8, "Q", 20
+            ifd_offset = struct.unpack(byte_order + "Q", header[8:16])[0]
+        else:
+            raise ValueError(f"Non è un file TIFF: {path}")
+
+        f.seek(ifd_offset)
+        count_bytes = f.read(struct.calcsize(count_fmt))
+        if len(count_bytes) < struct.calcsize(count_fmt):
+            raise ValueError(f"Header TIFF troncato: {path}")
+        count = struct.unpack(byte_order + count_fmt, count_bytes)[0]
+        entries = f.read(count * entry_size)
+        if len(entries) < count * entry_size:
+            raise ValueError(f"Header TIFF troncato: {path}")
+
+        tags = {}
+        for i in range(count):
+            entry = entries[i * entry_size:(i + 1) * entry_size]
+            if offset_size == 4:
+                tag, type_id, value_count = struct.unpack(byte_order + "HHI", entry[:8])
+            else:
+                tag, type_id, value_count = struct.unpack(byte_order + "HHQ", entry[:12])
+            if tag not in TIFF_TAGS or type_id not in _TYPES:
+                continue
+            tags[TIFF_TAGS[tag]] = _read_value(f, byte_order, type_id, value_count,
+                                               entry[-offset_size:], offset_size)
+    return TiffMetadata(path, tags)
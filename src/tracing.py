@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import nullcontext
+from pathlib import Path
+
+# Tracer attivo nel processo corrente (None = tracing disabilitato)
+_tracer = None
+_NULL_SPAN = nullcontext()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.add_complete(self.name, self.start, end, self.args)
+        return False
+
+
+class Tracer:
+    """
+    Collects Chrome trace-event spans for the current process.
+
+    Timestamps are taken with `perf_counter_ns` and shifted to the wall clock
+    so that files written by different processes can be merged.
+    """
+
+    def __init__(self, trace_dir: Path, process_name: str = ""):
+        self.pid = os.getpid()
+        self.path = Path(trace_dir) / f"trace_{self.pid}_{time.time_ns()}.json"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.events: list[dict] = []
+        self.thread_names: dict[int, str] = {}
+        self.offset_us = time.time_ns() / 1000 - time.perf_counter_ns() / 1000
+        self.process_name = process_name or f"pid {self.pid}"
+
+    def add_complete(self, name: str, start_ns: int, end_ns: int, args: dict):
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        self.events.append({
+            "name": name,
+            "ph": "X",
+            "ts": start_ns / 1000 + self.offset_us,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": self.pid,
+            "tid": tid,
+            "args": args,
+        })
+
+    def flush(self):
+        metadata = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": self.process_name}}]
+        metadata += [
+            {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+            for tid, name in self.thread_names.items()
+        ]
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(metadata + self.events, f, default=str)
+
+
+def enable(trace_dir: Path, process_name: str = "") -> Tracer:
+    """
+    Enable tracing in the current process; the file is written on `flush()` or at exit.
+    """
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(trace_dir, process_name)
+        atexit.register(flush)
+    return _tracer
+
+
+def is_enabled() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, **args):
+    """
+    Context manager recording a span named `name`; a shared no-op if tracing is disabled.
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _Span(_tracer, name, args)
+
+
+def flush():
+    if _tracer is not None:
+        _tracer.flush()
+
+
+def merge_traces(trace_dir: Path, output_path: Path) -> Path:
+    """
+    Merge every per-process trace file in `trace_dir` into one trace-event JSON
+    viewable in Perfetto or chrome://tracing.
+
+    Args:
+        trace_dir (Path): Directory with the per-process `trace_*.json` files.
+        output_path (Path): Destination of the merged trace.
+
+    Returns:
+        Path: The merged trace path.
+    """
+    events = []
+    for path in sorted(Path(trace_dir).glob("trace_*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            events.extend(json.load(f))
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return output_path
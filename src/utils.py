@@ -9,14 +9,28 @@ from typing import Tuple
 
 from src.paths import *
 from src.config import *
+from src.intermediates import RAW_SUFFIX, is_valid_raw_file
+from src.integrity import WrittenFile, verify_written
 
 def validate_image_with_logging(image_path, step, logger):
-    valid, err = is_valid_image_file(image_path)
+    # Gli intermedi grezzi (.npy) non sono immagini: si controllano header e dimensione
+    check = is_valid_raw_file if Path(image_path).suffix == RAW_SUFFIX else is_valid_image_file
+    valid, err = check(image_path)
     if not valid:
         logger.log(image_path, step, success=False, error=f"Input image invalid: {err}")
         return False
     return True
 
+def verify_output_with_logging(image_path, expected: WrittenFile | None, step, logger):
+    # Output con dimensione e checksum noti: confronto senza decodifica, altrimenti validazione completa
+    if expected is None:
+        return validate_image_with_logging(image_path, step, logger)
+    valid, err = verify_written(image_path, expected)
+    if not valid:
+        logger.log(image_path, step, success=False, error=f"Output image invalid: {err}")
+        return False
+    return True
+
 def resort_csv_log():
     with open(CSV_LOG_PATH, "r", encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -70,6 +84,17 @@ def find_output_dir() -> tuple[Path, Path]:
     return super_res_dir, downscaling_dir
 
 
+def find_ppi_output_dirs(downscaling_dir: Path, target_ppis: list[int]) -> dict[int, Path]:
+    """
+    One deliverable directory per target PPI, next to the downscaling directory
+    (e.g. `downscaled_x2_400ppi`, `downscaled_x2_600ppi`).
+    """
+    dirs = {ppi: downscaling_dir.parent / f"{downscaling_dir.name}_{ppi}ppi" for ppi in target_ppis}
+    for path in dirs.values():
+        os.makedirs(path, exist_ok=True)
+    return dirs
+
+
 def count_all_images(directory: Path) -> list[Path]:
     all_images = []
     for current_dir, _, filenames in os.walk(directory):
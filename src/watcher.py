@@ -0,0 +1,132 @@
+import time
+import threading
+from pathlib import Path
+
+from src.paths import *
+from src.config import *
+
+
+def folder_signature(folder: Path) -> tuple:
+    """
+    (name, size, mtime) of the files directly inside `folder`: it stops changing
+    once the folder has been copied completely.
+    """
+    signature = []
+    for path in folder.iterdir():
+        try:
+            if path.is_file():
+                stat = path.stat()
+                signature.append((path.name, stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            continue  # rimosso o rinominato durante la copia
+    return tuple(sorted(signature))
+
+
+class FolderWatcher:
+    """
+    Reports the folders of the input tree whose content has settled.
+
+    The tree is polled every `poll_interval` seconds; with the optional `watchdog`
+    package, file-system events (inotify on Linux) wake the watcher earlier. Polling is
+    kept anyway, because events are not delivered for changes made by other machines on
+    a network share. A folder is ready once its files have not changed for `settle`
+    seconds; it is reported again if new files arrive later.
+
+    A loop doing other work between scans (e.g. collecting results) calls `poll` only
+    when `due` says so, so the share is not rescanned more often than `poll_interval`.
+    """
+
+    def __init__(self, root: Path = INPUT_IMAGES_DIR, settle: float = WATCH_SETTLE_S,
+                 poll_interval: float = WATCH_POLL_INTERVAL_S, use_events: bool = True):
+        self.root = Path(root)
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.use_events = use_events
+
+        self._seen: dict[Path, tuple[tuple, float]] = {}  # cartella -> (firma, ultima modifica)
+        self._reported: dict[Path, tuple] = {}           # cartella -> firma già segnalata
+        self._wake = threading.Event()
+        self._observer = None
+        self._last_scan = None
+
+    def start(self):
+        if not self.use_events:
+            return
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            print("ℹ️ watchdog non installato: rilevamento delle nuove cartelle solo a polling")
+            return
+
+        wake = self._wake
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                wake.set()
+
+        self._observer = Observer()
+        self._observer.schedule(_Handler(), str(self.root), recursive=True)
+        self._observer.start()
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    def poll(self, now: float | None = None) -> list[Path]:
+        """
+        Scan the tree once.
+
+        Returns:
+            list[Path]: Folders that settled since the last report, oldest change first.
+        """
+        now = time.monotonic() if now is None else now
+        # Gli eventi arrivati durante la scansione richiedono la successiva
+        self._wake.clear()
+        self._last_scan = now
+        ready = []
+        folders = [f for f in self.root.rglob("*") if f.is_dir()]
+        for folder in folders:
+            try:
+                signature = folder_signature(folder)
+            except FileNotFoundError:
+                continue
+            if not signature:
+                continue
+
+            previous = self._seen.get(folder)
+            if previous is None or previous[0] != signature:
+                self._seen[folder] = (signature, now)
+                continue
+            if now - previous[1] >= self.settle and self._reported.get(folder) != signature:
+                self._reported[folder] = signature
+                ready.append((previous[1], folder))
+
+        # Le cartelle rimosse vengono dimenticate
+        for folder in set(self._seen) - set(folders):
+            self._seen.pop(folder, None)
+            self._reported.pop(folder, None)
+        return [folder for _, folder in sorted(ready)]
+
+    def due(self, now: float | None = None) -> bool:
+        """
+        Whether the next scan is due: `poll_interval` has passed since the last one, or a
+        file-system event arrived (at most one scan per second during a burst of events).
+        """
+        if self._last_scan is None:
+            return True
+        elapsed = (time.monotonic() if now is None else now) - self._last_scan
+        return elapsed >= self.poll_interval or (self._wake.is_set() and elapsed >= min(1.0, self.poll_interval))
+
+    def wait(self, timeout: float | None = None):
+        """
+        Sleep until the next scan is due, or until a file-system event arrives.
+        """
+        if timeout is None:
+            elapsed = time.monotonic() - self._last_scan if self._last_scan is not None else self.poll_interval
+            timeout = max(0.0, self.poll_interval - elapsed)
+        if self._wake.wait(timeout):
+            # Durante una copia gli eventi arrivano a raffica: al massimo una scansione al secondo
+            time.sleep(min(1.0, self.poll_interval))
@@ -1,20 +1,219 @@
+import time
+import threading
 from pathlib import Path
-from src.utils import is_valid_image_file, validate_image_with_logging
+from queue import Empty
+from contextlib import nullcontext
+from src.utils import is_valid_image_file, validate_image_with_logging, verify_output_with_logging
 from src.paths import *
 from src.config import *
-from src.estimate_ppi_from_ruler import *
-from src.image_processing import apply_super_resolution_single, apply_personalized_downscaling_single
-from logs.logger import CSVLogger
+from src.image_processing import (
+    apply_super_resolution_single, apply_personalized_downscaling_single, apply_fused_processing_single,
+    apply_multi_ppi_processing_single,
+)
+from src.output_planner import OutputPlan
+from src import tracing
+from src.metrics import ImageMetrics, MetricsSink, stage
+from src.scheduler import MemoryAdmission, MemoryJob
+from src.leases import LeaseManager
+from src.staging import StagingCache
+from src.intermediates import IntermediateStore, raw_path
+from src.integrity import OutputState, WrittenFile
+from src.retry import Quarantine, is_input_error, is_transient, retry_delay
+from logs.logger import CSVLogger, QueueLogger
 
 class ImageWorker:
-    def __init__(self, logger: CSVLogger, output_sr_dir: Path, output_final_dir: Path, sr_model, ppi: int):
+    def __init__(self, logger: CSVLogger | QueueLogger, output_sr_dir: Path, output_final_dir: Path, sr_model, ppi: int,
+                 metrics_sink: MetricsSink | None = None, memory_admission: MemoryAdmission | None = None,
+                 memory_jobs: dict[Path, MemoryJob] | None = None, output_plan: OutputPlan | None = None,
+                 target_dirs: dict[int, Path] | None = None, leases: LeaseManager | None = None,
+                 staging: StagingCache | None = None, output_state: OutputState | None = None,
+                 quarantine: Quarantine | None = None):
         self.logger = logger
         self.output_sr_dir = output_sr_dir
         self.output_final_dir = output_final_dir
         self.sr_model = sr_model
         self.ppi = ppi
+        self.metrics_sink = metrics_sink
+        self.memory_admission = memory_admission
+        self.memory_jobs = memory_jobs or {}
+        self.output_plan = output_plan
+        # PPI di destinazione -> cartella di output; None = un solo output al PPI della scansione
+        self.target_dirs = target_dirs
+        self.sr_scale = output_plan.sr_scale if output_plan is not None and output_plan.sr_scale else SUPER_RESOLUTION_PAR
+        # Con più nodi sullo stesso input, ogni immagine viene elaborata solo da chi ne ha il lease
+        self.leases = leases
+        # Input letti dalla copia locale e output caricati sulla share in background
+        self.staging = staging
+        # Intermedi SR grezzi (.npy, mappati in memoria) con quota su disco ed eliminazione LRU
+        self.raw_intermediates = SR_INTERMEDIATE_FORMAT == "npy"
+        self.intermediates = IntermediateStore(output_sr_dir) if self.raw_intermediates else None
+        # Dimensione e checksum degli output scritti, per verificarli senza decodificarli
+        self.output_state = output_state
+        # Errori del file di input: immagine esclusa dalle esecuzioni successive, con il motivo
+        self.quarantine = quarantine
+        self._failure = threading.local()  # eccezione dell'ultimo tentativo di ogni thread
+        self._uploads = threading.local()  # upload in corso dell'immagine di ogni thread
 
-    def run(self, image_path: Path):
+        # Contatori in memoria, restituiti al processo principale a fine batch
+        self.counts = {"ok": 0, "failed": 0, "skipped": 0, "remote": 0, "retried": 0, "quarantined": 0}
+        self._counts_lock = threading.Lock()
+
+    def _count(self, status: str):
+        with self._counts_lock:
+            self.counts[status] += 1
+
+    def _admit(self, job: MemoryJob | None):
+        if self.memory_admission is None or job is None:
+            return nullcontext()
+        return self.memory_admission.admit(job.bytes_needed)
+
+    def run(self, image_path: Path) -> str:
+        if self.leases is not None and not self.leases.claim(image_path):
+            self._count("remote")  # completata o in elaborazione su un altro nodo
+            return "remote"
+
+        metrics = ImageMetrics(image_path) if self.metrics_sink is not None else None
+        status = "failed"
+        self._uploads.pending = []
+        try:
+            with tracing.span("image", image=image_path.name, folder=image_path.parent.name):
+                status, step = self._run_with_retries(image_path, metrics)
+                # Lease completato solo con gli output sulla share: un upload perso si rielabora
+                if not self._await_uploads(image_path):
+                    status, step = "failed", "upload"
+        finally:
+            if self.leases is not None:
+                # Dopo un errore il lease viene rilasciato, così l'immagine può essere ritentata;
+                # un lease perso appartiene ormai all'altro nodo, che completerà l'immagine
+                if status in ("failed", "remote"):
+                    self.leases.release(image_path)
+                else:
+                    self.leases.complete(image_path)
+            if self.staging is not None:
+                self.staging.release_input(image_path)
+        self._count(status)
+        if metrics is not None and status != "skipped":
+            self.metrics_sink.write(metrics.to_record(status, step))
+        return status
+
+    def _run_with_retries(self, image_path: Path, metrics: ImageMetrics | None) -> tuple[str, str]:
+        # Errori transitori: nuovo tentativo della sola immagine; del file di input: quarantena
+        for attempt in range(1, IMAGE_MAX_ATTEMPTS + 1):
+            self._failure.error = None
+            if metrics is not None and attempt > 1:
+                metrics.set("attempts", attempt)
+            status, step = self._run(image_path, metrics)
+            error = self._failure.error
+            if status != "failed" or not is_transient(error):
+                break
+            if attempt == IMAGE_MAX_ATTEMPTS:
+                return status, step  # ancora transitorio: verrà ritentata alla prossima esecuzione
+            delay = retry_delay(attempt)
+            self.logger.log(image_path, "retry", success=False,
+                            error=f"Errore transitorio in {step}, tentativo {attempt + 1} tra {delay:.1f}s: {error}")
+            self._count("retried")
+            time.sleep(delay)
+
+        # Solo gli errori dovuti al file di input; gli altri (ambiente, configurazione, bug, eccezioni
+        # impreviste) lasciano l'immagine alla prossima esecuzione, come un output non valido
+        if status == "failed" and step != "CRASH" and is_input_error(error) and self.quarantine is not None:
+            self.quarantine.add(image_path, step, str(error), attempt)
+            self.logger.log(image_path, "quarantine", success=False, error=f"In quarantena ({step}): {error}")
+            self._count("quarantined")
+        return status, step
+
+    def _fail(self, image_path: Path, step: str, message: str, error: Exception) -> tuple[str, str]:
+        self._failure.error = error
+        self.logger.log(image_path, step, success=False, error=f"{message}: {error}")
+        return "failed", step
+
+    def run_from_queue(self, work_queue, on_start=None, on_done=None, should_stop=None):
+        """
+        Pull images from a shared queue until a `None` sentinel, so that every thread
+        of every process takes the next image as soon as it is free.
+
+        Args:
+            work_queue: Queue of image paths terminated by one `None` per consumer.
+            on_start (callable, optional): Called with the image path before each image.
+            on_done (callable, optional): Called with the image path and its status after each image.
+            should_stop (callable, optional): Checked before each image; when true the thread
+                stops without waiting for the sentinel (e.g. a worker being recycled).
+        """
+        while True:
+            if should_stop is not None and should_stop():
+                return
+            try:
+                # Attesa limitata solo se la richiesta di arresto può arrivare senza sentinella
+                image_path = work_queue.get(timeout=0.5) if should_stop is not None else work_queue.get()
+            except Empty:
+                continue
+            if image_path is None:
+                return
+            if on_start is not None:
+                on_start(image_path)
+            status = "failed"
+            try:
+                status = self.run(image_path)
+            except Exception as e:
+                self.logger.log(image_path.name, "run", success=False, error=f"Thread error: {e}")
+                self._count("failed")
+            finally:
+                if on_done is not None:
+                    on_done(image_path, status)
+
+    def _lease_lost(self, image_path: Path) -> bool:
+        """
+        Whether another node took over the lease of the image: its outputs are then left
+        unpublished, the other node produces them.
+        """
+        if self.leases is None or not self.leases.lost(image_path):
+            return False
+        self.logger.log(image_path, "lease", success=False, error="Lease perso: immagine ripresa da un altro nodo")
+        return True
+
+    def _local_dir(self, output_dir: Path) -> Path:
+        return self.staging.local_output_dir(output_dir) if self.staging is not None else output_dir
+
+    def _publish(self, local_path: Path, output_dir: Path, written: dict[Path, WrittenFile]):
+        destination = output_dir / local_path.name
+        if self.staging is None:
+            self._record(destination, written.get(local_path))
+            return
+        future = self.staging.upload(local_path, destination)
+        self._uploads.pending.append((future, destination, written.get(local_path)))
+
+    def _record(self, destination: Path, expected: WrittenFile | None):
+        if self.output_state is not None and expected is not None:
+            self.output_state.record(destination, expected)
+
+    def _await_uploads(self, image_path: Path) -> bool:
+        """
+        Wait for the uploads of the current image; the outputs that reached the share are recorded.
+
+        Returns:
+            bool: False if any upload failed.
+        """
+        pending, self._uploads.pending = self._uploads.pending, []
+        uploaded = True
+        for future, destination, expected in pending:
+            try:
+                future.result()
+            except OSError as e:
+                self.logger.log(image_path, "upload", success=False, error=f"Upload fallito verso {destination}: {e}")
+                uploaded = False
+                continue
+            self._record(destination, expected)
+        return uploaded
+
+    def _verify(self, path: Path, written: dict[Path, WrittenFile], step: str) -> bool:
+        expected = None
+        if VERIFY_OUTPUT_CHECKSUMS:
+            expected = written.get(path)
+            if expected is None and self.output_state is not None:
+                expected = self.output_state.get(path)  # scritto in un'esecuzione precedente
+        return verify_output_with_logging(path, expected, step, self.logger)
+
+    def _run(self, image_path: Path, metrics: ImageMetrics | None) -> tuple[str, str]:
         try:
             filename = image_path.name
             top_folder = image_path.parent.name
@@ -23,34 +222,141 @@ class ImageWorker:
             # Directory output
             sr_output_dir = self.output_sr_dir / top_folder
             downscale_output_dir = self.output_final_dir / top_folder
-            sr_output_path = sr_output_dir / filename
+            sr_output_path = raw_path(sr_output_dir, filename) if self.raw_intermediates else sr_output_dir / filename
             final_output_path = downscale_output_dir / filename
 
-            if final_output_path.exists():
-                return  # Già elaborata
+            if self.target_dirs is not None:
+                final_paths = {ppi: d / top_folder / filename for ppi, d in self.target_dirs.items()}
+                if all(p.exists() for p in final_paths.values()):
+                    return "skipped", ""  # Già elaborata per tutti i PPI
+            elif final_output_path.exists():
+                return "skipped", ""  # Già elaborata
 
-            # 4. Applica super-risoluzione
-            if not sr_output_path.exists():
-                try:
-                    sr_output_path = apply_super_resolution_single(image_path, sr_output_dir, self.sr_model)
-                except Exception as e:
-                    self.logger.log(image_path, "super_resolution", success=False, error=f"Errore super_resolution: {e}")
-                    return
+            job = self.memory_jobs.get(image_path)
+            if metrics is not None and job is not None:
+                metrics.set("memory_mode", job.mode)
+                metrics.set("memory_estimate_mb", job.bytes_needed / (1024 * 1024))
 
-            # 5. Validazione SR
-            if not validate_image_with_logging(sr_output_path, "validate_super_resolution", self.logger):
-                return
+            # Con lo staging si legge la copia locale (stesso nome file dell'originale)
+            source_path = self.staging.local_input(image_path) if self.staging is not None else image_path
+            written = {}  # output scritti -> dimensione e checksum
 
-            # 6. Applica downscaling personalizzato
-            try:
-                final_output_path = apply_personalized_downscaling_single(sr_output_path, downscale_output_dir, ppi=self.ppi)
-            except Exception as e:
-                self.logger.log(image_path, "downscale", success=False, error=f"Errore downscale: {e}")
-                return
+            # Più PPI di destinazione: una sola SR in memoria, un ridimensionamento per PPI
+            if self.target_dirs is not None:
+                return self._run_multi_ppi(image_path, source_path, sr_output_dir, job, metrics, written)
+
+            # Piano fuso o diretto: SR e ridimensionamento in memoria, solo l'immagine finale su disco
+            if self.output_plan is not None and (self.output_plan.fused or self.output_plan.method == "direct"):
+                return self._run_fused(image_path, source_path, downscale_output_dir, job, metrics, written)
+
+            # La stima di memoria copre SR e ridimensionamento: l'ammissione resta fino al downscale
+            with self._admit(job):
+                # 4. Applica super-risoluzione
+                new_sr = not sr_output_path.exists()
+                if new_sr:
+                    try:
+                        # Gli intermedi grezzi restano su disco locale, senza upload
+                        sr_output_path = apply_super_resolution_single(
+                            source_path, sr_output_dir if self.raw_intermediates else self._local_dir(sr_output_dir),
+                            self.sr_model, metrics=metrics,
+                            strip_height=job.strip_height if job is not None else None,
+                            raw=self.raw_intermediates, written=written,
+                        )
+                    except Exception as e:
+                        return self._fail(image_path, "super_resolution", "Errore super_resolution", e)
+                    if self.intermediates is not None:
+                        self.intermediates.enforce_quota(protect=(sr_output_path,))
+
+                # 5. Validazione SR
+                with stage(metrics, "validation"):
+                    valid = self._verify(sr_output_path, written, "validate_super_resolution")
+                if not valid:
+                    sr_output_path.unlink(missing_ok=True)  # altrimenti verrebbe riusato alla prossima esecuzione
+                    return "failed", "validate_super_resolution"
+
+                # 6. Applica downscaling personalizzato
+                try:
+                    final_output_path = apply_personalized_downscaling_single(
+                        sr_output_path, self._local_dir(downscale_output_dir), ppi=self.ppi, metrics=metrics,
+                        sr_scale=self.sr_scale, written=written,
+                    )
+                except Exception as e:
+                    return self._fail(image_path, "downscale", "Errore downscale", e)
 
             # 7. Validazione downscale
-            if not validate_image_with_logging(final_output_path, "validate_downscale", self.logger):
-                return
+            with stage(metrics, "validation"):
+                valid = self._verify(final_output_path, written, "validate_downscale")
+            if not valid:
+                return "failed", "validate_downscale"
+            if self._lease_lost(image_path):
+                return "remote", "lease"
+
+            if self.raw_intermediates:
+                if not INTERMEDIATE_KEEP_COMPLETED:
+                    sr_output_path.unlink(missing_ok=True)
+            elif new_sr:
+                self._publish(sr_output_path, sr_output_dir, written)
+            self._publish(final_output_path, downscale_output_dir, written)
+            return "ok", ""
 
         except Exception as e:
+            self._failure.error = e
             self.logger.log_crash(error=f"Unexpected error with {image_path}: {e}", full_path=image_path)
+            return "failed", "CRASH"
+
+    def _run_fused(self, image_path: Path, source_path: Path, downscale_output_dir: Path, job: MemoryJob | None,
+                   metrics: ImageMetrics | None, written: dict[Path, WrittenFile]) -> tuple[str, str]:
+        try:
+            with self._admit(job):
+                final_output_path = apply_fused_processing_single(
+                    source_path, self._local_dir(downscale_output_dir), self.sr_model, ppi=self.ppi, metrics=metrics,
+                    strip_height=job.strip_height if job is not None else None, written=written,
+                )
+        except Exception as e:
+            return self._fail(image_path, "fused", "Errore elaborazione fusa", e)
+
+        with stage(metrics, "validation"):
+            valid = self._verify(final_output_path, written, "validate_downscale")
+        if not valid:
+            return "failed", "validate_downscale"
+        if self._lease_lost(image_path):
+            return "remote", "lease"
+        self._publish(final_output_path, downscale_output_dir, written)
+        return "ok", ""
+
+    def _run_multi_ppi(self, image_path: Path, source_path: Path, sr_output_dir: Path, job: MemoryJob | None,
+                       metrics: ImageMetrics | None, written: dict[Path, WrittenFile]) -> tuple[str, str]:
+        top_folder = image_path.parent.name
+        output_dirs = {ppi: d / top_folder for ppi, d in self.target_dirs.items()}
+        # Il file SR intermedio si scrive solo nel piano storico, non in quello fuso o diretto,
+        # e in formato grezzo solo se va conservato dopo il completamento
+        keep_sr = self.output_plan is None or (self.output_plan.method == "sr" and not self.output_plan.fused)
+        keep_sr = keep_sr and (not self.raw_intermediates or INTERMEDIATE_KEEP_COMPLETED)
+        try:
+            with self._admit(job):
+                final_paths = apply_multi_ppi_processing_single(
+                    source_path, {ppi: self._local_dir(d) for ppi, d in output_dirs.items()}, self.sr_model,
+                    ppi=self.ppi, metrics=metrics,
+                    strip_height=job.strip_height if job is not None else None,
+                    sr_output_dir=(sr_output_dir if self.raw_intermediates else self._local_dir(sr_output_dir))
+                    if keep_sr else None,
+                    raw=self.raw_intermediates, written=written,
+                )
+        except Exception as e:
+            return self._fail(image_path, "multi_ppi", "Errore elaborazione multi-PPI", e)
+
+        for target, path in final_paths.items():
+            with stage(metrics, "validation"):
+                valid = self._verify(path, written, f"validate_downscale_{target}ppi")
+            if not valid:
+                return "failed", f"validate_downscale_{target}ppi"
+        if self._lease_lost(image_path):
+            return "remote", "lease"
+
+        if keep_sr and self.raw_intermediates:
+            self.intermediates.enforce_quota(protect=(raw_path(sr_output_dir, image_path.name),))
+        elif keep_sr:
+            self._publish(self._local_dir(sr_output_dir) / image_path.name, sr_output_dir, written)
+        for target, path in final_paths.items():
+            self._publish(path, output_dirs[target], written)
+        return "ok", ""
@@ -0,0 +1,71 @@
+import os
+import sys
+import queue
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src import core_budget
+from src.core_budget import plan_threads, intra_op_candidates, init_pool_process
+
+
+def test_threads_add_up_to_the_budget():
+    for processes, threads, cores in [(1, 1, 16), (2, 4, 16), (8, 8, 16), (3, 2, 16), (4, 1, 6)]:
+        plans = plan_threads(processes, threads, cores=cores, affinity=False)
+        assert len(plans) == processes
+        assert sum(plan.intra_op_threads for plan in plans) == cores
+        for plan in plans:
+            # cv2 e torch girano nei thread Python in parallelo: insieme restano nella quota
+            assert plan.cv2_threads * threads <= max(plan.intra_op_threads, threads)
+            assert plan.torch_threads == plan.cv2_threads and plan.cpus is None
+
+    plans = plan_threads(3, 2, cores=16, affinity=False)
+    assert [plan.intra_op_threads for plan in plans] == [6, 5, 5]
+
+
+def test_more_processes_than_cores_and_override():
+    plans = plan_threads(8, 2, cores=4, affinity=False)
+    assert all(plan.intra_op_threads == 1 and plan.cv2_threads == 1 for plan in plans)
+
+    plans = plan_threads(2, 4, cores=16, intra_op_threads=4, affinity=False)
+    assert [plan.intra_op_threads for plan in plans] == [4, 4]
+    assert intra_op_candidates(2, cores=16) == [8, 4]
+    assert intra_op_candidates(8, cores=4) == [1]
+
+
+def test_affinity_gives_disjoint_cores():
+    ids = core_budget._core_ids()
+    plans = plan_threads(len(ids), 1, cores=len(ids), affinity=True)
+    assert sorted(cpu for plan in plans for cpu in plan.cpus) == ids
+
+
+def test_pool_initializer_applies_one_slot_per_process():
+    saved = {var: os.environ.get(var) for var in core_budget.THREAD_ENV_VARS}
+    saved_cpus = core_budget._core_ids()
+    try:
+        plans = plan_threads(2, 2, cores=8, affinity=True)
+        slots = queue.Queue()
+        slots.put(1)
+        init_pool_process(plans, slots)
+        assert core_budget.current_plan() is plans[1]
+        assert os.environ["OMP_NUM_THREADS"] == str(plans[1].torch_threads)
+        # Processo sostitutivo: coda vuota, il piano viene comunque applicato
+        init_pool_process(plans, slots)
+        assert core_budget.current_plan() in plans
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, saved_cpus)
+
+
+if __name__ == "__main__":
+    test_threads_add_up_to_the_budget()
+    test_more_processes_than_cores_and_override()
+    test_affinity_gives_disjoint_cores()
+    test_pool_initializer_applies_one_slot_per_process()
+    print("✅ Tutti i test sul piano dei core superati")
@@ -0,0 +1,35 @@
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from benchmark.import_time import HEAVY_MODULES, parse_importtime
+
+
+def test_parse_importtime_keeps_top_level_packages():
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |     numpy.core",
+        "import time:       300 |       2000 |   numpy",
+        "import time:        50 |       1500 | src.main",
+    ])
+    assert parse_importtime(stderr) == [("src", 0.0015)]
+
+
+def test_main_starts_without_heavy_modules():
+    # Interprete nuovo: i moduli già importati dai test non contano. Il budget di tempo
+    # resta in benchmark/import_time.py, qui si verifica solo cosa viene caricato.
+    code = ("import sys, json, src.main; "
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
+
+
+if __name__ == "__main__":
+    test_parse_importtime_keeps_top_level_packages()
+    test_main_starts_without_heavy_modules()
+    print("✅ Test tempo di avvio superati.")
@@ -0,0 +1,97 @@
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.integrity import (OutputState, WrittenFile, audit_outputs, file_checksum, verify_written,
+                           write_atomic)
+
+
+def test_checksum_is_computed_while_writing():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "B001.001" / "001.tif"
+
+        def write(f):
+            for i in range(4):
+                f.write(bytes([i]) * 1000)
+
+        written = write_atomic(path, write)
+        assert written == WrittenFile(4000, file_checksum(path))
+        assert verify_written(path, written) == (True, "")
+        assert [p.name for p in path.parent.iterdir()] == ["001.tif"]
+
+        # Un encoder che torna indietro a correggere l'header: checksum riletto dal file
+        def patch_header(f):
+            f.write(b"\0" * 8 + b"pixels")
+            f.seek(0)
+            f.write(b"II*\0\x08\0\0\0")
+
+        written = write_atomic(path, patch_header)
+        assert written == WrittenFile(14, file_checksum(path))
+        assert path.read_bytes() == b"II*\0\x08\0\0\0pixels"
+
+
+def test_failed_write_leaves_previous_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "001.tif"
+        path.write_bytes(b"complete")
+
+        def crash(f):
+            f.write(b"trunc")
+            raise RuntimeError("encoder crashed")
+
+        try:
+            write_atomic(path, crash)
+        except RuntimeError:
+            pass
+        assert path.read_bytes() == b"complete"
+        assert [p.name for p in Path(tmp).iterdir()] == ["001.tif"]
+
+
+def test_truncated_output_fails_verification():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "001.tif"
+        written = write_atomic(path, lambda f: f.write(b"x" * 100))
+        path.write_bytes(b"x" * 60)
+        valid, error = verify_written(path, written)
+        assert not valid and "SIZE FAIL" in error
+
+        path.write_bytes(b"y" * 100)
+        valid, error = verify_written(path, written)
+        assert not valid and "CHECKSUM FAIL" in error
+
+
+def test_audit_removes_invalid_and_records_legacy_outputs():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "downscaled_x2"
+        folder = root / "B001.001"
+        state = OutputState(Path(tmp) / "run_state.sqlite", run_id="run1")
+
+        good = folder / "001.tif"
+        state.record(good, write_atomic(good, lambda f: f.write(b"good image")))
+        tampered = folder / "002.tif"
+        state.record(tampered, write_atomic(tampered, lambda f: f.write(b"good image")))
+        tampered.write_bytes(b"bad image!")
+        legacy = folder / "003.tif"
+        legacy.write_bytes(b"legacy image")
+        undecodable = folder / "004.tif"
+        undecodable.write_bytes(b"broken")
+        (folder / ".005.tif.1234abcd.part").write_bytes(b"partial")
+
+        decode = lambda p: (False, "[LOAD FAIL]") if p.read_bytes() == b"broken" else (True, "")
+        stats = audit_outputs([root], decode, state)
+        assert (stats["checked"], stats["invalid"], stats["recorded"], stats["partial"]) == (4, 2, 1, 1)
+        assert sorted(p.name for p in folder.iterdir()) == ["001.tif", "003.tif"]
+        assert state.get(tampered) is None
+        assert state.get(legacy) == WrittenFile(12, file_checksum(legacy))
+        state.close()
+
+
+if __name__ == "__main__":
+    test_checksum_is_computed_while_writing()
+    test_failed_write_leaves_previous_file()
+    test_truncated_output_fails_verification()
+    test_audit_removes_invalid_and_records_legacy_outputs()
+    print("✅ Tutti i test sull'integrità degli output superati")
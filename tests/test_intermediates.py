@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.intermediates import IntermediateStore, raw_path, final_name, save_raw, load_raw, is_valid_raw_file
+
+
+def _age(path: Path, seconds: float):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_round_trip_is_memory_mapped():
+    with tempfile.TemporaryDirectory() as tmp:
+        array = np.arange(40 * 30 * 3, dtype=np.uint8).reshape(40, 30, 3)
+        path = save_raw(raw_path(Path(tmp) / "B001.001", "001.tif"), array)
+        assert path.name == "001.tif.npy" and final_name(path) == "001.tif"
+
+        loaded = load_raw(path)
+        assert isinstance(loaded, np.memmap)
+        assert np.array_equal(loaded, array)
+        assert is_valid_raw_file(path) == (True, "")
+        del loaded
+
+        # File troncato: header valido ma dimensione errata
+        path.write_bytes(path.read_bytes()[:-10])
+        valid, error = is_valid_raw_file(path)
+        assert not valid and "RAW FAIL" in error
+
+
+def test_quota_evicts_least_recently_used():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        paths = []
+        for i in range(4):
+            path = save_raw(raw_path(root / "B001.001", f"{i:03d}.tif"), np.zeros((100, 100), dtype=np.uint8))
+            _age(path, 3600 - i * 60)  # 000 è il meno recente
+            paths.append(path)
+        size = paths[0].stat().st_size
+        load_raw(paths[1])  # appena usato: diventa il più recente
+
+        store = IntermediateStore(root, quota_bytes=2 * size, min_age_s=600)
+        freed = store.enforce_quota(protect=(paths[0],))
+        assert freed == 2 * size and store.evicted == 2
+        assert [p.exists() for p in paths] == [True, True, False, False]
+
+        # Gli intermedi troppo recenti non vengono eliminati anche oltre la quota
+        store = IntermediateStore(root, quota_bytes=0, min_age_s=600)
+        store.enforce_quota()
+        assert paths[1].exists() and not paths[0].exists()
+
+
+def test_cleanup_removes_only_completed():
+    with tempfile.TemporaryDirectory() as tmp:
+        sr_root = Path(tmp) / "super_resolution"
+        out_root = Path(tmp) / "downscaled"
+        for name in ("001.tif", "002.tif"):
+            save_raw(raw_path(sr_root / "B001.001", name), np.zeros((8, 8), dtype=np.uint8))
+        (out_root / "B001.001").mkdir(parents=True)
+        (out_root / "B001.001" / "001.tif").write_bytes(b"tif")
+
+        store = IntermediateStore(sr_root)
+        removed = store.cleanup_completed(lambda p: [out_root / p.parent.name / final_name(p)])
+        assert removed == 1
+        assert [p.name for _, _, p in store.entries()] == ["002.tif.npy"]
+
+
+if __name__ == "__main__":
+    test_round_trip_is_memory_mapped()
+    test_quota_evicts_least_recently_used()
+    test_cleanup_removes_only_completed()
+    print("✅ Tutti i test sugli intermedi superati")
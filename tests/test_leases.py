@@ -0,0 +1,143 @@
+import sys
+import json
+import time
+import tempfile
+import threading
+from pathlib import Path
+from multiprocessing import get_context
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.leases import LeaseManager
+
+
+def _node(lease_dir: str, root: str, images: list[str], node_id: str) -> list[str]:
+    # Un nodo simulato: prova a prendere ogni immagine e la completa
+    leases = LeaseManager(Path(lease_dir), Path(root), ttl=30, heartbeat=5, node_id=node_id)
+    processed = []
+    for image in images:
+        if leases.claim(Path(image)):
+            time.sleep(0.005)
+            processed.append(image)
+            leases.complete(Path(image))
+    leases.stop()
+    return processed
+
+
+def test_nodes_split_work_without_duplicates():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "input"
+        images = [str(root / f"folder_{i % 3}" / f"img_{i:03d}.tif") for i in range(60)]
+
+        ctx = get_context("spawn")
+        with ctx.Pool(4) as pool:
+            results = pool.starmap(_node, [(str(Path(tmp) / "leases"), str(root), images, f"node{n}")
+                                           for n in range(4)])
+
+        processed = [image for result in results for image in result]
+        assert sorted(processed) == sorted(images)
+        assert len(set(processed)) == len(processed)
+
+        leases = LeaseManager(Path(tmp) / "leases", root)
+        assert all(leases.is_done(Path(image)) for image in images)
+        assert not list((Path(tmp) / "leases").glob("*.lease"))
+
+
+def test_expired_lease_is_taken_over():
+    with tempfile.TemporaryDirectory() as tmp:
+        image = Path(tmp) / "input" / "a" / "img.tif"
+        dead = LeaseManager(Path(tmp) / "leases", Path(tmp) / "input", ttl=0.2, node_id="dead")
+        alive = LeaseManager(Path(tmp) / "leases", Path(tmp) / "input", ttl=0.2, node_id="alive")
+
+        assert dead.claim(image)
+        assert not alive.claim(image)
+        time.sleep(0.3)  # nessun heartbeat: il lease scade
+        assert alive.claim(image)
+        # Il nodo che ha perso il lease se ne accorge al rinnovo e non tocca il lease dell'altro
+        lease_file = next((Path(tmp) / "leases").glob("*.lease"))
+        mtime = lease_file.stat().st_mtime_ns
+        assert not dead.lost(image)
+        assert dead.renew() == ["a/img.tif"]
+        assert dead.lost(image) and not alive.lost(image)
+        assert lease_file.stat().st_mtime_ns == mtime
+
+        alive.complete(image)
+        assert not dead.claim(image)
+        dead.stop()
+        alive.stop()
+
+
+def test_heartbeat_keeps_lease_alive():
+    with tempfile.TemporaryDirectory() as tmp:
+        image = Path(tmp) / "input" / "img.tif"
+        holder = LeaseManager(Path(tmp) / "leases", Path(tmp) / "input", ttl=0.3, heartbeat=0.05)
+        other = LeaseManager(Path(tmp) / "leases", Path(tmp) / "input", ttl=0.3)
+
+        assert holder.claim(image)
+        time.sleep(0.6)
+        assert not other.claim(image)
+
+        lease_file = next((Path(tmp) / "leases").glob("*.lease"))
+        assert json.loads(lease_file.read_text(encoding="utf-8"))["token"] == holder.token
+
+        holder.stop()  # rilascia i lease tenuti
+        assert other.claim(image)
+        other.stop()
+
+
+def test_claim_during_renewal_never_succeeds():
+    with tempfile.TemporaryDirectory() as tmp:
+        image = Path(tmp) / "input" / "img.tif"
+        holder = LeaseManager(Path(tmp) / "leases", Path(tmp) / "input", ttl=30, node_id="holder")
+        other = LeaseManager(Path(tmp) / "leases", Path(tmp) / "input", ttl=30, node_id="other")
+        assert holder.claim(image)
+
+        # Rinnovi e tentativi di presa in parallelo: il lease non scade, l'altro nodo non lo prende mai
+        stop = threading.Event()
+        claimed = []
+
+        def claim_loop():
+            while not stop.is_set():
+                if other.claim(image):
+                    claimed.append(image)
+
+        thread = threading.Thread(target=claim_loop)
+        thread.start()
+        lost = []
+        for _ in range(500):
+            lost += holder.renew()
+        stop.set()
+        thread.join()
+
+        assert claimed == [] and lost == []
+        assert holder.held() == ["img.tif"] and not holder.lost(image)
+        # Il rilascio trova sempre il file: nessun lease rimasto dopo la release
+        holder.release(image)
+        assert not list((Path(tmp) / "leases").glob("*.lease"))
+        holder.stop()
+        other.stop()
+
+
+def test_dead_process_lease_is_broken():
+    with tempfile.TemporaryDirectory() as tmp:
+        image = Path(tmp) / "input" / "img.tif"
+        crashed = LeaseManager(Path(tmp) / "leases", Path(tmp) / "input", node_id="host:101")
+        supervisor = LeaseManager(Path(tmp) / "leases", Path(tmp) / "input", node_id="host:100")
+
+        assert crashed.claim(image)
+        # Solo il lease del processo indicato viene rimosso
+        assert not supervisor.break_lease(image, "host:102")
+        assert supervisor.break_lease(image, "host:101")
+        assert supervisor.claim(image)
+        crashed.stop()
+        supervisor.stop()
+
+
+if __name__ == "__main__":
+    test_nodes_split_work_without_duplicates()
+    test_expired_lease_is_taken_over()
+    test_heartbeat_keeps_lease_alive()
+    test_claim_during_renewal_never_succeeds()
+    test_dead_process_lease_is_broken()
+    print("✅ Tutti i test sui lease superati")
@@ -0,0 +1,51 @@
+import sys
+import csv
+import json
+import sqlite3
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from logs.logger import LogAggregator, log_path_for_backend
+
+
+def _log_some(aggregator):
+    logger = aggregator.logger()
+    logger.log("0001.tif", "super_resolution", success=True)
+    logger.log("0002.tif", "downscale", success=False, error="Errore downscale")
+    logger.log_crash("Unexpected error", full_path=Path("B001.001/0003.tif"))
+    aggregator.stop()
+
+
+def test_csv_backend_batches_rows(tmp_path):
+    path = log_path_for_backend(tmp_path / "processing_log.csv", "csv")
+    aggregator = LogAggregator(path, batch_size=1000, flush_interval=60)
+    _log_some(aggregator)
+
+    with open(path, "r", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert aggregator.rows_written == 2
+    assert sorted(row["filename"] for row in rows) == ["0002.tif", "CRASH"]
+    assert all(row["status"] == "false" for row in rows)
+
+
+def test_jsonl_and_sqlite_backends(tmp_path):
+    jsonl_path = log_path_for_backend(tmp_path / "processing_log.csv", "jsonl")
+    _log_some(LogAggregator(jsonl_path, backend="jsonl"))
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        assert len([json.loads(line) for line in f]) == 2
+
+    sqlite_path = log_path_for_backend(tmp_path / "processing_log.csv", "sqlite")
+    _log_some(LogAggregator(sqlite_path, backend="sqlite"))
+    with sqlite3.connect(sqlite_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM log").fetchone()[0] == 2
+
+
+if __name__ == "__main__":
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        test_csv_backend_batches_rows(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_jsonl_and_sqlite_backends(Path(tmp))
+    print("✅ Test aggregatore di log superati.")
@@ -0,0 +1,66 @@
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+import numpy as np
+from PIL import Image
+
+from benchmark.memory_benchmark import A4_RATIO, MemoryMetrics, generate_synthetic_tiff, summarize_memory
+
+
+def test_synthetic_scan_has_a4_proportions():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = generate_synthetic_tiff(1, output_dir=Path(tmp))
+        assert path.name == "synthetic_1mp.tif"
+        with Image.open(path) as img:
+            assert img.mode == "RGB"
+            width, height = img.size
+            pixels = np.asarray(img)
+        assert abs(width * height - 1e6) < 0.01 * 1e6
+        assert abs(height / width - A4_RATIO) < 0.01
+        # Fondo dello scanner, foglio e blocchi di "testo" scuri
+        assert pixels.min() < 80 and pixels.max() == 245
+
+        # Stessa dimensione: il file esistente viene riusato
+        mtime = path.stat().st_mtime_ns
+        assert generate_synthetic_tiff(1, output_dir=Path(tmp)) == path
+        assert path.stat().st_mtime_ns == mtime
+
+
+def test_peak_memory_result():
+    metrics = MemoryMetrics(Path("synthetic_1mp.tif"))
+    tracemalloc.start()
+    try:
+        with metrics.stage("load"):
+            small = np.ones(1024 * 1024, dtype=np.uint8)  # 1 MB
+        with metrics.stage("super_resolution"):
+            large = np.ones(8 * 1024 * 1024, dtype=np.uint8)  # 8 MB
+    finally:
+        tracemalloc.stop()
+    del small, large
+
+    result = summarize_memory("synthetic_1mp.tif", 1_000_000, metrics)
+    assert set(result) == {"image", "megapixels", "stages_s", "memory", "peak_rss_delta_mb", "peak_tracemalloc_mb",
+                           "rss_bytes_per_pixel", "tracemalloc_bytes_per_pixel"}
+    assert result["image"] == "synthetic_1mp.tif" and result["megapixels"] == 1.0
+    assert list(result["memory"]) == ["load", "super_resolution"]
+    assert set(result["stages_s"]) == {"load", "super_resolution"}
+    for mem in result["memory"].values():
+        assert set(mem) == {"rss_before_mb", "rss_peak_mb", "rss_delta_mb", "tracemalloc_peak_mb"}
+        assert mem["rss_peak_mb"] >= mem["rss_before_mb"]
+
+    # Il picco è quello dello stage più pesante
+    assert 1.0 <= result["memory"]["load"]["tracemalloc_peak_mb"] < 2.0
+    assert 8.0 <= result["peak_tracemalloc_mb"] < 9.0
+    assert result["tracemalloc_bytes_per_pixel"] == result["peak_tracemalloc_mb"] * 1024 * 1024 / 1_000_000
+    assert result["peak_rss_delta_mb"] >= 0.0
+
+
+if __name__ == "__main__":
+    test_synthetic_scan_has_a4_proportions()
+    test_peak_memory_result()
+    print("✅ Test sul benchmark di memoria superati.")
@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.metadata_manager import MetadataIndex
+from tests.test_tiff_metadata import _write_tiff
+
+
+def test_index_reads_only_new_or_modified_files():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "input"
+        (root / "B001.001").mkdir(parents=True)
+        (root / "B001.002").mkdir()
+        first = root / "B001.001" / "001.tif"
+        second = root / "B001.002" / "001.tif"
+        _write_tiff(first, "II", 3612, 5237, (400, 400))
+        _write_tiff(second, "MM", 4599, 3267, (600, 600))
+        (root / "B001.001" / "note.txt").write_text("non indicizzato")
+
+        index = MetadataIndex(Path(tmp) / "index.sqlite")
+        stats = index.update(root, workers=2)
+        assert (stats["indexed"], stats["unchanged"], stats["errors"]) == (2, 0, 0)
+
+        record = index.get(first)
+        assert (record["width"], record["height"], record["ppi"]) == (3612, 5237, 400)
+        assert record["compression"] is not None
+        assert index.sizes([first, second]) == {first: (3612, 5237), second: (4599, 3267)}
+        assert index.summary(root)["by_ppi"] == {400: 1, 600: 1}
+
+        assert index.update(root)["unchanged"] == 2
+
+        # File modificato: il record è scaduto finché l'indice non viene aggiornato
+        _write_tiff(first, "II", 1000, 2000, (400, 400))
+        os.utime(first, ns=(1, 1))
+        assert index.get(first) is None
+        stats = index.update(root)
+        assert (stats["indexed"], stats["unchanged"]) == (1, 1)
+        assert index.sizes([first]) == {first: (1000, 2000)}
+
+        second.unlink()
+        assert index.update(root)["removed"] == 1
+        assert index.summary(root)["images"] == 1
+        index.close()
+
+
+if __name__ == "__main__":
+    test_index_reads_only_new_or_modified_files()
+    print("✅ Tutti i test sull'indice dei metadati superati")
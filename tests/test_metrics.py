@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.metrics import ImageMetrics, MetricsSink, load_metrics, percentile, summarize_metrics
+
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile([], 50) == 0.0
+
+
+def test_sink_roundtrip_and_summary(tmp_path):
+    sink = MetricsSink("run", metrics_dir=tmp_path)
+    for i in range(4):
+        metrics = ImageMetrics(Path(f"B001.001/{i:04d}.tif"))
+        metrics.add_time("decode", 0.5)
+        metrics.add_timings({"inference": 2.0, "tiles": 10})
+        metrics.set("megapixels", 10.0)
+        sink.write(metrics.to_record("ok"))
+    sink.write(ImageMetrics(Path("B001.001/bad.tif")).to_record("failed", "downscale"))
+
+    records = load_metrics("run", metrics_dir=tmp_path)
+    assert len(records) == 5
+
+    summary = summarize_metrics(records, wall_time=10.0)
+    assert summary["images_ok"] == 4
+    assert summary["images_failed"] == 1
+    assert summary["mp_per_s"] == 4.0
+    assert summary["stages"]["inference"]["p95"] == 2.0
+    assert list(summary["stages"]) == ["decode", "inference"]
+
+
+def test_summary_reports_skipped_tiles():
+    records = []
+    for skipped in (6, 2):
+        metrics = ImageMetrics(Path("B001.001/page.tif"))
+        metrics.add_timings({"tiles": 10, "tiles_skipped_blank": skipped, "tiles_memo_hits": 0,
+                             "inference_time_saved_s": 0.5})
+        records.append(metrics.to_record("ok"))
+
+    summary = summarize_metrics(records)
+    assert summary["tiles_skipped_fraction"] == 0.4
+    assert summary["inference_time_saved_s"] == 1.0
+
+
+if __name__ == "__main__":
+    import tempfile
+    test_percentile_nearest_rank()
+    test_summary_reports_skipped_tiles()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_sink_roundtrip_and_summary(Path(tmp))
+    print("✅ Test metriche superati.")
@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.config import SUPER_RESOLUTION_PAR
+from src.output_planner import downscale_factor, final_size, net_scale_factor, plan_output
+
+
+def test_net_factors_match_ruler_calibration():
+    assert abs(net_scale_factor(400) - 1.53) < 0.01
+    assert abs(net_scale_factor(600) - 1.63) < 0.01
+
+
+def test_final_size_matches_reference_resize():
+    width, height = 4961, 7016
+    sr_w, sr_h = width * SUPER_RESOLUTION_PAR, height * SUPER_RESOLUTION_PAR
+    scale_factor = downscale_factor(400)
+    assert final_size(width, height, 400) == (int(sr_w * scale_factor), int(sr_h * scale_factor))
+
+
+def test_target_ppi_scales_from_scan_calibration():
+    assert abs(net_scale_factor(400, 600) - 1.5 * net_scale_factor(400)) < 1e-9
+    assert final_size(1000, 1000, 400, 400) == final_size(1000, 1000, 400)
+
+
+def test_policies():
+    sizes = {Path("a.tif"): (4000, 5600), Path("b.tif"): (4000, 5600)}
+    reference = plan_output(400, sizes, "reference", scales=[2, 3, 4])
+    assert (reference.method, reference.sr_scale, reference.fused) == ("sr", SUPER_RESOLUTION_PAR, False)
+
+    quality = plan_output(400, sizes, "quality", scales=[2, 3, 4])
+    assert quality.method == "sr" and quality.sr_scale == 2 and quality.fused
+    assert quality.estimated_seconds < reference.estimated_seconds
+
+    assert plan_output(600, sizes, "speed", scales=[2]).method == "direct"
+
+    # 600 PPI da una scansione a 400: serve più del x2 solo oltre il fattore netto 2
+    both = plan_output(400, sizes, "quality", scales=[2, 3, 4], target_ppis=[400, 600])
+    assert both.net_factor > 2 and both.sr_scale == 3
+
+
+if __name__ == "__main__":
+    test_net_factors_match_ruler_calibration()
+    test_final_size_matches_reference_resize()
+    test_target_ppi_scales_from_scan_calibration()
+    test_policies()
+    print("✅ Test piano di output superati.")
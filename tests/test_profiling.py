@@ -0,0 +1,93 @@
+import sys
+import json
+import time
+import tempfile
+import threading
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.profiling import SamplingProfiler, merge_profiles, format_profile_report, profile_path
+
+
+def _busy_loop(stop: threading.Event):
+    # Thread occupato in codice Python: deve comparire in cima alle pile campionate
+    x = 0
+    while not stop.is_set():
+        for _ in range(10_000):
+            x += 1
+
+
+def _write_profile(profile_dir: Path, name: str, functions: dict, interval: float = 0.01, duration: float = 1.0):
+    path = Path(profile_dir) / f"profile_{name}.json"
+    path.write_text(json.dumps({"pid": 0, "interval": interval, "samples": 100, "duration": duration,
+                                "functions": functions}), encoding="utf-8")
+
+
+def test_busy_thread_is_sampled():
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_loop, args=(stop,))
+    profiler = SamplingProfiler(interval=0.002)
+    worker.start()
+    profiler.start()
+    time.sleep(0.3)
+    profiler.stop()
+    stop.set()
+    worker.join()
+
+    assert profiler.samples > 10
+    assert profiler.duration >= 0.3
+    busy = [key for key in profiler.self_counts if key.endswith("(_busy_loop)")]
+    assert len(busy) == 1
+    # Il thread è sempre in _busy_loop: presente in quasi tutti i campioni, anche come self
+    assert profiler.cumulative_counts[busy[0]] >= profiler.samples // 2
+    assert profiler.self_counts[busy[0]] >= profiler.samples // 2
+    # Il thread di campionamento non campiona se stesso
+    assert not any(key.endswith("(_sample_loop)") for key in profiler.cumulative_counts)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = profiler.dump(profile_path(tmp, "test"))
+        data = json.loads(path.read_text(encoding="utf-8"))
+        assert data["samples"] == profiler.samples
+        assert data["functions"][busy[0]] == [profiler.self_counts[busy[0]], profiler.cumulative_counts[busy[0]]]
+
+
+def test_merge_sums_processes_in_seconds():
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_profile(tmp, "a", {"main": [0, 100], "infer": [80, 80]}, interval=0.01, duration=1.0)
+        _write_profile(tmp, "b", {"main": [0, 50], "decode": [20, 20]}, interval=0.02, duration=2.0)
+        (Path(tmp) / "other.json").write_text("{}", encoding="utf-8")  # non è un profilo
+
+        merged = merge_profiles(Path(tmp))
+        assert merged["processes"] == 2
+        assert merged["duration"] == 3.0
+        functions = merged["functions"]
+        assert functions["main"]["cumulative_s"] == 100 * 0.01 + 50 * 0.02
+        assert functions["main"]["self_s"] == 0.0
+        assert functions["infer"] == {"self_s": 0.8, "cumulative_s": 0.8}
+        assert functions["decode"] == {"self_s": 0.4, "cumulative_s": 0.4}
+
+
+def test_report_ranks_top_functions_by_cumulative_time():
+    merged = {
+        "processes": 2,
+        "duration": 3.0,
+        "functions": {
+            "decode": {"self_s": 0.4, "cumulative_s": 0.4},
+            "main": {"self_s": 0.0, "cumulative_s": 2.0},
+            "infer": {"self_s": 0.8, "cumulative_s": 0.8},
+        },
+    }
+    lines = format_profile_report(merged, top=2).splitlines()
+    assert lines[0].startswith("Processi profilati: 2")
+    rows = lines[2:]
+    assert [row.split()[-1] for row in rows] == ["main", "infer"]
+    assert rows[0].split()[:2] == ["2.00", "0.00"]
+
+
+if __name__ == "__main__":
+    test_busy_thread_is_sampled()
+    test_merge_sums_processes_in_seconds()
+    test_report_ranks_top_functions_by_cumulative_time()
+    print("✅ Tutti i test sul profiler superati")
@@ -0,0 +1,31 @@
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+import numpy as np
+
+from model.SR_Script.quality_metrics import max_abs_error, psnr, ssim
+
+
+def test_identical_images():
+    img = np.random.default_rng(0).integers(0, 256, size=(64, 64, 3), dtype=np.uint8)
+    assert psnr(img, img) == float("inf")
+    assert abs(ssim(img, img) - 1.0) < 1e-9
+    assert max_abs_error(img, img) == 0.0
+
+
+def test_noise_lowers_psnr_and_ssim():
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, size=(64, 64, 3), dtype=np.uint8)
+    slightly = np.clip(img + rng.normal(0, 1, img.shape), 0, 255).astype(np.uint8)
+    heavily = np.clip(img + rng.normal(0, 20, img.shape), 0, 255).astype(np.uint8)
+    assert psnr(img, slightly) > psnr(img, heavily)
+    assert ssim(img, slightly) > ssim(img, heavily)
+
+
+if __name__ == "__main__":
+    test_identical_images()
+    test_noise_lowers_psnr_and_ssim()
+    print("✅ Test metriche di qualità superati.")
@@ -0,0 +1,95 @@
+import sys
+import math
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+import numpy as np
+
+from benchmark.quality_regression import (
+    REFERENCE_CONFIG, SSIM_BAND_ROWS, banded_ssim, parse_config, seam_lines, seam_metrics,
+)
+from model.SR_Script.quality_metrics import max_abs_error, psnr, ssim
+
+
+def _smooth_image(height: int, width: int) -> np.ndarray:
+    # Sfumatura con poco rumore: i salti tra pixel vicini sono piccoli, come in una scansione
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    base = 60 + 100 * (y / height) + 60 * (x / width)
+    img = base[..., None] + rng.normal(0, 2, (height, width, 3))
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def test_identical_outputs():
+    img = _smooth_image(SSIM_BAND_ROWS + 200, 40)
+    assert psnr(img, img) == math.inf
+    assert banded_ssim(img, img) == 1.0
+    assert max_abs_error(img, img) == 0.0
+
+
+def test_known_offset():
+    img = _smooth_image(64, 64)
+    offset = img.copy()
+    offset[10:20, 5:15] = np.clip(offset[10:20, 5:15].astype(np.int16) + 7, 0, 255).astype(np.uint8)
+    assert max_abs_error(img, offset) == 7.0
+
+    shifted = np.clip(img.astype(np.int16) + 5, 0, 255).astype(np.uint8)
+    assert (shifted.astype(np.int16) - img == 5).all()
+    assert math.isclose(psnr(img, shifted), 10 * math.log10(255 ** 2 / 25))
+
+
+def test_banded_ssim_matches_whole_image():
+    rng = np.random.default_rng(1)
+    img = _smooth_image(SSIM_BAND_ROWS + 300, 48)
+    noisy = np.clip(img + rng.normal(0, 8, img.shape), 0, 255).astype(np.uint8)
+    assert math.isclose(banded_ssim(img, noisy), ssim(img, noisy), rel_tol=1e-6)
+
+
+def test_seam_on_tile_boundary_raises_seam_metrics():
+    height, width, scale = 300, 250, 2
+    rows, cols = seam_lines(REFERENCE_CONFIG, height, width, scale)
+    assert rows and cols
+    assert all(0 < r < height * scale for r in rows) and all(0 < c < width * scale for c in cols)
+
+    reference = _smooth_image(height * scale, width * scale)
+    rng = np.random.default_rng(2)
+    # Candidato con un errore piccolo e uniforme: nessuna giunzione visibile
+    candidate = np.clip(reference + rng.integers(-1, 2, reference.shape), 0, 255).astype(np.uint8)
+    clean = seam_metrics(reference, candidate, rows, cols)
+
+    seamed = candidate.copy()
+    seam = cols[0]
+    seamed[:, seam:seam + 1] = np.clip(seamed[:, seam:seam + 1].astype(np.int16) + 40, 0, 255).astype(np.uint8)
+    with_seam = seam_metrics(reference, seamed, rows, cols)
+
+    # Solo la colonna della giunzione è cambiata
+    changed = np.any(seamed != candidate, axis=(0, 2))
+    assert np.flatnonzero(changed).tolist() == [seam]
+
+    assert 0.5 < clean["seam_error_ratio"] < 1.5
+    assert 0.5 < clean["seam_gradient_ratio"] < 1.5
+    assert with_seam["seam_error_ratio"] > 2 * clean["seam_error_ratio"]
+    assert with_seam["seam_gradient_ratio"] > 2 * clean["seam_gradient_ratio"]
+
+
+def test_parse_config():
+    config = parse_config(["tile_size=256", "tile_overlap=16", "model_variant=int8", "roi=true"])
+    assert config["tile_size"] == 256 and config["tile_overlap"] == 16
+    assert config["model_variant"] == "int8" and config["roi"] is True
+    assert config["tile_memo"] is REFERENCE_CONFIG["tile_memo"]
+    try:
+        parse_config(["tile=256"])
+    except ValueError:
+        return
+    raise AssertionError("chiave sconosciuta accettata")
+
+
+if __name__ == "__main__":
+    test_identical_outputs()
+    test_known_offset()
+    test_banded_ssim_matches_whole_image()
+    test_seam_on_tile_boundary_raises_seam_metrics()
+    test_parse_config()
+    print("✅ Test sulle metriche del confronto di qualità superati.")
@@ -0,0 +1,91 @@
+import os
+import sys
+import errno
+import tempfile
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.retry import Quarantine, is_input_error, is_transient, retry_delay
+from src.output_planner import UnsupportedPPIError
+
+
+def _wrapped(error: Exception) -> RuntimeError:
+    # Come in image_processing: l'errore originale rilanciato come RuntimeError dentro l'except
+    try:
+        try:
+            raise error
+        except Exception as e:
+            raise RuntimeError(f"Failed to save resized image: {e}")
+    except RuntimeError as wrapped:
+        return wrapped
+
+
+def test_transient_errors_are_recognized_through_wrapping():
+    assert is_transient(_wrapped(TimeoutError("timed out")))
+    assert is_transient(_wrapped(OSError(errno.EBUSY, "Device or resource busy")))
+    assert is_transient(_wrapped(MemoryError()))
+    locked = PermissionError(13, "Il file è utilizzato da un altro processo")
+    locked.winerror = 32
+    assert is_transient(_wrapped(locked))
+
+    assert not is_transient(_wrapped(FileNotFoundError(errno.ENOENT, "No such file")))
+    assert not is_transient(_wrapped(OSError("cannot identify image file")))
+    assert not is_transient(_wrapped(ValueError("PPI non supportato: 300")))
+    assert not is_transient(None)
+
+
+def test_only_input_errors_are_quarantined():
+    assert is_input_error(_wrapped(OSError("cannot identify image file 'scan.tif'")))
+    assert is_input_error(_wrapped(OSError("image file is truncated (12 bytes not processed)")))
+    assert is_input_error(_wrapped(SyntaxError("not a TIFF file")))
+    assert is_input_error(_wrapped(UnsupportedPPIError("PPI non supportato: 300")))
+
+    # Ambiente e configurazione: l'immagine resta per la prossima esecuzione
+    assert not is_input_error(_wrapped(OSError(errno.ENOSPC, "No space left on device")))
+    assert not is_input_error(_wrapped(PermissionError(errno.EACCES, "Permission denied")))
+    assert not is_input_error(_wrapped(FileNotFoundError(errno.ENOENT, "No such file")))
+    assert not is_input_error(_wrapped(RuntimeError("onnxruntime: Failed to allocate memory")))
+    assert not is_input_error(_wrapped(AttributeError("'NoneType' object has no attribute 'shape'")))
+    assert not is_input_error(None)
+
+
+def test_retry_delay_is_bounded_and_jittered():
+    delays = [retry_delay(attempt, base=1.0, cap=5.0) for attempt in (1, 2, 3, 10) for _ in range(50)]
+    assert all(0 <= delay <= 5.0 for delay in delays)
+    assert max(retry_delay(1, base=1.0, cap=5.0) for _ in range(50)) <= 1.0
+    assert len(set(delays)) > 1
+
+
+def test_quarantine_until_released_or_changed():
+    with tempfile.TemporaryDirectory() as tmp:
+        images = []
+        for name in ("001.tif", "002.tif"):
+            path = Path(tmp) / name
+            path.write_bytes(b"scan")
+            images.append(path)
+
+        quarantine = Quarantine(Path(tmp) / "run_state.sqlite")
+        quarantine.add(images[0], "super_resolution", "cannot identify image file", attempts=1)
+        quarantine.add(images[1], "downscale", "PPI non supportato", attempts=1)
+        entries = quarantine.entries()
+        assert set(entries) == {str(p) for p in images}
+        assert entries[str(images[0])]["step"] == "super_resolution"
+
+        # File sostituito (es. riscansione): non più in quarantena
+        images[1].write_bytes(b"new scan")
+        os.utime(images[1], ns=(0, 10 ** 9))
+        assert set(quarantine.entries()) == {str(images[0])}
+
+        assert quarantine.release(images[0]) == 1
+        assert quarantine.entries() == {}
+        quarantine.close()
+
+
+if __name__ == "__main__":
+    test_transient_errors_are_recognized_through_wrapping()
+    test_only_input_errors_are_quarantined()
+    test_retry_delay_is_bounded_and_jittered()
+    test_quarantine_until_released_or_changed()
+    print("✅ Tutti i test su nuovi tentativi e quarantena superati")
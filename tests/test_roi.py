@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+import numpy as np
+
+from src.roi import _feather_weights, _merge_boxes, detect_roi_boxes
+
+
+def test_merge_boxes_joins_chains_of_overlaps():
+    boxes = [(0, 0, 10, 10), (20, 0, 30, 10), (5, 5, 25, 8), (100, 100, 110, 110)]
+    merged = sorted(_merge_boxes(boxes))
+    assert merged == [(0, 0, 30, 10), (100, 100, 110, 110)]
+
+
+def test_feather_weights_only_on_inner_sides():
+    weights = _feather_weights(10, 4, fade_start=True, fade_end=False)
+    assert weights[0] < weights[3] < 1.0
+    assert np.all(weights[4:] == 1.0)
+
+
+def test_detect_document_on_dark_bed():
+    img = np.full((2000, 1500, 3), 10, dtype=np.uint8)
+    img[300:1700, 200:1300] = 240
+    boxes = detect_roi_boxes(img, margin=0)
+    assert len(boxes) == 1
+    x0, y0, x1, y1 = boxes[0]
+    assert abs(x0 - 200) <= 4 and abs(y0 - 300) <= 4
+    assert abs(x1 - 1300) <= 4 and abs(y1 - 1700) <= 4
+
+
+if __name__ == "__main__":
+    test_merge_boxes_joins_chains_of_overlaps()
+    test_feather_weights_only_on_inner_sides()
+    test_detect_document_on_dark_bed()
+    print("✅ Test ROI superati.")
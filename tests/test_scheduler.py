@@ -0,0 +1,76 @@
+import os
+import sys
+import threading
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+import queue
+
+from src.scheduler import (MemoryAdmission, estimate_peak_memory, plan_memory_job,
+                           order_largest_first, fill_work_queue)
+
+
+def test_small_image_runs_whole():
+    job = plan_memory_job(Path("small.tif"), (2000, 3000), budget_bytes=64 * 1024 ** 3)
+    assert job.mode == "full"
+    assert job.bytes_needed == estimate_peak_memory(2000, 3000)
+
+
+def test_giant_image_falls_back_to_strips():
+    size = (12000, 25000)  # 300 MP
+    budget = 16 * 1024 ** 3
+    job = plan_memory_job(Path("giant.tif"), size, budget_bytes=budget)
+    assert job.mode == "strips"
+    assert job.bytes_needed < estimate_peak_memory(*size)
+
+
+def test_admission_blocks_until_release():
+    admission = MemoryAdmission(budget_bytes=100, poll_interval=0.01)
+    admission.acquire(80)
+    assert not admission.try_acquire(30)
+
+    admitted = threading.Event()
+    waiter = threading.Thread(target=lambda: (admission.acquire(30), admitted.set()))
+    waiter.start()
+    assert not admitted.wait(0.1)
+    admission.release(80)
+    assert admitted.wait(1.0)
+    waiter.join()
+
+
+def test_oversized_job_admitted_when_idle():
+    admission = MemoryAdmission(budget_bytes=100)
+    assert admission.try_acquire(500)
+
+
+def test_dead_process_memory_is_released():
+    admission = MemoryAdmission(budget_bytes=100, holders={})
+    admission.acquire(60)
+    assert admission.holders == {os.getpid(): 60}
+    assert admission.release_process(os.getpid()) == 60
+    assert admission.try_acquire(100)
+    admission.release(100)
+    assert admission.holders == {}
+
+
+def test_work_queue_is_largest_first_with_sentinels():
+    sizes = {Path("a.tif"): (100, 100), Path("b.tif"): (300, 300), Path("c.tif"): (200, 200)}
+    ordered = order_largest_first(list(sizes), sizes)
+    assert ordered == [Path("b.tif"), Path("c.tif"), Path("a.tif")]
+
+    work_queue = queue.Queue()
+    fill_work_queue(work_queue, ordered, consumers=2)
+    items = [work_queue.get_nowait() for _ in range(5)]
+    assert items == ordered + [None, None]
+
+
+if __name__ == "__main__":
+    test_small_image_runs_whole()
+    test_giant_image_falls_back_to_strips()
+    test_admission_blocks_until_release()
+    test_oversized_job_admitted_when_idle()
+    test_dead_process_memory_is_released()
+    test_work_queue_is_largest_first_with_sentinels()
+    print("✅ Test scheduler superati.")
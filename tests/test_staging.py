@@ -0,0 +1,139 @@
+import sys
+import time
+import tempfile
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.staging import Prefetcher, StagingCache, staged_input_path, _pending_marker
+
+
+def test_prefetch_stays_within_window():
+    with tempfile.TemporaryDirectory() as tmp:
+        share = Path(tmp) / "share" / "B001.001"
+        share.mkdir(parents=True)
+        images = []
+        for i in range(6):
+            path = share / f"{i:03d}.tif"
+            path.write_bytes(bytes([i]) * 1000)
+            images.append(path)
+
+        stage_dir = Path(tmp) / "staging"
+        prefetcher = Prefetcher(stage_dir, window=2)
+        cache = StagingCache(stage_dir)
+        prefetcher.start(images)
+
+        for image in images:
+            local = cache.local_input(image)
+            assert local == staged_input_path(stage_dir, image)
+            assert local.name == image.name
+            assert local.read_bytes() == image.read_bytes()
+            time.sleep(0.02)
+            cache.release_input(image)
+
+        prefetcher.stop()
+        cache.close()
+        assert prefetcher.stats()["files"] == 6
+        assert prefetcher.max_depth <= 2
+        assert cache.stats()["staged_reads"] == 6
+        # Senza prefetch l'immagine viene letta direttamente dalla share
+        assert cache.local_input(images[0]) == images[0]
+
+
+def test_upload_is_atomic_and_removes_local_copy():
+    with tempfile.TemporaryDirectory() as tmp:
+        destination_dir = Path(tmp) / "share" / "downscaled_x2" / "B001.001"
+        cache = StagingCache(Path(tmp) / "staging", upload_workers=2, max_pending=1)
+
+        local_dir = cache.local_output_dir(destination_dir)
+        local_dir.mkdir(parents=True)
+        for i in range(3):
+            local = local_dir / f"{i:03d}.tif"
+            local.write_bytes(b"x" * 2048)
+            cache.upload(local, destination_dir / local.name)
+        cache.flush()
+
+        assert sorted(p.name for p in destination_dir.iterdir()) == ["000.tif", "001.tif", "002.tif"]
+        assert not list(local_dir.iterdir())
+        stats = cache.stats()
+        assert stats["files"] == 3 and stats["failed"] == 0
+        assert stats["pending"] == 0 and stats["max_pending"] == 1
+        cache.close()
+
+
+def test_failed_upload_is_reported_to_the_caller():
+    with tempfile.TemporaryDirectory() as tmp:
+        # La destinazione è sotto un file: la copia fallisce a ogni tentativo
+        blocker = Path(tmp) / "share"
+        blocker.write_bytes(b"")
+        cache = StagingCache(Path(tmp) / "staging", retries=1)
+
+        local = cache.local_output_dir(blocker) / "000.tif"
+        local.parent.mkdir(parents=True)
+        local.write_bytes(b"x" * 16)
+        future = cache.upload(local, blocker / "B001.001" / "000.tif")
+
+        assert isinstance(future.exception(), OSError)
+        assert local.exists()  # copia locale conservata
+        cache.flush()
+        assert cache.stats()["failed"] == 1
+        cache.close()
+
+
+def test_input_wait_has_a_deadline():
+    with tempfile.TemporaryDirectory() as tmp:
+        image = Path(tmp) / "share" / "000.tif"
+        image.parent.mkdir()
+        image.write_bytes(b"x")
+        stage_dir = Path(tmp) / "staging"
+        # Marker senza prefetcher attivo (es. thread caduto): nessuna copia arriverà
+        marker = _pending_marker(staged_input_path(stage_dir, image))
+        marker.parent.mkdir(parents=True)
+        marker.touch()
+
+        cache = StagingCache(stage_dir, input_wait_s=0.1)
+        assert cache.local_input(image) == image
+        assert not marker.exists()  # una copia tardiva verrà scartata
+        assert cache.stats()["input_timeouts"] == 1
+        cache.close()
+
+
+def test_released_images_free_the_window():
+    with tempfile.TemporaryDirectory() as tmp:
+        share = Path(tmp) / "share"
+        share.mkdir()
+        images = []
+        for i in range(3):
+            path = share / f"{i:03d}.tif"
+            path.write_bytes(bytes([i]) * 100)
+            images.append(path)
+
+        stage_dir = Path(tmp) / "staging"
+        prefetcher = Prefetcher(stage_dir, window=1)
+        cache = StagingCache(stage_dir, input_wait_s=5)
+        prefetcher.start(images)
+
+        first = staged_input_path(stage_dir, images[0])
+        deadline = time.monotonic() + 5
+        while not first.exists():
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        # Il worker che la elaborava è caduto: nessuno la rilascerà
+        prefetcher.release([images[0]])
+
+        for image in images[1:]:
+            assert cache.local_input(image) == staged_input_path(stage_dir, image)
+            cache.release_input(image)
+        prefetcher.stop()
+        cache.close()
+        assert prefetcher.stats()["files"] == 3
+
+
+if __name__ == "__main__":
+    test_prefetch_stays_within_window()
+    test_upload_is_atomic_and_removes_local_copy()
+    test_failed_upload_is_reported_to_the_caller()
+    test_input_wait_has_a_deadline()
+    test_released_images_free_the_window()
+    print("✅ Tutti i test sullo staging superati")
@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+import tempfile
+from functools import partial
+from pathlib import Path
+from queue import Empty
+from multiprocessing import Manager
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.supervisor import WorkerSupervisor
+from src.retry import Quarantine
+
+
+def _fake_worker(inbox, control, crash_on=None):
+    # Processo worker simulato: un thread, nessun modello; `crash_on` fa cadere il processo
+    counts = {"ok": 0}
+    while not control.should_stop():
+        try:
+            image_path = inbox.get(timeout=0.1)
+        except Empty:
+            continue
+        if image_path is None:
+            break
+        control.started(image_path)
+        if image_path.name == crash_on:
+            os._exit(3)
+        time.sleep(0.01)
+        counts["ok"] += 1
+        control.done(image_path, "ok")
+    control.exit(counts)
+
+
+def _run(supervisor: WorkerSupervisor, images: list[Path], timeout: float = 60) -> dict[Path, str]:
+    statuses = {}
+    supervisor.submit(images)
+    supervisor.start()
+    deadline = time.monotonic() + timeout
+    while supervisor.busy():
+        assert time.monotonic() < deadline, "supervisore bloccato"
+        for image_path, status in supervisor.poll(timeout=0.5):
+            assert image_path not in statuses  # nessuna immagine completata due volte
+            statuses[image_path] = status
+    supervisor.stop()
+    return statuses
+
+
+def test_crashing_image_is_requeued_then_quarantined():
+    with tempfile.TemporaryDirectory() as tmp, Manager() as manager:
+        images = [Path(tmp) / f"{i:03d}.tif" for i in range(8)]
+        for image in images:
+            image.write_bytes(b"x")
+        quarantine = Quarantine(Path(tmp) / "run_state.sqlite")
+
+        supervisor = WorkerSupervisor(partial(_fake_worker, crash_on="003.tif"), processes=2, threads=1,
+                                      manager=manager, quarantine=quarantine, max_images=None, max_crashes=2)
+        statuses = _run(supervisor, images)
+
+        assert len(statuses) == len(images)
+        assert statuses.pop(images[3]) == "failed"
+        assert set(statuses.values()) == {"ok"}
+        # Il processo è caduto due volte sulla stessa immagine: le altre non sono andate perse
+        assert supervisor.stats["restarts"] == 2
+        assert supervisor.stats["lost"] == 1
+        # Contatori solo dai processi usciti in modo pulito: gli esiti arrivano dai messaggi
+        assert len(supervisor.results) == 2
+
+        entries = quarantine.entries()
+        assert list(entries) == [str(images[3])]
+        assert entries[str(images[3])]["step"] == "process"
+        quarantine.close()
+
+
+def test_workers_are_recycled_after_max_images():
+    with tempfile.TemporaryDirectory() as tmp, Manager() as manager:
+        images = [Path(tmp) / f"{i:03d}.tif" for i in range(7)]
+
+        supervisor = WorkerSupervisor(_fake_worker, processes=1, threads=2, manager=manager, max_images=3)
+        statuses = _run(supervisor, images)
+
+        assert set(statuses) == set(images) and set(statuses.values()) == {"ok"}
+        assert supervisor.stats["restarts"] == 0
+        assert supervisor.stats["recycles"] == 2
+        # Un processo per ogni riciclo più l'ultimo, fermato con le sentinelle
+        assert len(supervisor.results) == 3
+        assert sum(c["ok"] for c in supervisor.results) == len(images)
+
+
+if __name__ == "__main__":
+    test_crashing_image_is_requeued_then_quarantined()
+    test_workers_are_recycled_after_max_images()
+    print("✅ Tutti i test sul supervisore dei worker superati")
@@ -0,0 +1,86 @@
+import sys
+import struct
+import tempfile
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.tiff_metadata import read_tiff_metadata
+
+
+def _write_tiff(path: Path, byte_order: str, width: int, height: int, resolution, unit: int = 2,
+                software: str = "Adobe Photoshop 24.7 (Windows)"):
+    # Header, IFD con valori in linea o dopo l'IFD, niente pixel: al lettore non servono
+    order = "<" if byte_order == "II" else ">"
+    entries = []
+    extra = b""
+    extra_offset = 8 + 2 + 7 * 12 + 4
+
+    def add(tag, type_id, count, value: bytes):
+        nonlocal extra
+        if len(value) <= 4:
+            entries.append(struct.pack(order + "HHI", tag, type_id, count) + value.ljust(4, b"\0"))
+        else:
+            offset = extra_offset + len(extra)
+            entries.append(struct.pack(order + "HHII", tag, type_id, count, offset))
+            extra += value
+
+    add(256, 4, 1, struct.pack(order + "I", width))
+    add(257, 3, 1, struct.pack(order + "H", height))
+    add(258, 3, 3, struct.pack(order + "HHH", 8, 8, 8))
+    add(282, 5, 1, struct.pack(order + "II", resolution[0], 1))
+    add(283, 5, 1, struct.pack(order + "II", resolution[1], 1))
+    add(296, 3, 1, struct.pack(order + "H", unit))
+    add(305, 2, len(software) + 1, software.encode() + b"\0")
+
+    data = byte_order.encode() + struct.pack(order + "HI", 42, 8)
+    data += struct.pack(order + "H", len(entries)) + b"".join(entries) + struct.pack(order + "I", 0) + extra
+    path.write_bytes(data)
+
+
+def test_reads_size_and_resolution_in_both_byte_orders():
+    with tempfile.TemporaryDirectory() as tmp:
+        for byte_order in ("II", "MM"):
+            path = Path(tmp) / f"scan_{byte_order}.tif"
+            _write_tiff(path, byte_order, 3612, 5237, (400, 400))
+            meta = read_tiff_metadata(path)
+            assert (meta.width, meta.height) == (3612, 5237)
+            assert meta.tags["bits_per_sample"] == (8, 8, 8)
+            assert meta.tags["software"] == "Adobe Photoshop 24.7 (Windows)"
+            assert meta.resolution_unit == "inch"
+            assert meta.ppi == 400
+
+
+def test_centimetres_and_anisotropic_resolution():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "cm.tif"
+        _write_tiff(path, "II", 100, 100, (236, 236), unit=3)
+        assert round(read_tiff_metadata(path).ppi) == 599
+
+        path = Path(tmp) / "aniso.tif"
+        _write_tiff(path, "II", 100, 100, (400, 600))
+        assert read_tiff_metadata(path).ppi is None
+
+        path = Path(tmp) / "unitless.tif"
+        _write_tiff(path, "II", 100, 100, (400, 400), unit=1)
+        assert read_tiff_metadata(path).ppi is None
+
+
+def test_rejects_non_tiff():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "image.jpg"
+        path.write_bytes(b"\xff\xd8\xff\xe0" + b"\0" * 32)
+        try:
+            read_tiff_metadata(path)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Un JPEG non deve essere letto come TIFF")
+
+
+if __name__ == "__main__":
+    test_reads_size_and_resolution_in_both_byte_orders()
+    test_centimetres_and_anisotropic_resolution()
+    test_rejects_non_tiff()
+    print("✅ Tutti i test sui metadati TIFF superati")
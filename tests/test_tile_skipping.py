@@ -0,0 +1,96 @@
+import sys
+import threading
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+import torch
+import torch.nn.functional as F
+
+from model.SR_Script.super_resolution import SA_SuperResolution
+
+SCALE = 2
+
+
+class _FakeInference:
+    """
+    Stand-in for the ONNX session: nearest-neighbour upscale, counting the calls.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, tile: torch.Tensor) -> torch.Tensor:
+        self.calls += 1
+        return tile.repeat_interleave(SCALE, dim=2).repeat_interleave(SCALE, dim=3)
+
+
+def _model(blank_tile_variance=None, tile_memo=False) -> tuple[SA_SuperResolution, _FakeInference]:
+    # Senza __init__: nessun modello da decifrare, solo gli attributi usati da _infer_tiles
+    model = SA_SuperResolution.__new__(SA_SuperResolution)
+    model.scale = SCALE
+    model.blank_tile_variance = blank_tile_variance
+    model.tile_memo = tile_memo
+    model.lock = threading.Lock()
+    model.span_hook = None
+    model.trace_tiles = False
+    model._inference = _FakeInference()
+    return model, model._inference
+
+
+def _tiles() -> list[torch.Tensor]:
+    generator = torch.Generator().manual_seed(0)
+    textured = [torch.rand(1, 3, 8, 8, generator=generator) for _ in range(3)]
+    blank = torch.full((1, 3, 8, 8), 0.5)
+    # Uniforme ma colorato (carta beige): alta varianza tra i canali, nessuna dentro un canale
+    colored = torch.tensor([0.9, 0.8, 0.6]).view(1, 3, 1, 1).expand(1, 3, 8, 8).contiguous()
+    return [textured[0], blank, textured[1], textured[0].clone(), textured[2], colored]
+
+
+def test_blank_tiles_skip_the_model():
+    model, inference = _model(blank_tile_variance=1e-4)
+    tiles = _tiles()
+    outputs, stats = model._infer_tiles(tiles)
+
+    assert inference.calls == 4
+    assert stats["tiles_inferred"] == 4 and stats["tiles_skipped_blank"] == 2
+    for i in (1, 5):
+        expected = F.interpolate(tiles[i], scale_factor=SCALE, mode="bicubic", align_corners=False).clamp(0.0, 1.0)
+        assert torch.equal(outputs[i], expected)
+        assert outputs[i].shape == (1, 3, 8 * SCALE, 8 * SCALE)
+
+
+def test_identical_tiles_reuse_the_first_output():
+    model, inference = _model(tile_memo=True)
+    tiles = _tiles()
+    outputs, stats = model._infer_tiles(tiles)
+
+    assert inference.calls == 5
+    assert stats["tiles_memo_hits"] == 1
+    assert outputs[3] is outputs[0]
+    assert stats["skipped_fraction"] == 1 / len(tiles)
+
+
+def test_output_unchanged_with_options_off():
+    tiles = _tiles()
+    reference = _FakeInference()
+    expected = [reference(tile) for tile in tiles]
+
+    model, inference = _model()
+    outputs, stats = model._infer_tiles(tiles)
+    assert inference.calls == len(tiles)
+    assert stats == {"tiles_inferred": len(tiles)}
+    assert all(torch.equal(out, exp) for out, exp in zip(outputs, expected))
+
+    # Con le opzioni attive i tile non saltati ricevono lo stesso output del modello
+    model, _ = _model(blank_tile_variance=1e-4, tile_memo=True)
+    outputs, _ = model._infer_tiles(tiles)
+    assert all(torch.equal(outputs[i], expected[i]) for i in (0, 2, 3, 4))
+
+
+if __name__ == "__main__":
+    test_blank_tiles_skip_the_model()
+    test_identical_tiles_reuse_the_first_output()
+    test_output_unchanged_with_options_off()
+    print("✅ Test sul salto dei tile superati.")
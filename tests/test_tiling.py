@@ -0,0 +1,101 @@
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+import numpy as np
+import torch
+
+from model.SR_Script.tiling_image_loader import SA_Tiling_ImageLoader, legacy_tile_plan, plan_tiles
+
+TILE = 32
+SCALE = 2
+
+
+def _check_axis(starts: list[int], length: int, overlap: int):
+    # Copertura senza buchi: primo tile sul bordo, ultimo fino alla fine, vicini sovrapposti di almeno `overlap`
+    assert starts[0] == 0
+    assert starts[-1] + TILE >= length
+    assert all(0 <= start <= max(length - TILE, 0) for start in starts)
+    for previous, start in zip(starts, starts[1:]):
+        assert previous < start
+        assert previous + TILE - start >= overlap
+
+
+def test_plan_covers_image_with_minimum_overlap():
+    # Uguale al tile, multipla e non multipla del passo
+    for length in (TILE, 40, 2 * TILE, 100, 129, 333, 1000):
+        for overlap in (0, 1, 4, 7, 16, TILE - 1):
+            plan = plan_tiles(length, length + 17, TILE, overlap)
+            _check_axis(plan.starts_h, length, overlap)
+            _check_axis(plan.starts_w, length + 17, overlap)
+            assert plan.num_tiles == len(plan.origins())
+            assert plan.redundant_pixel_ratio >= 0.0
+
+
+def test_image_smaller_than_tile_is_one_padded_tile():
+    loader = SA_Tiling_ImageLoader(TILE, overlap=8)
+    image = np.random.default_rng(0).integers(0, 256, (20, 25, 3), dtype=np.uint8)
+    tiles, original_shape, padded_shape = loader.load_image(image)
+    assert original_shape == (20, 25) and padded_shape == (TILE, TILE)
+    assert len(tiles) == 1 and tiles[0].shape == (1, 3, TILE, TILE)
+    assert loader.tile_plan(*padded_shape).origins() == [(0, 0)]
+    assert plan_tiles(TILE, TILE, TILE, 8).redundant_pixel_ratio == 0.0
+
+
+def test_overlap_out_of_range_is_rejected():
+    for overlap in (-1, TILE):
+        try:
+            plan_tiles(100, 100, TILE, overlap)
+        except ValueError:
+            continue
+        raise AssertionError(f"overlap {overlap} accettato")
+
+
+def test_legacy_plan_matches_reference_tiling():
+    loader = SA_Tiling_ImageLoader(TILE)
+    image = np.random.default_rng(0).random((3, 70, 101), dtype=np.float32)
+    tiles = loader.split_to_tiles_with_overlap(image)
+    plan = legacy_tile_plan(70, 101, TILE)
+    crops = [image[:, h:h + TILE, w:w + TILE] for h, w in plan.origins()]
+    assert len(tiles) == len(crops)
+    assert all(np.array_equal(tile, crop) for tile, crop in zip(tiles, crops))
+
+
+def test_plan_reconstruction_matches_reference_blending():
+    # Tile ritagliati da un'unica immagine ingrandita: ogni fusione normalizzata la ricostruisce
+    height, width = 70, 101
+    upscaled = torch.rand(3, height * SCALE, width * SCALE, generator=torch.Generator().manual_seed(0))
+    loader = SA_Tiling_ImageLoader(TILE)
+    plan = legacy_tile_plan(height, width, TILE)
+    size = TILE * SCALE
+    tiles = [upscaled[None, :, h * SCALE:h * SCALE + size, w * SCALE:w * SCALE + size] for h, w in plan.origins()]
+
+    reference = loader.reconstruct_image_from_tiles_with_blending(tiles, (height, width), SCALE)
+    planned = loader.reconstruct_image_from_plan(tiles, plan, SCALE)
+    assert planned.shape == reference.shape == upscaled.shape
+    assert torch.allclose(planned, reference, atol=1e-5)
+    assert torch.allclose(planned, upscaled, atol=1e-5)
+
+
+def test_planned_tiling_reconstructs_the_image():
+    height, width = 90, 77
+    upscaled = torch.rand(3, height * SCALE, width * SCALE, generator=torch.Generator().manual_seed(1))
+    loader = SA_Tiling_ImageLoader(TILE, overlap=6)
+    plan = loader.tile_plan(height, width)
+    size = TILE * SCALE
+    tiles = [upscaled[None, :, h * SCALE:h * SCALE + size, w * SCALE:w * SCALE + size] for h, w in plan.origins()]
+
+    planned = loader.reconstruct_image_from_plan(tiles, plan, SCALE)
+    assert torch.allclose(planned, upscaled, atol=1e-5)
+
+
+if __name__ == "__main__":
+    test_plan_covers_image_with_minimum_overlap()
+    test_image_smaller_than_tile_is_one_padded_tile()
+    test_overlap_out_of_range_is_rejected()
+    test_legacy_plan_matches_reference_tiling()
+    test_plan_reconstruction_matches_reference_blending()
+    test_planned_tiling_reconstructs_the_image()
+    print("✅ Tutti i test sulla suddivisione in tile superati")
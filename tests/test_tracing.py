@@ -0,0 +1,42 @@
+import sys
+import json
+import threading
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src import tracing
+
+
+def test_disabled_span_is_shared_noop():
+    assert not tracing.is_enabled()
+    assert tracing.span("decode") is tracing.span("resize")
+
+
+def test_spans_are_merged_into_trace_events(tmp_path):
+    tracer = tracing.Tracer(tmp_path / "run")
+    with tracing._Span(tracer, "image", {"image": "0001.tif"}):
+        worker = threading.Thread(target=lambda: tracing._Span(tracer, "inference", {}).__enter__().__exit__(None, None, None))
+        worker.start()
+        worker.join()
+    tracer.flush()
+
+    merged = tracing.merge_traces(tmp_path / "run", tmp_path / "merged.json")
+    with open(merged, "r", encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+
+    spans = {e["name"]: e for e in events if e["ph"] == "X"}
+    assert set(spans) == {"image", "inference"}
+    assert spans["image"]["args"] == {"image": "0001.tif"}
+    assert spans["image"]["dur"] >= spans["inference"]["dur"]
+    assert spans["image"]["tid"] != spans["inference"]["tid"]
+    assert any(e["ph"] == "M" and e["name"] == "thread_name" for e in events)
+
+
+if __name__ == "__main__":
+    import tempfile
+    test_disabled_span_is_shared_noop()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_spans_are_merged_into_trace_events(Path(tmp))
+    print("✅ Test tracing superati.")
@@ -0,0 +1,69 @@
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.watcher import FolderWatcher
+
+
+def test_folder_reported_once_after_settling():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        folder = root / "B001.001"
+        folder.mkdir()
+        (folder / "001.tif").write_bytes(b"x" * 100)
+
+        watcher = FolderWatcher(root, settle=30, use_events=False)
+        assert watcher.poll(now=0) == []
+        assert watcher.poll(now=10) == []
+
+        # Copia ancora in corso: il conteggio riparte
+        (folder / "002.tif").write_bytes(b"x" * 50)
+        assert watcher.poll(now=20) == []
+        assert watcher.poll(now=45) == []
+        assert watcher.poll(now=50) == [folder]
+        assert watcher.poll(now=100) == []
+
+
+def test_new_files_report_folder_again():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        folder = root / "B002.001"
+        folder.mkdir()
+        (folder / "001.tif").write_bytes(b"x")
+        (root / "empty").mkdir()
+
+        watcher = FolderWatcher(root, settle=5, use_events=False)
+        watcher.poll(now=0)
+        assert watcher.poll(now=5) == [folder]
+
+        (folder / "002.tif").write_bytes(b"x")
+        assert watcher.poll(now=6) == []
+        assert watcher.poll(now=11) == [folder]
+
+
+def test_rescan_only_when_due():
+    with tempfile.TemporaryDirectory() as tmp:
+        watcher = FolderWatcher(Path(tmp), settle=5, poll_interval=10, use_events=False)
+        assert watcher.due(now=0)
+        watcher.poll(now=0)
+        # Tra due scansioni il ciclo raccoglie gli esiti senza rileggere la share
+        assert not watcher.due(now=1)
+        assert not watcher.due(now=9.5)
+        assert watcher.due(now=10)
+
+        # Un evento del file system anticipa la scansione, al massimo una al secondo
+        watcher._wake.set()
+        assert not watcher.due(now=0.5)
+        assert watcher.due(now=1)
+        watcher.poll(now=1)
+        assert not watcher.due(now=2)
+
+
+if __name__ == "__main__":
+    test_folder_reported_once_after_settling()
+    test_new_files_report_folder_again()
+    test_rescan_only_when_due()
+    print("✅ Tutti i test sul watcher superati")